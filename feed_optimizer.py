@@ -1,6 +1,19 @@
 '''
 @author: mlarocca
 '''
+from bisect import bisect_right
+try:
+    import numpy as np
+except ImportError:
+    #The dynamic programming engine is not available: branch-and-bound is always used
+    np = None
+
+#Largest table (stories x page height) for which the dynamic programming engine is used
+DP_MAX_CELLS = 1 << 24
+#Up to this number of undecided stories (see undecided_stories), branch-and-bound is fast enough
+BB_MAX_UNDECIDED = 32
+#Up to this number of capacities, the moves of a story in WindowKnapsack are checked one at a time, without NumPy
+WINDOW_SCALAR_MOVES = 16
 
 ''' For convenience, gather all the parameters of a story and make them identifiable
     with a name rather than its position. Being a convenience wrapper, parameters are
@@ -27,13 +40,24 @@ class Story():
         self._id = Story.__counter
         
 
-''' Returns the list of the ids of the stories corresponding to ones in the mask; 
-    @param mask: A binary mask corresponding to a subset of the stories:
-    @return: The corresponding list of ids.
+''' Returns the list of the ids of the stories in a solution.
+    @param mask: A solution, as an integer with the bit of index story._id set for each story in it;
+    @return: The corresponding list of ids, sorted.
 '''
-def get_subset_ids(stories_set, mask, n):
-    return [stories_set[i]._id for i in xrange(n) if mask[i]]
+def get_subset_ids(mask):
+    ids = []
+    while mask:
+        lowest = mask & -mask
+        ids.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return ids
 
+''' Returns the number of stories in a solution.
+    @param mask: A solution, as an integer with the bit of index story._id set for each story in it;
+    @return: The number of bits set.
+'''
+def count_stories(mask):
+    return bin(mask).count('1')
 
 ''' Compares two solutions according to the specifications;
     solution_1 is better than solution_2 iff
@@ -41,13 +65,15 @@ def get_subset_ids(stories_set, mask, n):
     2) Has the same score, but with fewer stories,
     3) Has the same score and the same number of stories, but the set of
         stories IDs of solution_1 comes lexicographically before solution_2's.
+    Solutions are integers with the bit of index story._id set for each story in them (see get_subset_ids): for
+    sets of the same size, the smallest id in only one of them decides the comparison, and it is the lowest bit set
+    in their xor.
     @param solution_1, solution_2: The two solutions to compare;
     @return:    -1 <=> solution_1 is a better solution than solution_2, or it is equal to solution_2
                 1 <=> vice versa.
 '''
-def compareSolutions(stories_set,
-                       solution_1_score, solution_1_size, solution_1_mask,
-                       solution_2_score, solution_2_size, solution_2_mask):
+def compareSolutions(solution_1_score, solution_1_size, solution_1_mask,
+                     solution_2_score, solution_2_size, solution_2_mask):
     
     #INVARIANT: all solutions tested are valid
     if solution_1_score > solution_2_score:
@@ -60,18 +86,48 @@ def compareSolutions(stories_set,
         elif solution_1_size > solution_2_size:
             return 1
         else:
-            n = len(solution_1_mask)
-            stories_ids_1 = sorted(get_subset_ids(stories_set, solution_1_mask, n))
-            stories_ids_2 = sorted(get_subset_ids(stories_set, solution_2_mask, n))
-            if stories_ids_1 <= stories_ids_2:
+            difference = solution_1_mask ^ solution_2_mask
+            if difference == 0 or solution_1_mask & difference & -difference:
                 return -1
             else:
                 return 1
-     
 
+''' Computes the prefix sums of the heights and the scores of a list of stories.
+    @param stories_set:    The stories;
+    @return: (prefix_heights, prefix_scores)
+             The lists of the N + 1 sums of the heights and scores of the first k stories, for k from 0 to N.
+'''
+def prefix_sums(stories_set):
+    prefix_heights = [0]
+    prefix_scores = [0]
+    for story in stories_set:
+        prefix_heights.append(prefix_heights[-1] + story._height)
+        prefix_scores.append(prefix_scores[-1] + story._score)
+    return prefix_heights, prefix_scores
 
-        
-                
+''' Updates the prefix sums of a list of stories after a story has been inserted in it, in O(N).
+    @param prefix_heights, prefix_scores:    The prefix sums (see prefix_sums), updated in place;
+    @param i:    The position of the new story in the list;
+    @param story:    The new story.
+'''
+def prefix_sums_insert(prefix_heights, prefix_scores, i, story):
+    prefix_heights.insert(i + 1, prefix_heights[i])
+    prefix_scores.insert(i + 1, prefix_scores[i])
+    for k in xrange(i + 1, len(prefix_heights)):
+        prefix_heights[k] += story._height
+        prefix_scores[k] += story._score
+
+''' Updates the prefix sums of a list of stories after a story has been removed from it, in O(N).
+    @param prefix_heights, prefix_scores:    The prefix sums (see prefix_sums), updated in place;
+    @param i:    The position the story had in the list;
+    @param story:    The story removed.
+'''
+def prefix_sums_remove(prefix_heights, prefix_scores, i, story):
+    del prefix_heights[i + 1]
+    del prefix_scores[i + 1]
+    for k in xrange(i + 1, len(prefix_heights)):
+        prefix_heights[k] -= story._height
+        prefix_scores[k] -= story._score
 
 ''' Performs, iteratively, the Horowitz-Sahni algorithms for 0-1 KP problem.
     INVARIANT: the elements to put in the knapsack must be ordered according
@@ -86,89 +142,36 @@ def compareSolutions(stories_set,
     in the subset bit mask (if it exists), and removing the corresponding
     element from the knapsack.
     
+    Solutions are integers with the bit of index story._id set for each story in them (see compareSolutions),
+    updated one story, or one forward move, at a time.
+    
     @param mask:    A bit mask that keeps track of the elements added to the
-                    solution so far;
+                    solution so far (the bit of index k for the k-th story);
+    @param solution:    The same elements, as a solution;
     @param size:    The number of elements added to the knapsack so far;
     @param score:   Total score for the current solution;
     @param height:    Total height for the curent solution;
     @param pos:    The index of the new element to examine;
+    @param stories_prefix_sums:    The prefix sums of the stories (see prefix_sums), if already available: forward
+                                   moves jump to the critical story, and upper bounds take O(log N) (see prefix_sums).
 '''
-def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, best_solution_score, best_solution_height):
+def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, best_solution_score, best_solution_height,
+                   stories_prefix_sums=None):
     
     if N == 0:
-        return 0, 0, []
+        return 0, 0, 0
 
-    
+    if stories_prefix_sums is None:
+        stories_prefix_sums = prefix_sums(stories_set)
+    (prefix_heights, prefix_scores) = stories_prefix_sums
+    #The bits of the stories in the solutions, and the solutions made of the first k stories
+    bits = [1 << story._id for story in stories_set]
+    prefix_bits = [0]
+    for bit in bits:
+        prefix_bits.append(prefix_bits[-1] | bit)
 
-#    critical_height = stories_set[0]._height
-#    critical_score = stories_set[0]._score
-#    s = 1
-#    while  s < N  and critical_height <= c:
-#        critical_height += stories_set[s]._height
-#        critical_score += stories_set[s]._score
-#        s += 1
-#    s -= 1
-    
-#    if s == N:
-#        return critical_score, critical_height, [1] * N
-#    elif s == N - 1:
-#        scaled_score = 0
-#    else:
-#        scaled_score = stories_set[s+1]._scaled_score        
- 
-#    story = stories_set[s]
-#    c_bar = critical_height - story._height
-#    critical_score - story._score   
-    
-#    sigma_0 = 0
-#    sigma_1 = 0
-    
-#    sigma_0_height = 0
-#    sigma_0_score = 0
-#    sigma_1_height = story._height
-#    sigma_1_score = story._score
-    
-#    while sigma_0 < N:
-#        if sigma_1_height <= c:
-#            story = stories_set[sigma_1]
-#            sigma_1 += 1
-#            sigma_0 = sigma_1
-#            sigma_1_height += story._height
-#            if sigma_0 != s:
-#                sigma_0_height += story._height
-#                sigma_0_score += story._score
-#            
-#        elif sigma_0_height < c:
-#            if sigma_0 != s:
-#                story = stories_set[sigma_1]
-#                sigma_0_height += story._height
-#                sigma_0_score += story._score
-#            sigma_0 += 1
-#        else:
-#            break
-#    if sigma_1 < N:
-#        story_1 = stories_set[sigma_1]
-#        sigma_1_height -= story_1._height
-#        sigma_1_score -= story_1._score
-    
-#        U_bar_1 = sigma_1_score + (c-sigma_1_height) * story_1._scaled_score
-#    else:
-#        U_bar_1 = sigma_1_score
-        
-#    if sigma_0 < N:
-#        story_0 = stories_set[sigma_0]
-#        sigma_0_height -= story_0._height
-#        sigma_0_score -= story_0._score
-#        U_bar_0 = sigma_0_score + (c-sigma_0_height) * story_0._scaled_score
-#    else:
-#        U_bar_0 = sigma_0_score
-    
-#    U = max(U_bar_0, U_bar_1)
-#    U = critical_score + max((int)(c_bar * scaled_score ),
-#                             (int)(story._score - (story._height - c_bar) * stories_set[s-1]._scaled_score))
- 
-        
-    mask = [0] * N
+    mask = 0
+    solution = 0
     
     score = 0
     height = 0
@@ -178,25 +181,22 @@ def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, be
     while True:
         while j < N:
             
-            #Tries a forward move        
-            pos = j
-            
             initial_score = score
             initial_heigh = height
             initial_size = size
+            initial_solution = solution
             
-            while pos < N:
-                story = stories_set[pos]
-                
-                #First tries a forward move, if possible
-                if story._height > c - height:
-                    break
-                else:
-                    size += 1
-                    mask[pos] = 1
-                    score += story._score
-                    height += story._height
-                    pos += 1
+            #Tries a forward move, jumping to the critical story (the first one that doesn't fit): it is looked for with
+            #a binary search on the prefix sums of the heights, unless it is the first one (most often, deep in the search)
+            limit = prefix_heights[j] + c - height
+            pos = j
+            if prefix_heights[j + 1] <= limit:
+                pos = bisect_right(prefix_heights, limit, j + 1, N + 1) - 1
+                mask |= (1 << pos) - (1 << j)
+                solution |= prefix_bits[pos] ^ prefix_bits[j]
+                size += pos - j
+                score += prefix_scores[pos] - prefix_scores[j]
+                height += prefix_heights[pos] - prefix_heights[j]
 
             try:
                 #Estimates Dantzig's upper bound
@@ -215,55 +215,39 @@ def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, be
                 #so it performs backtracking
 
                 #Brings the situation back at before the forward move
-                #k = j
-                #while k < pos:
-                for k in xrange(j,N):
-                    mask[k] = 0
-                    #k += 1
+                mask &= (1 << j) - 1
+                solution = initial_solution
                 
                 score = initial_score 
                 height = initial_heigh
                 size = initial_size
 
-                #Looks for a possible backtracking move
-                pos = j - 1
+                pos = j
                 while True:
-                    try:
-                        while mask[pos] == 0:
-                            pos -= 1
-                    except IndexError:
-                        #if pos < 0:
+                    #Looks for a possible backtracking move: the last story in the knapsack before pos
+                    pos = (mask & ((1 << pos) - 1)).bit_length() - 1
+                    if pos < 0:
                         #No more backtracking possible
                         return best_solution_score, best_solution_height, best_solution_mask
                     else:
                         #Exclude the element from the knapsack
-                        mask[pos] = 0
+                        mask ^= 1 << pos
+                        solution ^= bits[pos]
                         size -= 1
                         story = stories_set[pos]
                         score -= story._score
                         height -= story._height
                         j = pos + 1
 
-                        #i = j
-                        bound_height = height
-                        score_bound = 0
-                        #while i < N:
-                        for i in xrange(j, N):
-                            story = stories_set[i]
-                            if story._height > c - bound_height:
-                                break
-                            
-                            score_bound += story._score
-                            bound_height += story._height
-                            #i += 1
-                        
-                        try:
-                            story = stories_set[i]
-                            score_bound += (int)(story._scaled_score * (c - bound_height))
-                        except IndexError:
-                            pass
-                            
-                        upper_bound = score + score_bound
+                        #Estimates Dantzig's upper bound: adds the stories before the critical one, and the fraction
+                        #of the critical one that fits
+                        limit = prefix_heights[j] + c - height
+                        i = j
+                        if i < N and prefix_heights[i + 1] <= limit:
+                            i = bisect_right(prefix_heights, limit, i + 1, N + 1) - 1
+                        upper_bound = score + prefix_scores[i] - prefix_scores[j]
+                        if i < N:
+                            upper_bound += (int)(stories_set[i]._scaled_score * (limit - prefix_heights[i]))
                         
                         if best_solution_score <= upper_bound:
                             break               
@@ -279,12 +263,11 @@ def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, be
                 
         #INVARIANT: j == self.__N:
         #Completed one "depth first search" visit in the solution space tree.
-        if compareSolutions(stories_set,
-                            score, size, mask,
+        if compareSolutions(score, size, solution,
                             best_solution_score, best_solution_size, best_solution_mask
                             ) < 0:
             #Checks current solution
-            best_solution_mask = mask[:]
+            best_solution_mask = solution
             best_solution_size = size
             best_solution_height = height
             best_solution_score = score
@@ -292,30 +275,25 @@ def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, be
             if best_solution_size == N: #best_solution_score == U or 
                 return best_solution_score, best_solution_height, best_solution_mask
         
-        try:   
+        if mask >> (N - 1) & 1:
             story = stories_set[N-1] 
-            if mask[N-1] == 1:
-                mask[N-1] = 0
-                size -= 1               
-                score -= story._score
-                height -= story._height 
-            
-        except IndexError:
-            pass
+            mask ^= 1 << (N - 1)
+            solution ^= bits[N - 1]
+            size -= 1               
+            score -= story._score
+            height -= story._height 
         
         #Tries a backtracking move
-        pos = N - 2
+        pos = N - 1
         while True:
-            try:
-                while mask[pos] == 0:       #pos >= 0 and 
-                    pos -= 1
-            except IndexError:
-                #if pos < 0:
+            pos = (mask & ((1 << pos) - 1)).bit_length() - 1
+            if pos < 0:
                 #No more backtracking possible
                 return best_solution_score, best_solution_height, best_solution_mask
             else:
                 #Exclude the element from the knapsack
-                mask[pos] = 0
+                mask ^= 1 << pos
+                solution ^= bits[pos]
                 size -= 1
                 story = stories_set[pos]
                 score -= story._score
@@ -323,31 +301,486 @@ def horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, be
                 #score_bound -= story._score
                 j = pos + 1
                 
-                #i = j
-                bound_height = height
-                score_bound = 0
-                #while i < N:
-                for i in xrange(j, N):
-                    story = stories_set[i]
-                    if story._height > c - bound_height:
-                        break
-                    
-                    score_bound += story._score
-                    bound_height += story._height
-                    #i += 1
-                
-                try: #if i < N:
-                    story = stories_set[i]
-                    score_bound += (int)(story._scaled_score * (c - bound_height))
-                except IndexError:
-                    pass
-                    
-                upper_bound = score + score_bound
+                #Estimates Dantzig's upper bound: adds the stories before the critical one, and the fraction
+                #of the critical one that fits
+                limit = prefix_heights[j] + c - height
+                i = j
+                if i < N and prefix_heights[i + 1] <= limit:
+                    i = bisect_right(prefix_heights, limit, i + 1, N + 1) - 1
+                upper_bound = score + prefix_scores[i] - prefix_scores[j]
+                if i < N:
+                    upper_bound += (int)(stories_set[i]._scaled_score * (limit - prefix_heights[i]))
                 
                 if best_solution_score <= upper_bound:
                     break
           
         
+''' Solves the 0-1 KP problem exactly with dynamic programming over the page height, one vectorized row
+    update per story, so that the running time is O(N*c) whatever the stories (while branch-and-bound can take
+    exponential time when scores and heights are correlated).
+    The stories are processed by decreasing id, and the row holds, for every capacity, the best solution among the
+    stories processed so far; to apply the same tie-breaking as compareSolutions, the value of a story is
+    score * (N + 1) - 1, so that between solutions with the same score the one with fewer stories has the higher
+    value. For every story a bitset (one bit per capacity) records whether adding it gives the best solution
+    (ties included): rebuilding the solution from the story with the smallest id, and taking each story whenever
+    it can be taken, then yields the lexicographically smallest set of ids among the best solutions.
+    INVARIANT: numpy is available.
+    @param stories_set:    The stories, in any order;
+    @param N:    The number of stories;
+    @param c:    The capacity of the knapsack;
+    @return: (score, height, mask)
+             The best solution, with its mask as in compareSolutions.
+'''
+def dynamic_programming(stories_set, N, c):
+    order = sorted(xrange(N), key=lambda i: stories_set[i]._id)
+    M = N + 1
+
+    best = np.zeros(c + 1, dtype=np.int64)
+    takes = [None] * N
+    for k in xrange(N - 1, -1, -1):
+        story = stories_set[order[k]]
+        h = story._height
+        if h > c:
+            continue
+        candidate = best[:c + 1 - h] + (story._score * M - 1)
+        take = candidate >= best[h:]
+        np.maximum(best[h:], candidate, best[h:])
+        #take[j] refers to capacity j + h
+        takes[k] = np.packbits(take)
+
+    mask = 0
+    score = 0
+    height = 0
+    for k in xrange(N):
+        if takes[k] is None:
+            continue
+        story = stories_set[order[k]]
+        j = c - height - story._height
+        if j >= 0 and takes[k][j >> 3] & (0x80 >> (j & 7)):
+            mask |= 1 << story._id
+            score += story._score
+            height += story._height
+    return score, height, mask
+
+''' Counts the stories that the bound gap cannot decide: the gap between Dantzig's upper bound and the greedy solution
+    (which adds every story that fits, in ratio order) limits how far from the critical ratio a story of the best
+    solution can be, and only the stories within that distance (|score - critical ratio * height| <= gap) can be
+    the object of a choice. Branch-and-bound takes time exponential in their number.
+    INVARIANT: the stories must be ordered according to the ratio value/cost, from the highest to the lowest.
+    @param stories_set:    The stories;
+    @param N:    The number of stories;
+    @param c:    The capacity of the knapsack;
+    @return:    The number of undecided stories (0 if all the stories fit).
+'''
+def undecided_stories(stories_set, N, c):
+    score = 0
+    height = 0
+    critical = None
+    for i in xrange(N):
+        story = stories_set[i]
+        if story._height <= c - height:
+            score += story._score
+            height += story._height
+        elif critical is None:
+            critical = story
+            upper_bound = score + (int)(story._scaled_score * (c - height))
+    if critical is None:
+        return 0
+
+    gap = upper_bound - score
+    ratio = critical._scaled_score
+    return len([story for story in stories_set if abs(story._score - ratio * story._height) <= gap])
+
+''' Computes Martello and Toth's upper bound U2 for the 0-1 KP problem, possibly leaving one of the items out.
+    With s the critical item (the first one that doesn't fit when the items are added in order) and r the capacity
+    left by the ones before it, U2 is the largest between the bound with s left out (the capacity r filled with the
+    ratio of the item after s) and the one with s taken (the capacity it exceeds freed with the ratio of the item
+    before s); it is never larger than Dantzig's bound.
+    INVARIANT: the items must be ordered according to the ratio value/cost, from the highest to the lowest.
+    @param values, heights:    The values and heights of the items;
+    @param prefix_values, prefix_heights:    The N + 1 sums of the values and heights of the first k items;
+    @param n:    The number of items;
+    @param capacity:    The capacity of the knapsack;
+    @param skip:    The index of the item to leave out, or n to keep all of them;
+    @return:    The bound, rounded down (the values are integers), or -1 if capacity is negative.
+'''
+def u2_bound(values, heights, prefix_values, prefix_heights, n, capacity, skip):
+    if capacity < 0:
+        return -1
+
+    k = bisect_right(prefix_heights, capacity, 0, skip + 1) - 1
+    height = prefix_heights[k]
+    value = prefix_values[k]
+    if k == skip < n:
+        #All the items before the one left out fit: goes on past it
+        k = bisect_right(prefix_heights, capacity + heights[skip], skip + 1, n + 1) - 1
+        height = prefix_heights[k] - heights[skip]
+        value = prefix_values[k] - values[skip]
+    if k == n:
+        return value
+
+    r = capacity - height
+    next_item = k + 1 if k + 1 != skip else k + 2
+    previous_item = k - 1 if k - 1 != skip else k - 2
+    bound = value
+    if next_item < n:
+        bound += r * values[next_item] // heights[next_item]
+    if previous_item >= 0:
+        bound = max(bound, value + values[k] + (r - heights[k]) * values[previous_item] // heights[previous_item])
+    return bound
+
+''' Solves the 0-1 KP problem exactly, in pure Python, reducing it first and then solving only its core.
+    The value of a story is score * (N + 1) - 1, as in dynamic_programming, and solutions with the same value are
+    told apart by their keys: the sum, over their stories, of 2^(N - 1 - the rank of the story by id), so that
+    between two solutions with the same number of stories the lexicographically smaller set of ids has the larger key
+    (its smallest id not in the other set has the largest weight of their difference).
+    - Reduction (Martello and Toth): with the stories sorted by ratio and b the critical one, a story before b is
+      fixed in the knapsack (after b, out of it) if U2, with the story forced the other way, is smaller than the value
+      of the greedy solution. The comparison is strict, so no solution left out can tie with the best one.
+    - Core (Pisinger's expanding core): the search starts from the break solution, the stories before b, and adds
+      the free stories one at a time, alternately the next one after the core (which may be added) and the next one
+      before it (which may be removed), so that the core grows around b only while some states are still open. The
+      states are (height, value, key) triples: the ones dominated by a state no higher and no worse are dropped,
+      and so are the ones whose bound (the capacity left, or exceeded, filled or freed with the ratio of the next
+      story of the right side) is smaller than the best value found so far. Before a story enters the core, the
+      reduction test is repeated with the improved value, and the story is skipped if it can be fixed.
+    The solution is then decoded from the key of the best feasible state.
+    @param stories_set:    The stories, in any order;
+    @param N:    The number of stories;
+    @param c:    The capacity of the knapsack;
+    @return: (score, height, mask)
+             The best solution, with its mask as in compareSolutions.
+'''
+def core_knapsack(stories_set, N, c):
+    M = N + 1
+    weights = [0] * N
+    for (rank, i) in enumerate(sorted(xrange(N), key=lambda i: stories_set[i]._id)):
+        weights[i] = 1 << (N - 1 - rank)
+
+    #Stories with no score, or too high, are never in the best solution
+    items = [i for i in xrange(N) if stories_set[i]._score > 0 and stories_set[i]._height <= c]
+    value = lambda i: stories_set[i]._score * M - 1
+    items.sort(cmp=lambda i, j: cmp(value(j) * stories_set[i]._height, value(i) * stories_set[j]._height))
+    n = len(items)
+    values = [value(i) for i in items]
+    heights = [stories_set[i]._height for i in items]
+    item_weights = [weights[i] for i in items]
+    prefix_values = [0]
+    prefix_heights = [0]
+    for k in xrange(n):
+        prefix_values.append(prefix_values[-1] + values[k])
+        prefix_heights.append(prefix_heights[-1] + heights[k])
+
+    b = bisect_right(prefix_heights, c) - 1
+    key = sum(item_weights[:b])
+    if b < n:
+        #Greedy solution: the break solution, plus every story after b that still fits
+        lower_bound = prefix_values[b]
+        height = prefix_heights[b]
+        for k in xrange(b, n):
+            if heights[k] <= c - height:
+                lower_bound += values[k]
+                height += heights[k]
+
+        #Reduction: the stories that can't be fixed are left, from the closest to b
+        fixed = lambda k: (u2_bound(values, heights, prefix_values, prefix_heights, n, c, k) < lower_bound if k < b
+                           else values[k] + u2_bound(values, heights, prefix_values, prefix_heights, n,
+                                                     c - heights[k], k) < lower_bound)
+        left = [k for k in xrange(b - 1, -1, -1) if not fixed(k)]
+        right = [k for k in xrange(b, n) if not fixed(k)]
+
+        states = [(prefix_heights[b], prefix_values[b], key)]
+        l = r = 0
+        while l < len(left) or r < len(right):
+            if r < len(right) and (r <= l or l == len(left)):
+                k = right[r]
+                r += 1
+                if fixed(k):
+                    continue
+                shifted = [(h + heights[k], v + values[k], w + item_weights[k]) for (h, v, w) in states]
+            else:
+                k = left[l]
+                l += 1
+                if fixed(k):
+                    continue
+                shifted = [(h - heights[k], v - values[k], w - item_weights[k]) for (h, v, w) in states]
+
+            #Drops the dominated states (for each height only the best one is kept, the last one once sorted, and
+            #only if it is better than all the lower ones) and the ones whose bound is smaller than the best value
+            if r < len(right):
+                (right_value, right_height) = (values[right[r]], heights[right[r]])
+            else:
+                (right_value, right_height) = (0, 1)
+            if l < len(left):
+                (left_value, left_height) = (values[left[l]], heights[left[l]])
+            else:
+                (left_value, left_height) = (None, 1)
+            merged = sorted(states + shifted)
+            last = len(merged) - 1
+            states = []
+            (best_value, best_key) = (-1, 0)
+            for t in xrange(last + 1):
+                (h, v, w) = state = merged[t]
+                if t < last and merged[t + 1][0] == h or v < best_value or v == best_value and w <= best_key:
+                    continue
+                (best_value, best_key) = (v, w)
+                if h <= c:
+                    if v > lower_bound:
+                        lower_bound = v
+                    if v + (c - h) * right_value // right_height >= lower_bound:
+                        states.append(state)
+                elif left_value is not None and v + (c - h) * left_value // left_height >= lower_bound:
+                    states.append(state)
+
+        key = max((v, w) for (h, v, w) in states if h <= c)[1]
+
+    mask = 0
+    score = 0
+    height = 0
+    for i in xrange(N):
+        if key & weights[i]:
+            mask |= 1 << stories_set[i]._id
+            score += stories_set[i]._score
+            height += stories_set[i]._height
+    return score, height, mask
+
+''' Solves the 0-1 KP problem, choosing the engine: branch-and-bound (horowitz_sahni) when few stories are left
+    undecided by the bound gap (see undecided_stories); otherwise dynamic programming, if NumPy is available and
+    its table, N x (c+1), is small enough, or else the reduction and core solver (core_knapsack).
+    Parameters and return values are the same as horowitz_sahni's; the other engines ignore the solution passed,
+    and return the best one.
+'''
+def solve_knapsack(stories_set, N, c, best_solution_mask, best_solution_size, best_solution_score, best_solution_height,
+                   stories_prefix_sums=None):
+    if BB_MAX_UNDECIDED < N and undecided_stories(stories_set, N, c) > BB_MAX_UNDECIDED:
+        if np is not None and N * (c + 1) <= DP_MAX_CELLS:
+            return dynamic_programming(stories_set, N, c)
+        return core_knapsack(stories_set, N, c)
+    return horowitz_sahni(stories_set, N, c, best_solution_mask, best_solution_size, best_solution_score,
+                          best_solution_height, stories_prefix_sums)
+
+''' Keeps the best solution of the 0-1 KP problem over a sliding window of stories, for the reloads: stories enter
+    the window in order of creation (i.e. of id) and expire in the same order, so the window is a queue, which is
+    kept as two stacks (the classic decomposition of sliding-window aggregates), each one holding the rows of the
+    dynamic programming over the page height (see dynamic_programming):
+    - the back stack holds the newest stories, each with the row of the stories up to it: adding a story costs a
+      single row update, O(H);
+    - the front stack holds the oldest ones, each with the row of the stories from it to the newest of the stack,
+      and the bitset recording whether taking it is optimal: a story expires by popping it, in O(1). When the front
+      stack is empty, the back one is moved into it, computing these rows (each story is moved once).
+    The best score is then found merging the rows of the two stacks in O(H); the front part of the solution is
+    rebuilt from the bitsets, from the smallest id, and the back part from the prefix rows, from the newest story
+    (see best_solution): neither needs any row update.
+'''
+class WindowKnapsack():
+
+    ''' Constructor
+        @param page_height:    The capacity of the knapsack;
+        @param max_stories:    An upper bound to the number of stories in the window (to encode the number of
+                               stories in the values of the rows, see dynamic_programming).
+    '''
+    def __init__(self, page_height, max_stories):
+        self.__c = page_height
+        self.__M = max_stories + 1
+        self.__empty_row = np.zeros(page_height + 1, dtype=np.int64)
+        #Entries (story, row, take): the oldest story is the last one
+        self.__front = []
+        #Entries (story, row): the newest story is the last one
+        self.__back = []
+
+    ''' Returns the number of stories in the window.
+    '''
+    def __len__(self):
+        return len(self.__front) + len(self.__back)
+
+    ''' Adds a story to a row of the dynamic programming.
+        @param row:    The row of a set of stories;
+        @param story:    A story not in the set, whose height is at most the capacity;
+        @return: (row, take)
+                 The row of the set with the story, and the bitset (packed, one bit for each capacity from the story's
+                 height up) of the capacities where taking the story gives the best solution (ties included).
+    '''
+    def __add(self, row, story):
+        h = story._height
+        candidate = row[:self.__c + 1 - h] + (story._score * self.__M - 1)
+        take = candidate >= row[h:]
+        row = row.copy()
+        np.maximum(row[h:], candidate, row[h:])
+        return row, np.packbits(take)
+
+    ''' Adds the newest story to the window.
+        @param story:    The story, whose height must be at most the capacity and whose id must be larger than the
+                         ones of the stories in the window.
+    '''
+    def push(self, story):
+        row = self.__back[-1][1] if self.__back else self.__empty_row
+        self.__back.append((story, self.__add(row, story)[0]))
+
+    ''' Checks, in O(H), whether a story that is about to be added could be part of a best solution, merging the rows
+        of the two stacks with the capacity left by the story.
+        @param story:    The story, not in the window yet;
+        @param best_score, best_size:    The score and number of stories of the best solution for the window;
+        @return:    False if every solution with the story is worse than the best one (which then stays the best
+                    one once the story is added), True otherwise.
+    '''
+    def may_improve(self, story, best_score, best_size):
+        c = self.__c - story._height
+        front_row = self.__front[-1][1] if self.__front else self.__empty_row
+        back_row = self.__back[-1][1] if self.__back else self.__empty_row
+        best_with_story = (front_row[:c + 1] + back_row[c::-1]).max() + story._score * self.__M - 1
+        return best_with_story >= best_score * self.__M - best_size
+
+    ''' Removes the stories created before a given time.
+        @param min_time:    The time of the oldest story to keep;
+        @return:    The list of the ids of the stories removed.
+    '''
+    def expire(self, min_time):
+        expired = []
+        while len(self) > 0:
+            if not self.__front:
+                self.__move_back()
+            story = self.__front[-1][0]
+            if story._time >= min_time:
+                break
+            expired.append(story._id)
+            self.__front.pop()
+        return expired
+
+    ''' Moves the stories of the back stack into the (empty) front stack, computing their rows from the newest story
+        to the oldest (each row holding a story and the ones newer than it).
+    '''
+    def __move_back(self):
+        row = self.__empty_row
+        for (story, prefix_row) in reversed(self.__back):
+            (row, take) = self.__add(row, story)
+            self.__front.append((story, row, take))
+        self.__back = []
+
+    ''' Finds the moves from a set of capacities left for the stories up to one (those which stay optimal).
+        @param capacities:    The capacities, as a list, or as a sorted array if there are many of them;
+        @param previous, row:    The rows of the stories before the story, and up to it;
+        @param story:    The story;
+        @return: (left_out, taken, below)
+                 The lists of the capacities where the story can be left out, and where it can be taken, and the
+                 capacities left for the stories before it (in the same format as capacities).
+    '''
+    def __moves(self, capacities, previous, row, story):
+        h = story._height
+        value = story._score * self.__M - 1
+        if len(capacities) <= WINDOW_SCALAR_MOVES:
+            left_out = [r for r in capacities if previous[r] == row[r]]
+            taken = [r for r in capacities if r >= h and previous[r - h] + value == row[r]]
+            below = list(set(left_out).union([r - h for r in taken]))
+            if len(below) > WINDOW_SCALAR_MOVES:
+                below = np.array(sorted(below))
+            return left_out, taken, below
+
+        r = np.asarray(capacities)
+        left_out = r[previous[r] == row[r]]
+        r = r[r >= h]
+        taken = r[previous[r - h] + value == row[r]]
+        below = np.union1d(left_out, taken - h)
+        if len(below) <= WINDOW_SCALAR_MOVES:
+            below = below.tolist()
+        return left_out.tolist(), taken.tolist(), below
+
+    ''' Rebuilds the smallest set of ids among the best solutions of the back stack for a capacity, from its prefix
+        rows, without any row update: the capacities left by the best solutions are first followed from the newest
+        story to the oldest one (a story can be left out at capacity r if the row before it has the same value at r,
+        and taken if the row before it at r minus its height, plus its value, has the same value); then, from the
+        oldest story, each one is taken whenever some of the capacities reached allow it.
+        It takes time proportional to the number of stories in the back stack times the number of capacities left
+        by best solutions with the same value (most often one), instead of a row update for each story.
+        @param capacity:    The capacity of the knapsack;
+        @return: (score, height, ids)
+    '''
+    def __rebuild_back(self, capacity):
+        back = self.__back
+        n = len(back)
+        rows = [self.__empty_row] + [row for (story, row) in back]
+
+        #moves[k]: the moves of the k-th story from the capacities left for the stories up to it by the best solutions
+        moves = [None] * (n + 1)
+        capacities = [capacity]
+        for k in xrange(n, 0, -1):
+            story = back[k - 1][0]
+            (left_out, taken, capacities) = self.__moves(capacities, rows[k - 1], rows[k], story)
+            moves[k] = (left_out, taken)
+
+        score = 0
+        height = 0
+        ids = []
+        allowed = set(np.asarray(capacities).tolist())
+        for k in xrange(1, n + 1):
+            story = back[k - 1][0]
+            h = story._height
+            (left_out, taken) = moves[k]
+            taken = [r for r in taken if r - h in allowed]
+            if taken:
+                allowed = set(taken)
+                ids.append(story._id)
+                score += story._score
+                height += h
+            else:
+                allowed = set([r for r in left_out if r in allowed])
+        return score, height, ids
+
+    ''' Rebuilds the smallest set of ids among the best solutions for several capacities, taking each story whenever
+        it is optimal to: the solutions for all the capacities are rebuilt together, and as soon as a story is taken
+        for some of them, the others are dropped (their sets, which share the ids taken so far, would continue with
+        a larger id, or end, and a set that ends is larger than any continuation, see best_solution).
+        @param stories_takes:    The list of tuples (story, take), from the smallest id; the bitset of each story
+                                 must refer to the stories after it in the list;
+        @param capacities:    The capacities of the knapsack;
+        @return: (score, height, ids)
+    '''
+    @staticmethod
+    def __rebuild(stories_takes, capacities):
+        score = 0
+        height = 0
+        ids = []
+        for (story, take) in stories_takes:
+            h = story._height
+            taken = [r - h for r in capacities if r >= h and take[(r - h) >> 3] & (0x80 >> ((r - h) & 7))]
+            if taken:
+                capacities = taken
+                ids.append(story._id)
+                score += story._score
+                height += h
+        return score, height, ids
+
+    ''' Finds the best solution for the stories in the window, with the same tie-breaking as compareSolutions.
+        The best value is the maximum, over the capacity a given to the front stack, of front[a] + back[H - a]
+        (the rows of all the stories of each stack). All the ids in the front stack are smaller than the ones
+        in the back stack, so the smallest set of ids is found first choosing the front part: for each value
+        the front part can take in a best solution, the largest capacity it can be given bounds the sets with that
+        value, and the smallest of all these sets is chosen (where a set that is a prefix of another one is larger:
+        the other one continues with a smaller id, while the first one continues in the back stack); the back part
+        is then rebuilt with the capacity left (see __rebuild_back).
+        @return: (score, height, ids)
+                 The best solution, with the sorted list of the ids of its stories.
+    '''
+    def best_solution(self):
+        c = self.__c
+        front_row = self.__front[-1][1] if self.__front else self.__empty_row
+        back_row = self.__back[-1][1] if self.__back else self.__empty_row
+        totals = front_row + back_row[::-1]
+        best_value = totals.max()
+
+        #front_row is non decreasing: for each of its values, the last capacity where the total is the best one
+        capacities = np.flatnonzero(totals == best_value)
+        values = front_row[capacities]
+        capacities = capacities[np.append(values[1:] != values[:-1], True)]
+
+        front_takes = [(story, take) for (story, row, take) in reversed(self.__front)]
+        (score, height, ids) = WindowKnapsack.__rebuild(front_takes, capacities.tolist())
+        if self.__back:
+            (back_score, back_height, back_ids) = self.__rebuild_back(c - height)
+            score += back_score
+            height += back_height
+            ids += back_ids
+        return score, height, ids
+
 '''REGULAR EXPRESSIONS'''
 
 '''Regular Expression: Matches any non negative integer'''
@@ -406,7 +839,8 @@ def read_input(f):
 ''' Main flow of the program.
     Reads the input from the input file (stdin by default), collects every command
     in a separate element of a list, and then executes them one by one.
-    For every reload command, runs the Horowitz-Sahni backtracking algorithm.
+    For every reload command, runs the Horowitz-Sahni backtracking algorithm, or the dynamic programming one
+    (see solve_knapsack).
 '''
 def main_handler(file_in):
     
@@ -414,13 +848,24 @@ def main_handler(file_in):
     events_set, W, H = read_input(file_in)
 
     stories_set = []
-    story_insert = stories_set.insert   #optimization
-    story_pop = stories_set.pop         #optimization
+    #Prefix sums of the heights and scores of the stories, kept in sync with the stories (see prefix_sums)
+    stories_prefix_sums = ([0], [0])
+
+    def story_insert(i, story):
+        if i < 0:
+            #The searches for the position of a new story can end on negative indices
+            i += len(stories_set)
+        stories_set.insert(i, story)
+        prefix_sums_insert(stories_prefix_sums[0], stories_prefix_sums[1], i, story)
+
+    def story_pop(i):
+        prefix_sums_remove(stories_prefix_sums[0], stories_prefix_sums[1], i, stories_set.pop(i))
     
     best_solution_score = 0
     best_solution_height = 0
     best_subset = []
-    best_solution_mask = []
+    #The best solution, as an integer with the bit of index story._id set for each story in it (see compareSolutions)
+    best_solution_mask = 0
     best_solution_size = 0
 
     recompute = False
@@ -448,7 +893,7 @@ def main_handler(file_in):
                         i += 1
                         story_insert(i, new_story)
                                             
-                        best_solution_mask.insert(i, 1)
+                        best_solution_mask |= 1 << new_story._id
                         best_subset.append(new_story._id)
                         best_solution_size += 1
                         best_solution_score += new_story._score 
@@ -462,57 +907,28 @@ def main_handler(file_in):
 
                         (tmp_solution_score, 
                          tmp_solution_height, 
-                         tmp_solution_mask) = horowitz_sahni(stories_set, stories_set_size, H - new_story._height, 
+                         tmp_solution_mask) = solve_knapsack(stories_set, stories_set_size, H - new_story._height, 
                                                         best_solution_mask, 
                                                         best_solution_size, 
                                                         best_solution_score - new_story._score - 1, 
-                                                        best_solution_height)
+                                                        best_solution_height,
+                                                        stories_prefix_sums)
                         
              
                                                          
                         tmp_solution_score += new_story._score
+                        tmp_solution_mask |= 1 << new_story._id
+                        tmp_solution_size = count_stories(tmp_solution_mask)
                         
-                        if tmp_solution_score < best_solution_score:
-                            new_story_bitmask = 0 
-                        elif tmp_solution_score > best_solution_score:
-                            if (tmp_solution_mask != best_solution_mask):
-                                best_subset = sorted(get_subset_ids(stories_set, tmp_solution_mask, stories_set_size))
-                                best_solution_mask = tmp_solution_mask
-                                
-                            best_subset.append(new_story._id)
+                        if compareSolutions(tmp_solution_score, tmp_solution_size, tmp_solution_mask,
+                                            best_solution_score, best_solution_size, best_solution_mask) < 0:
+                            #The solutions can't be equal: only the new one has the new story
+                            best_subset = get_subset_ids(tmp_solution_mask)
                             best_solution_score = tmp_solution_score
                             best_solution_height = tmp_solution_height + new_story._height
-                            best_solution_size = len(best_subset)
-                            
-                            new_story_bitmask = 1                            
-                        else:
-                            if (tmp_solution_mask != best_solution_mask):
-                                tmp_subset = sorted(get_subset_ids(stories_set, tmp_solution_mask, stories_set_size))
-                            else:
-                                tmp_subset = best_subset[:]
-                                
-                            tmp_subset.append(new_story._id)
-                            tmp_solution_size = len(tmp_subset)
-
-                            if tmp_solution_size < best_solution_size:
-                                best_subset = tmp_subset
-                                best_solution_score = tmp_solution_score
-                                best_solution_height = tmp_solution_height + new_story._height
-                                best_solution_mask = tmp_solution_mask
-                                best_solution_size = tmp_solution_size
-                                new_story_bitmask = 1
-                            elif tmp_solution_size == best_solution_size and tmp_subset < best_subset:
-                                best_subset = tmp_subset
-                                best_solution_score = tmp_solution_score
-                                best_solution_height = tmp_solution_height + new_story._height
-                                best_solution_mask = tmp_solution_mask
-                                best_solution_size = tmp_solution_size
-                                new_story_bitmask = 1
-                            else:
-                                new_story_bitmask = 0   
-                                
-
-                              
+                            best_solution_mask = tmp_solution_mask
+                            best_solution_size = tmp_solution_size
+
                         new_story_index = stories_set_size - 1
                        
                         try:
@@ -523,8 +939,6 @@ def main_handler(file_in):
                         
                         new_story_index += 1
                         story_insert(new_story_index, new_story)  
-                       
-                        best_solution_mask.insert(new_story_index, new_story_bitmask)
                     else:
                         recompute = True
                         i = len(stories_set) - 1
@@ -538,13 +952,11 @@ def main_handler(file_in):
                         story_insert(i, new_story)
                         
                         if best_solution_height + new_story._height <= H:
-                            best_solution_mask.insert(i, 1)
+                            best_solution_mask |= 1 << new_story._id
                             best_subset.append(new_story._id)
                             best_solution_size += 1                               
                             best_solution_score += new_story._score 
                             best_solution_height += new_story._height
-                        else:
-                            best_solution_mask.insert(i, 0)
                    
                 else:
                     i = len(stories_set) - 1
@@ -558,13 +970,11 @@ def main_handler(file_in):
                     story_insert(i, new_story)
                     
                     if best_solution_height + new_story._height <= H:
-                        best_solution_mask.insert(i, 1)
+                        best_solution_mask |= 1 << new_story._id
                         best_subset.append(new_story._id)
                         best_solution_size += 1                               
                         best_solution_score += new_story._score 
                         best_solution_height += new_story._height
-                    else:
-                        best_solution_mask.insert(i, 0)
                         
         elif event[0] == 'R':
             current_time = event[1] 
@@ -574,15 +984,15 @@ def main_handler(file_in):
             while i >= 0:
                 story = stories_set[i]
                 if (story._time < min_time):
-                    if best_solution_mask[i]:
+                    if best_solution_mask >> story._id & 1:
                         
                         #If the story that became too old didn't belong to the best solution, then nothing changes
                         #Otherwise the old solution is no longer valid
                         best_solution_height -= story._height
                         best_solution_score -= story._score
                         best_solution_size -= 1
+                        best_solution_mask ^= 1 << story._id
                         recompute = True
-                    best_solution_mask.pop(i)
                     
                     story_pop(i)
                 i -= 1
@@ -592,14 +1002,15 @@ def main_handler(file_in):
                 
                 (best_solution_score, 
                  best_solution_height, 
-                 best_solution_mask) = horowitz_sahni(stories_set, stories_set_size, H, 
+                 best_solution_mask) = solve_knapsack(stories_set, stories_set_size, H, 
                                                       best_solution_mask, 
                                                       best_solution_size, 
                                                       best_solution_score, 
-                                                      best_solution_height)
+                                                      best_solution_height,
+                                                      stories_prefix_sums)
 
 
-                best_subset = sorted(get_subset_ids(stories_set, best_solution_mask, stories_set_size))
+                best_subset = get_subset_ids(best_solution_mask)
                 best_solution_size = len(best_subset)
                 
                 recompute = False
@@ -613,35 +1024,89 @@ def main_handler(file_in):
             #file_out.flush()
 
 
+''' Main flow of the program, keeping the best solution over the sliding window (see WindowKnapsack).
+    Reads the input from the input file (stdin by default), and then executes the commands one by one: a reload
+    after which the window lost no story of the last solution, and gained none that could improve it, prints the
+    same solution again; otherwise the solution is found merging the two stacks of the window.
+    INVARIANT: numpy is available.
+'''
+def window_handler(file_in):
+    events_set, W, H = read_input(file_in)
+
+    window = WindowKnapsack(H, len(events_set))
+    best_solution = (0, 0, [])
+    recompute = False
+
+    for event in events_set:
+        if event[0] == 'S':
+            new_story = Story(event[1], event[2], event[3])
+            if new_story._height <= H:
+                if not recompute:
+                    (best_solution_score, best_solution_height, best_subset) = best_solution
+                    if best_solution_height + new_story._height <= H:
+                        #The new story belongs to the best solution
+                        best_solution = (best_solution_score + new_story._score,
+                                         best_solution_height + new_story._height,
+                                         best_subset + [new_story._id])
+                    else:
+                        recompute = window.may_improve(new_story, best_solution_score, len(best_subset))
+                window.push(new_story)
+        elif event[0] == 'R':
+            expired = window.expire(event[1] - W)
+            if expired and not recompute:
+                best_ids = set(best_solution[2])
+                recompute = any(story_id in best_ids for story_id in expired)
+            if recompute:
+                best_solution = window.best_solution()
+                recompute = False
+
+            (best_solution_score, best_solution_height, best_subset) = best_solution
+            print '{} {}'.format(best_solution_score, len(best_subset)), ' '.join(map(str, best_subset))
+
 
 #file_out = open('f_test.txt','w')
 #DEBUG
 from time import time
 if __name__ == '__main__':
-    from sys import stdin, setcheckinterval
+    from sys import stdin, setcheckinterval, argv
     
     setcheckinterval(100000000)
     file_in = stdin
 
+    #-w keeps the best solution over the sliding window (see window_handler) instead of solving each reload;
+    #the events are read from stdin, or from the file given with -f
+    if '-w' in argv[1:]:
+        if np is None:
+            print 'Error using option -w: NumPy is required'
+        else:
+            if '-f' in argv[1:-1]:
+                file_name = argv[argv.index('-f') + 1]
+                try:
+                    file_in = open(file_name,'r')
+                except:
+                    print 'The requested file: {} does not exist. Please insert your input from the terminal.'.format(file_name)
+                    file_in = stdin
+            window_handler(file_in)
+    else:
 #DEBUG    
-    profiler = False
-    if not profiler:
-        file_in = open('feed_test_2.txt','r')
-        file_out = open('f_test.txt','w')
-    #DEBUG
-        start_time = time()
-        #read_and_process_input(file_in)
-        main_handler(file_in)
-        print time() - start_time
+        profiler = False
+        if not profiler:
+            file_in = open('feed_test_2.txt','r')
+            file_out = open('f_test.txt','w')
+        #DEBUG
+            start_time = time()
+            #read_and_process_input(file_in)
+            main_handler(file_in)
+            print time() - start_time
    
-    else:
+        else:
             
-        file_in = open('feed_test_2.txt','r')
-        file_out = open('f_test.txt','w')
+            file_in = open('feed_test_2.txt','r')
+            file_out = open('f_test.txt','w')
 
         
-        import profile
-        pr = profile.Profile()
-        for i in range(5):
-            print pr.calibrate(10000)
-        profile.run('main_handler(file_in)', 'feed_profile.txt')    
\ No newline at end of file
+            import profile
+            pr = profile.Profile()
+            for i in range(5):
+                print pr.calibrate(10000)
+            profile.run('main_handler(file_in)', 'feed_profile.txt')    
\ No newline at end of file
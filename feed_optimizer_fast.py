@@ -3,6 +3,7 @@
 '''
 
 from math import floor
+from bisect import bisect_right
 import re
 from sys import stdin, stdout
 #DEBUG    from time import time
@@ -54,6 +55,15 @@ class BackTrackingAlgorithm():
         self.__N = len(self.__full_stories_set)
         self.__page_height = page_height
         
+        #Prefix sums of the heights and scores of the stories, to jump to the critical story in forward moves,
+        #and the solutions made of the first k stories (see __compareSolutions)
+        self.__prefix_heights = [0]
+        self.__prefix_scores = [0]
+        self.__prefix_bits = [0]
+        for story in full_stories_set:
+            self.__prefix_heights.append(self.__prefix_heights[-1] + story._height)
+            self.__prefix_scores.append(self.__prefix_scores[-1] + story._score)
+            self.__prefix_bits.append(self.__prefix_bits[-1] | (1 << story._id))
         return
 
     ''' Returns the list of the stories corresponding to ones in the mask;
@@ -65,14 +75,18 @@ class BackTrackingAlgorithm():
         #INVARIANT: len(__full_stories_set) == len(self.__chromosome):
         return [stories_set[i] for i in range(len(mask)) if mask[i]]
 
-    ''' Returns the list of the ids of the stories corresponding to ones in the mask; 
-        @param mask: A binary mask corresponding to a subset of the stories:
-        @return: The corresponding list of ids.
+    ''' Returns the list of the ids of the stories in a solution;
+        @param mask: A solution, as an integer with the bit of index story._id set for each story in it:
+        @return: The corresponding list of ids, sorted.
     '''
     @staticmethod
-    def __get_subset_ids(stories_set, mask):
-        #INVARIANT: len(__full_stories_set) == len(self.__chromosome):
-        return [stories_set[i]._id for i in range(len(mask)) if mask[i]]
+    def __get_subset_ids(mask):
+        ids = []
+        while mask:
+            lowest = mask & -mask
+            ids.append(lowest.bit_length() - 1)
+            mask ^= lowest
+        return ids
 
 
     ''' Compares two solutions according to the specifications;
@@ -81,13 +95,14 @@ class BackTrackingAlgorithm():
         2) Has the same score, but with fewer stories,
         3) Has the same score and the same number of stories, but the set of
             stories IDs of solution_1 comes lexicographically before solution_2's.
+        Solutions are integers with the bit of index story._id set for each story in them: for sets of the same
+        size, the smallest id in only one of them decides the comparison, and it is the lowest bit set in their xor.
         @param solution_1, solution_2: The two solutions to compare;
         @return:    -1 <=> solution_1 is a better solution than solution_2, or it is equal to solution_2
                     1 <=> vice versa.
     '''
     @staticmethod
-    def __compareSolutions(stories_set,
-                           solution_1_score, solution_1_size, solution_1_mask,
+    def __compareSolutions(solution_1_score, solution_1_size, solution_1_mask,
                            solution_2_score, solution_2_size, solution_2_mask):
         
         #INVARIANT: all solutions tested are valid
@@ -101,9 +116,8 @@ class BackTrackingAlgorithm():
             elif solution_1_size > solution_2_size:
                 return 1
             else:
-                stories_ids_1 = sorted(BackTrackingAlgorithm.__get_subset_ids(stories_set, solution_1_mask))
-                stories_ids_2 = sorted(BackTrackingAlgorithm.__get_subset_ids(stories_set, solution_2_mask))
-                if stories_ids_1 <= stories_ids_2:
+                difference = solution_1_mask ^ solution_2_mask
+                if difference == 0 or solution_1_mask & difference & -difference:
                     return -1
                 else:
                     return 1
@@ -122,16 +136,20 @@ class BackTrackingAlgorithm():
         element from the knapsack.
         
         @param mask:    A bit mask that keeps track of the elements added to the
-                        solution so far;
+                        solution so far (the bit of index k for the k-th story);
+        @param solution:    The same elements, as a solution (see __compareSolutions);
         @param size:    The number of elements added to the knapsack so far;
         @param score:   Total score for the current solution;
         @param height:    Total height for the curent solution;
         @param pos:    The index of the new element to examine;
+        @param prefix_heights, prefix_scores:    The N + 1 sums of the heights and scores of the first k stories:
+                                                 the critical story of a forward move is found with a binary search;
+        @param prefix_bits:    The N + 1 solutions made of the first k stories.
     '''
     @staticmethod
-    def __horowitz_sahni(stories_set, N, c):
-        mask = [0] * N
-        best_solution_mask = mask[:]
+    def __horowitz_sahni(stories_set, N, c, prefix_heights, prefix_scores, prefix_bits):
+        mask = 0
+        best_solution_mask = solution = 0
         best_solution_size = size = 0
         best_solution_score = score = 0
         best_solution_height = height = 0        
@@ -140,25 +158,23 @@ class BackTrackingAlgorithm():
         while True:
             while j < N:
                 
-                #Tries a forward move        
-                pos = j
-                
                 initial_score = score
                 initial_heigh = height
                 initial_size = size
+                initial_solution = solution
                 
-                while pos < N:
-                    story = stories_set[pos]
-                    
-                    #First tries a forward move, if possible
-                    if story._height > c - height:
-                        break
-                    else:
-                        size += 1
-                        mask[pos] = 1
-                        score += story._score
-                        height += story._height
-                        pos += 1
+                #Tries a forward move, jumping to the critical story (the first one that doesn't fit; deep in the
+                #search, it is most often the j-th one)
+                limit = prefix_heights[j] + c - height
+                if prefix_heights[j + 1] > limit:
+                    pos = j
+                else:
+                    pos = bisect_right(prefix_heights, limit, j + 1, N + 1) - 1
+                    mask |= (1 << pos) - (1 << j)
+                    solution |= prefix_bits[pos] ^ prefix_bits[j]
+                    size += pos - j
+                    score += prefix_scores[pos] - prefix_scores[j]
+                    height += prefix_heights[pos] - prefix_heights[j]
 
                 if pos < N:
                     #Estimates Dantzig's upper bound
@@ -172,25 +188,24 @@ class BackTrackingAlgorithm():
                         #so it performs backtracking
 
                         #Brings the situation back at before the forward move
-                        for k in range(j,pos):
-                            mask[k] = 0
+                        mask &= (1 << j) - 1
+                        solution = initial_solution
                         
                         score = initial_score 
                         height = initial_heigh
                         size = initial_size
 
                         #Looks for a possible backtracking move
-                        pos = j - 1
-                        while pos >= 0 and mask[pos] == 0:
-                            pos -= 1
+                        pos = (mask & ((1 << j) - 1)).bit_length() - 1
                         if pos < 0:
                             #No more backtracking possible
                             return best_solution_score, best_solution_height, best_solution_mask
                         else:
                             #Exclude the element from the knapsack
-                            mask[pos] = 0
+                            mask ^= 1 << pos
                             size -= 1
                             story = stories_set[pos]
+                            solution ^= 1 << story._id
                             score -= story._score
                             height -= story._height
                             j = pos + 1
@@ -206,30 +221,28 @@ class BackTrackingAlgorithm():
                     
             #INVARIANT: j == self.__N:
             #Completed one "depth first search" visit in the solution space tree.
-            if BackTrackingAlgorithm.__compareSolutions(stories_set,
-                                                        score, size, mask,
+            if BackTrackingAlgorithm.__compareSolutions(score, size, solution,
                                                         best_solution_score,
                                                         best_solution_size,
                                                         best_solution_mask
                                                         ) < 0:
                 #Checks current solution
-                best_solution_mask = mask[:]
+                best_solution_mask = solution
                 best_solution_size = size
                 best_solution_height = height
                 best_solution_score = score
 
             #Tries a backtracking move
-            pos = N - 1
-            while pos >= 0 and mask[pos] == 0:
-                pos -= 1
+            pos = mask.bit_length() - 1
             if pos < 0:
                 #No more backtracking possible
                 return best_solution_score, best_solution_height, best_solution_mask
             else:
                 #Exclude the element from the knapsack
-                mask[pos] = 0
+                mask ^= 1 << pos
                 size -= 1
                 story = stories_set[pos]
+                solution ^= 1 << story._id
                 score -= story._score
                 height -= story._height
                 j = pos + 1
@@ -239,8 +252,9 @@ class BackTrackingAlgorithm():
         then returns the best solution found.
     '''
     def start(self):
-        best_solution_score, best_solution_height, best_solution_mask = BackTrackingAlgorithm.__horowitz_sahni(self.__full_stories_set, self.__N, self.__page_height)
-        return best_solution_score, best_solution_height, sorted(BackTrackingAlgorithm.__get_subset_ids(self.__full_stories_set, best_solution_mask))
+        best_solution_score, best_solution_height, best_solution_mask = BackTrackingAlgorithm.__horowitz_sahni(self.__full_stories_set, self.__N, self.__page_height,
+                                                                                                              self.__prefix_heights, self.__prefix_scores, self.__prefix_bits)
+        return best_solution_score, best_solution_height, BackTrackingAlgorithm.__get_subset_ids(best_solution_mask)
 
         
 '''REGULAR EXPRESSIONS'''
@@ -18,14 +18,19 @@ distance of a question from the query center and so the bound for each q-type qu
 Therefore, since we can expect Q<T (max{Q}=max{T}/10), a pessimistic bound for the whole proximity search algorithm is O(N*T)
 
 '''
-import re
 from math import sqrt
-from sys import stdin, argv
+from time import time
+from os import fstat
+from stat import S_ISREG
+from sys import stdin, stdout, argv, maxint
+from nearby_topk import BoundedTopK
+import nearby_parse
 
-'''A list of element sorted upon insertion whose max size may be fixed at inizialization.
-   The list is sorted in ascending order (see inner function compare_items)
-   If n is the value fixed for its max size, then from the n+1 insertion the largest element will be removed from the list
-   after a new element is interted
+'''A list of elements kept sorted, whose max size may be fixed at inizialization.
+   The list is sorted in ascending order of distance (see nearby_topk.sort_results): elements are tuples whose
+   first field is their id, and for distances within the threshold the element with the higher id comes first.
+   If n is the value fixed for its max size, only the n smallest elements (and the ones tied with the n-th) are kept,
+   in a bounded top-k container (see nearby_topk.BoundedTopK), so each insertion takes O(log n) time.
 '''
 class SortedList():
     
@@ -38,65 +43,56 @@ class SortedList():
     def __init__(self, metric, threshold, full_stories_set_size=0 ):
         self.metric = metric
         self.threshold  = threshold 
-        self.items = []
         self.max_size = full_stories_set_size
+        #The elements that have been candidates, by id
+        self.elements = {}
+        if full_stories_set_size > 0:
+            self.top_k = BoundedTopK(full_stories_set_size, threshold)
+        else:
+            self.top_k = BoundedTopK(maxint, threshold)
         
-    ''' - Add the item element to the list
-        - Sort the list
-        - Check if the number of elements in the list excedes max_size (if it is defined and positive), and in that case remove the largest element
+    ''' Adds the item element to the list, if it is one of the max_size smallest ones.
         @param item:    The item that has to be appended to the list;
         
     '''
     def append(self, item) : 
-        
-        ''' Order elemnts by distance and then by id (greather ids are considered smaller)
-        '''
-        def compare_items((ia,da),(ib,db)):
-            #checks the distances first: must be greater than the threshold (distances are non-negatives!)
-            if da < db - self.threshold:
-                return -1
-            elif da > db + self.threshold:
-                return 1
-            else:
-                #if the distances are within threshold, then compares ids
-                return ib[0]-ia[0]
-        #Add the item to the list, coupled with its distance, computed according to the metric passed upon construction
-        self.items.append( (item, self.metric(item) ) )         
-        self.items = sorted(self.items, cmp=compare_items )
-        #print self.items            #DEBUG: 
-        self.trim(self.max_size)        #If a max number of elements for the list is defined, it starts trimming the list, so that next insertions will be more efficient
+        #The distance is computed according to the metric passed upon construction
+        dist = self.metric(item)
+        if dist <= self.top_k.bound:
+            self.elements[item[0]] = item
+            self.top_k.push(dist, item[0])
 
   
     ''' If only n elements are allowed to stay in the list, removes the exceding ones
         @param n:    The number of elements allowed
     '''  
     def trim(self, n):
-        if n> 0 and len(self.items)> n:
-            self.items = self.items[0:n]
+        if n> 0 and len(self.top_k) > n:
+            top_k = BoundedTopK(n, self.threshold)
+            for i_d in self.top_k.ids():
+                top_k.push(self.metric(self.elements[i_d]), i_d)
+            self.top_k = top_k
+            self.max_size = n
             
     ''' Checks whether the list is empty
         @return:     True iff the list is empty
     '''        
     def is_empty(self) : 
-        return (self.items == [])
+        return len(self.top_k) == 0
     
 
-    ''' Returns the items stored in this container; Since every entry is contains an item and its distance attribute coupled together,
-        items must be decoupled first;
+    ''' Returns the items stored in this container, sorted.
         @return:    A list composed of every item in the list
     '''   
     def get_items(self):
-        return [it for (it,d) in self.items ]
+        return [self.elements[i_d] for i_d in self.top_k.ids()]
 
 
-INTEGER_RE = "(\d+)"            #Matches any non negative integer
-DOUBLE_RE = "(\d+\.\d*)"        #INVARIANT: x,y positive => reg exp supporting negative floating points "([-]?\d+\.\d*)" not needed
-SEPARATOR = ' '                 #We consider just spaces as separators
-#Regular expression for a topic
-TOPIC_REGEXP = INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE
-#Regular expression for a query
-QUERY_REGEXP = '([a-zA-Z]{1})' + SEPARATOR +  INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE
-    
+#Number of characters of output collected before they are written, and maximum number of seconds they are held
+#while answers keep coming (see ChunkWriter)
+BUFFER_SIZE = 1 << 16
+FLUSH_INTERVAL = 0.5
+
 '''Constraints - grouped in one dictionary for sake of clarity'''
 CONSTRAINTS = {'T_limit': 10000, 'Q_limit':1000, 'N_limit':10000, 'Qn_limit':10, 'Coordinate_limits':{'min':0, 'max':10e6} }    
 
@@ -140,68 +136,23 @@ def check_constraints(T,Q,N, topics, questions, queries):
 
     return True
     
-'''Reads the input from a file f
+'''Reads the topics and the questions from a file f, leaving the queries to be read while they are answered
+   (see nearby_parse.stream_input), so that the first results can be written before the whole input has been read,
+   and memory does not grow with the number of queries.
    The input is assumed to be formatted as follows:
    First line: 3 integers T  Q  N
    T lines composed by an integer and 2 doubles
    Q lines composed by 2 integers q_id Qn and then another Qn integers
    N lines composed by 1 char, 1 int and 2 doubles
-   @param f:    The file from which the input should be read;
+   @param f:    The file from which the input should be read; it must stay open until all the queries are read;
+   @param before_read:    A function with no arguments called before each line is read (see ChunkWriter.flush), or None;
    @return: (topics, questions, queries)
-           Three lists containing the topics, questions and queries read from the input channel.
+           The lists of the topics, as tuples (t_id, x, y), and of the questions, as tuples (q_id, Qids), and a
+           generator yielding the queries.
 '''
-def read_input(f):
-    line = f.readline()
-        
-    regex = re.compile(INTEGER_RE)  #Regular Expression for integers
-    #INVARIANT: the input is assumed well formed and adherent to the specs above
-    [T,Q,N]  = regex.findall(line)
-    
-    T = int(T)
-    Q = int(Q)
-    N = int(N)
-
-    topics = []
-    questions = []
-    queries = []
-
-    #Reads the topics list
-    regex = re.compile(TOPIC_REGEXP)
-    for i in range(T):
-        line = f.readline()
-        m = regex.match(line)
-        t_id = int(m.group(1))
-        (x,y) = map(lambda s: float(s), m.group(2,3))
-        topics.append((t_id, x, y))
-   
-    #Reads the questions list
-    regex = re.compile(INTEGER_RE)
-    for i in range(Q):
-        line = f.readline()
-        m = regex.findall(line)
-        
-        q_id = int(m[0])
-        Qn = int(m[1])
-        if (Qn!=0):
-            Qids = map(lambda s: int(s), m[2:Qn+2])        #could have been [2:len(m)], but it is better to trigger an exception if the input is not well formed
-            questions.append((q_id, Qids))
-    
-    #Reads the queries list            
-    regex = re.compile(QUERY_REGEXP)
-    for i in range(N):
-        line = f.readline()
-        m = regex.match(line)
-        q_type = m.group(1)
-        n_res = int(m.group(2))
-        (x,y) = map(lambda s: float(s), m.group(3,4))
-        queries.append((q_type, n_res, x, y))
-    
-    #Checks that contraints are met - disabled when input is trusted to be well-formed (for example if it has already been checked before passing it over)
-    #NOTE: decomment if the input might not be well-formed
-    #if not check_constraints(T,Q,N, topics, questions, queries) :       #DEBUG
-    #    raise "Malformed input"                                         #DEBUG
-  
-    return (topics, questions, queries)   
+def stream_input(f, before_read=None):
+    (topics, questions, queries) = nearby_parse.stream_input(f, before_read)
+    return (nearby_parse.topics_list(topics), nearby_parse.questions_list(questions), queries)
 
 ''' Given a center point, creates a metric function that returns the euclidean distance of a generic point to this center
     @param (x0,y0):    The cartesian coordinates of the center;
@@ -244,38 +195,100 @@ def define_question_metric((x0,y0), topics):
     return metric
 
 ''' Takes the input data and, for each query, finds the requested number of elements.
+    @param q_type:    The type of the query, 't' or 'q' (case insensitive);
+    @param n_res:    The number of results required;
+    @param x, y:    The coordinates of the query point;
+    @param topics:    List of all the topics in the input;
+    @param questions:    List of all the questions in the input;
+    @return:     A line (with its terminator) containing the ids of the results, sorted by ascending distance and descending id,
+                 each followed by a space; None if the type of the query is not valid.
+'''
+def answer_query(q_type, n_res, x, y, topics, questions):
+    if q_type.lower()=='t':
+        metric = define_topic_metric((x,y))                   #Distance to the query point of interest
+        elements = topics
+    elif q_type.lower()=='q':
+        metric = define_question_metric((x,y), topics)        #Distance to the query point of interest
+        elements = questions
+    else:
+        #DEBUG#raise exception    #It is assumed that the input is well formatted: otherwise, this line could be decommented to check
+        return None
+
+    queue = SortedList(metric, 0.001, n_res)            #keeps just n_res elements in the list
+    for e in elements:
+        queue.append(e)
+    return ''.join([str(it[0]) + ' ' for it in queue.get_items()]) + '\n'
+
+''' Answers the queries one at a time, as they are read.
     @param topics:    List of all the topics in the input;
     @param questions:    List of all the questions in the input;
-    @param queries:    List of all the queries in the input;
-    @return:     A properly formatted string, containing for each query the list of relevant topics' id sorted by ascending distance and descending topic id
+    @param queries:    Any iterable over the queries (f.i. the generator returned by stream_input);
+    @return:     A generator yielding the answer to each query, as a line (see answer_query).
 '''
-def process_queries(topics,questions, queries):  
-    s = '' 
+def answer_queries(topics, questions, queries):
     for (q_type, n_res, x, y) in queries:
-            if q_type.lower()=='t':
-                metric = define_topic_metric((x,y))                   #Distance to the query point of interest
-                queue = SortedList(metric, 0.001, n_res)            #keeps just n_res elements in the list
-                for t in topics:
-                    #print t                    #DEBUG 
-                    queue.append(t)
-                
-                for it in queue.get_items():
-                    s += str(it[0]) + ' '    
-                s +='\n'
-            elif q_type.lower()=='q':
-                metric = define_question_metric((x,y), topics)                    #Distance to the query point of interest
-                queue = SortedList(metric, 0.001, n_res)                        #keeps just n_res elements in the list
-                for q in questions:
-                    #print q                    #DEBUG
-                    queue.append(q)
-                
-                for it in queue.get_items():
-                    s += str(it[0]) + ' '    
-                s +='\n'
-            else:
-                pass
-                #DEBUG#raise exception    #It is assumed that the input is well formatted: otherwise, this line could be decommented to check
-    return s
+        line = answer_query(q_type, n_res, x, y, topics, questions)
+        if line is not None:
+            yield line
+
+''' Collects lines and writes them to a file in chunks of (at least) buffer_size characters, flushing the file after
+    each chunk, so that the output is neither held until the end nor written one line at a time. While lines keep
+    coming, a chunk is also written as soon as flush_interval seconds have passed since the previous one; when the
+    next line depends on a read that may block (f.i. the next query, from a pipe), flush should be called before
+    the read, so that the lines collected are not held while waiting (see stream_input).
+'''
+class ChunkWriter():
+
+    ''' Constructor
+        @param out:    The file to write to;
+        @param buffer_size:    The number of characters collected before they are written;
+        @param flush_interval:    The maximum number of seconds between two writes, while lines are coming.
+    '''
+    def __init__(self, out, buffer_size=BUFFER_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.out = out
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.chunk = []
+        self.size = 0
+        self.last_write = time()
+
+    ''' Adds a line (with its terminator), writing the chunk if it is large or old enough.
+    '''
+    def write(self, line):
+        self.chunk.append(line)
+        self.size += len(line)
+        if self.size >= self.buffer_size or time() - self.last_write >= self.flush_interval:
+            self.flush()
+
+    ''' Writes the lines collected, if any, and flushes the file.
+    '''
+    def flush(self):
+        if self.chunk:
+            self.out.write(''.join(self.chunk))
+            self.out.flush()
+            self.chunk = []
+            self.size = 0
+        self.last_write = time()
+
+''' Writes lines to a file through a ChunkWriter, flushing it at the end.
+    @param lines:    Any iterable over the lines to write (with their terminators);
+    @param writer:    The ChunkWriter.
+'''
+def write_buffered(lines, writer):
+    for line in lines:
+        writer.write(line)
+    writer.flush()
+
+''' Takes the input data and, for each query, finds the requested number of elements, writing the results as they are found:
+    queries are read, answered and written in a pipeline, so memory does not depend on their number.
+    @param topics:    List of all the topics in the input;
+    @param questions:    List of all the questions in the input;
+    @param queries:    Any iterable over the queries in the input;
+    @param writer:    The ChunkWriter of the file where the results are written (stdout by default), for each query a
+                      line containing the list of relevant ids sorted by ascending distance and descending id.
+'''
+def process_queries(topics, questions, queries, writer=None):
+    write_buffered(answer_queries(topics, questions, queries), writer if writer is not None else ChunkWriter(stdout))
 
 
 ''' Main.
@@ -297,13 +310,20 @@ if __name__ == '__main__':
     
     #DEBUG: De-comment the following lines if the input needs to be checked (please leave commented if the input may not be ill-formatted)
     #try:
-    #    (topics,questions, queries) = read_input(filein)
+    #    (topics,questions, queries) = stream_input(filein)
+    #    queries = list(queries)
+    #    if not check_constraints(len(topics), len(questions), len(queries), topics, questions, queries):
+    #        raise ValueError
     #except:
     #    print 'Malformed input'
     #    return
     
-    (topics,questions, queries) = read_input(filein)
+    #The queries are read while they are answered: the file can only be closed at the end.
+    #Reads from a pipe or a terminal may block, so the answers collected are written before each one
+    writer = ChunkWriter(stdout)
+    before_read = None if S_ISREG(fstat(filein.fileno()).st_mode) else writer.flush
+    (topics,questions, queries) = stream_input(filein, before_read)
+    #DEBUG#print (topics,questions, queries)            
+    process_queries(topics,questions, queries, writer)
     if filein!=stdin:
         filein.close()
-    #DEBUG#print (topics,questions, queries)            
-    print process_queries(topics,questions, queries)
@@ -0,0 +1,757 @@
+'''
+@author: mlarocca
+Benchmarks for the nearby engines (nearby.py, nearby_fast.py, nearby_rtree.py, nearby_grid.py).
+The suite generates random inputs and runs the engines in process, timing separately parsing, construction and
+each query, and checking that all the engines give the same answers; the throughput of the sharded execution is
+instead measured running each engine as a separate process on an input file, so that the figures include the
+whole pipeline, exactly as in the challenge.
+'''
+from sys import argv, executable, exit, stdout
+from subprocess import Popen, PIPE
+from multiprocessing import cpu_count
+from time import time
+from StringIO import StringIO
+from array import array
+import gc
+import json
+import resource
+import random
+import re
+import nearby
+import nearby_fast
+import nearby_rtree
+import nearby_grid
+import nearby_parse
+from nearby_stats import percentile
+from nearby_cache import QueryCache, cached_answer
+
+#Side of the square where topics and queries lie
+COORDINATE_MAX = 1e6
+#Maximum number of topics of a question
+QN_MAX = 10
+
+#Regular expressions for the lines of the input, used only by parse_regex (the parser the engines had before nearby_parse.py)
+INTEGER_RE = "(\d+)"            #Matches any non negative integer
+DOUBLE_RE = "(\d+\.\d*)"        #INVARIANT: x,y positive => reg exp supporting negative floating points "([-]?\d+\.\d*)" not needed
+SEPARATOR = ' '                 #We consider just spaces as separators
+TOPIC_REGEXP = INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
+QUERY_REGEXP = '([a-zA-Z]{1})' + SEPARATOR +  INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
+#Topics' layouts supported by generate_topics
+LAYOUTS = ('uniform', 'clustered', 'duplicate')
+
+''' Runs an engine on an input file.
+    @param engine:    The engine's file name (f.i. 'nearby_rtree.py');
+    @param file_in:    The input file's name;
+    @param options:    Extra command line options for the engine;
+    @return:    A tuple (elapsed seconds, output of the engine).
+'''
+def run_engine(engine, file_in, options=()):
+    start = time()
+    process = Popen([executable, engine, '-f', file_in] + list(options), stdout=PIPE)
+    output = process.communicate()[0]
+    elapsed = time() - start
+    if process.returncode != 0:
+        raise RuntimeError('{} exited with code {}'.format(engine, process.returncode))
+    return (elapsed, output)
+
+''' Throughput of the sharded execution (-j option) for 1, 2, ... jobs: for every number of jobs the engine is run
+    a few times and the best time is kept; the output of every run must match the sequential one.
+    @param engine:    The engine's file name;
+    @param file_in:    The input file's name;
+    @param max_jobs:    The largest number of worker processes tried [Default: one for each CPU];
+    @param runs:    The number of runs for each number of jobs;
+    @return:    The list of tuples (jobs, best time, queries per second).
+'''
+def benchmark_jobs(engine, file_in, max_jobs=None, runs=3):
+    f = open(file_in, 'r')
+    N = int(f.readline().split()[2])
+    f.close()
+    if max_jobs is None:
+        max_jobs = cpu_count()
+
+    results = []
+    reference = None
+    for jobs in xrange(1, max_jobs + 1):
+        best = float('inf')
+        for r in xrange(runs):
+            (elapsed, output) = run_engine(engine, file_in, ['-j', str(jobs)])
+            if reference is None:
+                reference = output
+            elif output != reference:
+                raise RuntimeError('{} -j {}: output differs from the sequential run'.format(engine, jobs))
+            best = min(best, elapsed)
+        results.append((jobs, best, N / best))
+    return results
+
+
+''' Generates random topics.
+    @param T:    The number of topics;
+    @param layout:    'uniform' (topics uniformly distributed over the square), 'clustered' (gaussian clusters
+                      with a standard deviation of 2% of the side) or 'duplicate' (half of the topics share the
+                      position of one of a few others, so that many distances are exactly tied);
+    @param rnd:    The random.Random instance to use;
+    @param n_clusters:    The number of clusters, for the clustered layout;
+    @return:    A list of tuples (t_id, x, y).
+'''
+def generate_topics(T, layout, rnd, n_clusters=5):
+    topics = []
+    if layout == 'clustered' or layout == 'duplicate':
+        centers = [(rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX)) for i in xrange(n_clusters)]
+    for t_id in xrange(T):
+        if layout == 'duplicate' and rnd.random() < 0.5:
+            (x, y) = rnd.choice(centers)
+        elif layout == 'clustered':
+            (cx, cy) = rnd.choice(centers)
+            x = min(COORDINATE_MAX, max(0., rnd.gauss(cx, 0.02 * COORDINATE_MAX)))
+            y = min(COORDINATE_MAX, max(0., rnd.gauss(cy, 0.02 * COORDINATE_MAX)))
+        else:
+            x = rnd.uniform(0, COORDINATE_MAX)
+            y = rnd.uniform(0, COORDINATE_MAX)
+        topics.append((t_id, round(x, 3), round(y, 3)))
+    return topics
+
+''' Compares the SS-tree and the uniform grid on t-type queries, in process: build time and average query time
+    are measured separately, and the results of the two engines must be identical.
+    @param T:    The number of topics;
+    @param N:    The number of queries;
+    @param n_res:    The number of results of each query;
+    @param layout:    The topics' layout (see generate_topics);
+    @param seed:    The seed of the random generator;
+    @return:    A dictionary mapping each engine's name to a tuple (build seconds, query milliseconds).
+'''
+def benchmark_topics_engines(T, N, n_res, layout, seed=1):
+    rnd = random.Random(seed)
+    topics = generate_topics(T, layout, rnd)
+    queries = [(rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX)) for i in xrange(N)]
+
+    start = time()
+    tree = nearby_rtree.ss_tree_bulk_load([nearby_rtree.SSPoint(x, y, t_id) for (t_id, x, y) in topics])
+    tree_build = time() - start
+    start = time()
+    grid = nearby_grid.UniformGrid(topics)
+    grid_build = time() - start
+
+    start = time()
+    tree_results = [nearby_rtree.ss_tree_topics_knn(tree, x0, y0, n_res) for (x0, y0) in queries]
+    tree_query = time() - start
+    start = time()
+    grid_results = [grid.topics_knn(x0, y0, n_res) for (x0, y0) in queries]
+    grid_query = time() - start
+
+    if tree_results != grid_results:
+        raise RuntimeError('SS-tree and grid results differ ({} topics, {} layout)'.format(T, layout))
+    return {'sstree': (tree_build, 1000. * tree_query / N), 'grid': (grid_build, 1000. * grid_query / N)}
+
+
+''' Generates a random input for the nearby challenge.
+    Topics' ids go from 0 to T-1 in input order, questions have from 0 to 10 topics each, and queries ask for
+    1 to max_k results around points uniformly distributed over the square.
+    @param T, Q, N:    The number of topics, questions and queries;
+    @param layout:    The topics' layout (see generate_topics);
+    @param max_k:    The maximum number of results of a query;
+    @param seed:    The seed of the random generator;
+    @param shared_topics:    If not None, questions only pick their topics among the first shared_topics ones, so
+                             that each of those topics is relevant for many questions;
+    @return:    The input, as a single string.
+'''
+def generate_input(T, Q, N, layout='uniform', max_k=100, seed=1, shared_topics=None):
+    rnd = random.Random(seed)
+    lines = ['{} {} {}'.format(T, Q, N)]
+    for (t_id, x, y) in generate_topics(T, layout, rnd):
+        lines.append('{} {:.3f} {:.3f}'.format(t_id, x, y))
+    pool = T if shared_topics is None else min(T, shared_topics)
+    for q_id in xrange(Q):
+        Qids = rnd.sample(xrange(pool), min(pool, rnd.randint(0, QN_MAX)))
+        lines.append(' '.join([str(v) for v in [q_id, len(Qids)] + Qids]))
+    for i in xrange(N):
+        lines.append('{} {} {:.3f} {:.3f}'.format(rnd.choice('tq'), rnd.randint(1, max_k),
+                                                   rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX)))
+    lines.append('')
+    return '\n'.join(lines)
+
+''' Runs nearby.py in process.
+    @param text:    The input;
+    @return: (parse seconds, build seconds, list of query latencies in seconds, list of output lines)
+'''
+def run_nearby(text):
+    f = StringIO(text)
+    start = time()
+    (topics, questions, queries) = nearby.stream_input(f)
+    queries = list(queries)
+    parse = time() - start
+
+    latencies = []
+    output = []
+    for query in queries:
+        start = time()
+        line = nearby.answer_query(query[0], query[1], query[2], query[3], topics, questions)
+        latencies.append(time() - start)
+        output.append(line.rstrip('\n'))
+    return (parse, 0., latencies, output)
+
+''' Runs the NumPy engine of nearby_fast.py in process, one query at the time.
+    @param text:    The input;
+    @return: (parse seconds, build seconds, list of query latencies in seconds, list of output lines)
+'''
+def run_nearby_fast(text):
+    f = StringIO(text)
+    start = time()
+    (topics, questions, (q_types, n_res, x0, y0)) = nearby_parse.read_input(f)
+    parse = time() - start
+
+    start = time()
+    (t_ids, t_x, t_y, q_ids, q_topics) = nearby_fast.build_arrays(topics, questions)
+    build = time() - start
+
+    N = len(q_types)
+    q_types = [q_type.lower() for q_type in q_types]
+    (x0, y0) = (nearby_fast.numpy_array(x0), nearby_fast.numpy_array(y0))
+    state = (t_ids, t_x, t_y, q_ids, q_topics, q_types, n_res, x0, y0)
+    latencies = []
+    output = []
+    for i in xrange(N):
+        start = time()
+        line = ''.join(nearby_fast.answer_queries_numpy(state, i, i + 1))
+        latencies.append(time() - start)
+        output.append(line.rstrip('\n'))
+    return (parse, build, latencies, output)
+
+''' Runs nearby_rtree.py in process.
+    @param text:    The input;
+    @return: (parse seconds, build seconds, list of query latencies in seconds, list of output lines)
+'''
+def run_nearby_rtree(text):
+    f = StringIO(text)
+    start = time()
+    (topics, questions, queries) = nearby_parse.read_input(f)
+    (topics_points, topics_questions, questions) = nearby_rtree.load_topics_and_questions(topics, questions)
+    queries = nearby_parse.queries_list(queries)
+    parse = time() - start
+
+    start = time()
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+    build = time() - start
+
+    latencies = []
+    output = []
+    for (q_type, k, x0, y0) in queries:
+        start = time()
+        line = nearby_rtree.answer_query(q_type, k, x0, y0, topics_tree, questions_tree, topics_questions)
+        latencies.append(time() - start)
+        output.append(line)
+    return (parse, build, latencies, output)
+
+#The engines compared by the suite: the first one is the reference for the equivalence check
+ENGINES = [('nearby_rtree', run_nearby_rtree), ('nearby_fast', run_nearby_fast), ('nearby', run_nearby)]
+
+''' Runs every engine on the same generated inputs, timing separately the parsing of the input, the construction
+    of the data structures and every single query, and checks that all the engines give the same answer to every
+    query (same ids, in the same order, ties included).
+    @param T, Q, N:    The number of topics, questions and queries of each input;
+    @param layouts:    The topics' layouts (see generate_topics), one input for each;
+    @param max_k:    The maximum number of results of a query;
+    @param engines:    The names of the engines to run (see ENGINES);
+    @param seed:    The seed of the random generator;
+    @return:    A list with a dictionary for each (layout, engine), with the input's parameters, the phases' times
+                in seconds, the percentiles of the queries' latency in milliseconds, and the number of queries whose
+                answer differs from the one of the reference engine.
+'''
+def benchmark_suite(T, Q, N, layouts=LAYOUTS, max_k=100, engines=None, seed=1):
+    runners = [(name, run) for (name, run) in ENGINES if engines is None or name in engines]
+    if nearby_fast.np is None:
+        runners = [(name, run) for (name, run) in runners if name != 'nearby_fast']
+
+    results = []
+    for layout in layouts:
+        text = generate_input(T, Q, N, layout, max_k, seed)
+        reference = None
+        for (name, run) in runners:
+            (parse, build, latencies, output) = run(text)
+            if reference is None:
+                reference = output
+            mismatches = len([i for i in xrange(N) if output[i] != reference[i]])
+            latencies.sort()
+            results.append({'layout': layout, 'T': T, 'Q': Q, 'N': N, 'max_k': max_k, 'seed': seed,
+                            'engine': name, 'parse': parse, 'build': build, 'query': sum(latencies),
+                            'latency_ms': dict([('p{}'.format(p), 1000. * percentile(latencies, p))
+                                                for p in (50, 90, 99, 100)]),
+                            'mismatches': mismatches})
+    return results
+
+''' Compares answering the queries of nearby_rtree.py one by one, in input order, with the batch mode
+    (see nearby_rtree.answer_queries_batch); the answers must be identical.
+    @param T, Q, N:    The size of the generated input;
+    @param max_k:    The maximum number of results of a query;
+    @param layout:    The topics' layout (see generate_topics);
+    @param seed:    The seed of the random generator;
+    @return:    A tuple (seconds in input order, seconds in batch mode).
+'''
+def benchmark_batch(T, Q, N, max_k=100, layout='uniform', seed=1):
+    (topics_points, topics_questions, questions, queries) = parse_bulk(generate_input(T, Q, N, layout, max_k, seed))
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+
+    start = time()
+    in_order = [nearby_rtree.answer_query(q_type, k, x0, y0, topics_tree, questions_tree, topics_questions)
+                for (q_type, k, x0, y0) in queries]
+    in_order_time = time() - start
+    start = time()
+    batch = nearby_rtree.answer_queries_batch(queries, topics_tree, questions_tree, topics_questions)
+    batch_time = time() - start
+
+    if in_order != batch:
+        raise RuntimeError('The batch mode gives different answers ({} layout)'.format(layout))
+    return (in_order_time, batch_time)
+
+''' Measures the q-type queries answered walking the topics tree (see nearby_rtree.ss_tree_questions_knn) on inputs
+    whose questions share their topics, so that every topic met is expanded to many questions, and compares them
+    with the questions index.
+    @param T, Q, N, max_k, seed:    The parameters of the input (see generate_input);
+    @param shared_topics:    The number of topics the questions pick theirs from;
+    @return:    A tuple (walk, index): the average time of a query, in milliseconds, for the two searches.
+'''
+def benchmark_questions_walk(T, Q, N, max_k=100, shared_topics=1000, seed=1):
+    (topics_points, topics_questions, questions, queries) = parse_bulk(
+        generate_input(T, Q, 0, 'uniform', max_k, seed, shared_topics))
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+    rnd = random.Random(seed)
+    queries = [(rnd.randint(1, max_k), rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX))
+               for i in xrange(N)]
+
+    start = time()
+    walk = [nearby_rtree.ss_tree_questions_knn(topics_tree, topics_questions, x0, y0, k)
+            for (k, x0, y0) in queries]
+    walk_time = time() - start
+    start = time()
+    index = [nearby_rtree.ss_questions_index_knn(questions_tree, x0, y0, k) for (k, x0, y0) in queries]
+    index_time = time() - start
+
+    if walk != index:
+        raise RuntimeError('The walk of the topics tree gives different answers ({} shared topics)'.format(shared_topics))
+    return (1000. * walk_time / N, 1000. * index_time / N)
+
+''' Compares answering a t-type and a q-type query at the same point separately (topics tree and questions index)
+    and together, with a single traversal of the topics tree (see nearby_rtree.ss_tree_fused_search).
+    @param T, Q, N, max_k, layout, seed:    The parameters of the input (see generate_input): N pairs of queries are
+                                            generated, each one with its own number of results for topics and questions;
+    @return:    A tuple (separate, fused): the average time of a pair of queries, in milliseconds.
+'''
+def benchmark_fused(T, Q, N, max_k=100, layout='uniform', seed=1):
+    (topics_points, topics_questions, questions, queries) = parse_bulk(generate_input(T, Q, 0, layout, max_k, seed))
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+    rnd = random.Random(seed)
+    pairs = [(('t', rnd.randint(1, max_k), x0, y0), ('q', rnd.randint(1, max_k), x0, y0))
+             for (x0, y0) in [(rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX)) for i in xrange(N)]]
+
+    start = time()
+    separate = [(nearby_rtree.answer_query(t_type, t_res, x0, y0, topics_tree, questions_tree, topics_questions),
+                 nearby_rtree.answer_query(q_type, q_res, x0, y0, topics_tree, questions_tree, topics_questions))
+                for ((t_type, t_res, x0, y0), (q_type, q_res, x0, y0)) in pairs]
+    separate_time = time() - start
+    start = time()
+    fused = [nearby_rtree.answer_co_located(t_query, q_query, topics_tree, topics_questions)
+             for (t_query, q_query) in pairs]
+    fused_time = time() - start
+
+    if separate != fused:
+        raise RuntimeError('The fused traversal gives different answers ({} layout)'.format(layout))
+    return (1000. * separate_time / N, 1000. * fused_time / N)
+
+''' Parses an input line by line with regular expressions, as the engines did before nearby_parse.py (the reference
+    of benchmark_parse).
+    @param text:    The input;
+    @return: (topics_points, topics_questions, questions, queries)
+             As for nearby_rtree.load_topics_and_questions, plus the list of the queries.
+'''
+def parse_regex(text):
+    f = StringIO(text)
+    (T, Q, N) = [int(v) for v in re.findall(INTEGER_RE, f.readline())]
+    (t_ids, t_x, t_y) = topics = (array('l'), array('d'), array('d'))
+    regex = re.compile(TOPIC_REGEXP)
+    for i in xrange(T):
+        m = regex.match(f.readline())
+        t_ids.append(int(m.group(1)))
+        (x,y) = map(lambda s: float(s), m.group(2,3))
+        t_x.append(x)
+        t_y.append(y)
+    (q_ids, q_offsets, q_topics) = questions = (array('l'), array('l', [0]), array('l'))
+    regex = re.compile(INTEGER_RE)
+    for i in xrange(Q):
+        m = regex.findall(f.readline())
+        q_ids.append(int(m[0]))
+        Qn = int(m[1])
+        q_topics.extend(map(lambda s: int(s), m[2:Qn+2]))
+        q_offsets.append(len(q_topics))
+    (topics_points, topics_questions, questions) = nearby_rtree.load_topics_and_questions(topics, questions)
+    regex = re.compile(QUERY_REGEXP)
+    queries = []
+    for i in xrange(N):
+        m = regex.match(f.readline())
+        queries.append((m.group(1), int(m.group(2))) + tuple(map(lambda s: float(s), m.group(3, 4))))
+    return (topics_points, topics_questions, questions, queries)
+
+''' Parses an input with the bulk loader, and converts it into the structures of nearby_rtree.py.
+    @param text:    The input;
+    @return: (topics_points, topics_questions, questions, queries)
+             As for parse_regex.
+'''
+def parse_bulk(text):
+    (topics, questions, queries) = nearby_parse.read_input(StringIO(text))
+    (topics_points, topics_questions, questions) = nearby_rtree.load_topics_and_questions(topics, questions)
+    return (topics_points, topics_questions, questions, nearby_parse.queries_list(queries))
+
+''' Measures parsing alone: the regular expressions parser (see parse_regex) vs the bulk loader, both into typed
+    arrays only (nearby_parse.read_input, all that nearby_fast.py's NumPy engine needs) and into the structures of
+    nearby_rtree.py (see parse_bulk).
+    @param T, Q, N, layout, seed:    The parameters of the input (see generate_input);
+    @param runs:    The number of times the input is parsed, keeping the fastest time;
+    @return:    A tuple (regex, arrays, structures) with the time taken, in seconds.
+'''
+def benchmark_parse(T, Q, N, layout='uniform', seed=1, runs=3):
+    text = generate_input(T, Q, N, layout, 100, seed)
+    parsers = (parse_regex, lambda text: nearby_parse.read_input(StringIO(text)), parse_bulk)
+    times = []
+    for parse in parsers:
+        elapsed = float('inf')
+        for r in xrange(runs):
+            start = time()
+            parse(text)
+            elapsed = min(elapsed, time() - start)
+        times.append(elapsed)
+
+    (old, new) = (parse_regex(text), parse_bulk(text))
+    if (old[2], old[3]) != (new[2], new[3]) or old[1] != new[1] or \
+            [(p.t_id, p.x, p.y) for p in old[0]] != [(p.t_id, p.x, p.y) for p in new[0]]:
+        raise RuntimeError('The bulk loader gives a different input ({} layout)'.format(layout))
+    return tuple(times)
+
+''' Returns the resident set size of this process, in MB (its peak, where /proc is not available).
+'''
+def resident_memory():
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+''' Measures the memory taken by nearby_rtree.py's structures, as the growth of the resident set size of this process
+    while they are built (see benchmark_memory, which runs it in a separate process for each input).
+    @param T, Q, layout, seed:    The parameters of the input (see generate_input);
+    @return:    A tuple (structures, indices): the MB taken by the topics' points and the inverted lists
+                (see nearby_rtree.load_topics_and_questions), and by the topics tree and the questions index.
+'''
+def measure_rtree_memory(T, Q, layout='uniform', seed=1):
+    (topics, questions, queries) = nearby_parse.read_input(StringIO(generate_input(T, Q, 0, layout, 100, seed)))
+    gc.collect()
+    start = resident_memory()
+    (topics_points, topics_questions, questions) = nearby_rtree.load_topics_and_questions(topics, questions)
+    structures = resident_memory()
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+    return (structures - start, resident_memory() - structures)
+
+''' Measures the memory taken by the topics and questions, scaled to 10^6 topics: the arrays of the input
+    (nearby_parse.read_input, all that nearby_fast.py keeps) and nearby_rtree.py's structures and indices.
+    @param T, Q, layout, seed:    The parameters of the input (see generate_input);
+    @return:    A tuple (arrays, structures, indices), in MB per 10^6 topics.
+'''
+def benchmark_memory(T, Q, layout='uniform', seed=1):
+    (topics, questions, queries) = nearby_parse.read_input(StringIO(generate_input(T, Q, 0, layout, 100, seed)))
+    arrays = sum([a.buffer_info()[1] * a.itemsize for a in topics + questions]) / float(1 << 20)
+    del topics, questions
+
+    #Memory freed by the previous structures would be reused: the other figures are measured in a new process
+    process = Popen([executable, __file__, 'rtree-memory', str(T), str(Q), layout, str(seed)], stdout=PIPE)
+    (structures, indices) = [float(v) for v in process.communicate()[0].split()]
+    return tuple([mb * 1e6 / T for mb in (arrays, structures, indices)])
+
+''' Measures the cache of query results (see nearby_cache) on a stream of queries repeating a few hot locations.
+    @param T, Q, N, max_k, layout, seed:    The parameters of the input (see generate_input);
+    @param hot:    The number of distinct locations of the queries, each query picking one at random;
+    @param capacity:    The capacity of the cache, in results;
+    @return:    A tuple (uncached, cached, stats): the average time of a query without and with the cache, in
+                milliseconds, and the counters of the cache (see QueryCache.stats).
+'''
+def benchmark_cache(T, Q, N, max_k=100, hot=100, layout='uniform', capacity=100000, seed=1):
+    (topics_points, topics_questions, questions, queries) = parse_bulk(generate_input(T, Q, 0, layout, max_k, seed))
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+    rnd = random.Random(seed)
+    locations = [(rnd.uniform(0, COORDINATE_MAX), rnd.uniform(0, COORDINATE_MAX)) for i in xrange(hot)]
+    queries = [(rnd.choice('tq'), rnd.randint(1, max_k)) + rnd.choice(locations) for i in xrange(N)]
+    answer = lambda q_type, n_res, x0, y0: nearby_rtree.answer_query(q_type, n_res, x0, y0, topics_tree, questions_tree,
+                                                                     topics_questions)
+
+    start = time()
+    uncached = [answer(*query) for query in queries]
+    uncached_time = time() - start
+    cache = QueryCache(capacity)
+    answer_cached = cached_answer(cache, answer)
+    start = time()
+    cached = [answer_cached(*query) for query in queries]
+    cached_time = time() - start
+
+    if uncached != cached:
+        raise RuntimeError('The cache gives different answers ({} hot locations)'.format(hot))
+    return (1000. * uncached_time / N, 1000. * cached_time / N, cache.stats())
+
+''' Measures the approximate searches of nearby_rtree.py (see nearby_rtree.ss_tree_topics_search) on a generated input.
+    @param T, Q, N, max_k, layout, seed:    The parameters of the input (see generate_input);
+    @param epsilons:    The approximation factors to measure;
+    @param runs:    The number of times all the queries are answered, keeping the fastest time;
+    @return:    A pair (summary, rows): summary has a dictionary for each epsilon, with the time taken to answer all
+                the queries, the mean number of nodes visited compared to the exact searches, the mean and maximum
+                relative error of the k-th distance and the mean recall; rows has the statistics of every single
+                query (see nearby_rtree.approximate_query_stats), with its index, type, k and epsilon.
+'''
+def benchmark_approximate(T, Q, N, max_k=100, layout='uniform', epsilons=(0.1, 0.25, 0.5, 1.), seed=1, runs=3):
+    (topics_points, topics_questions, questions, queries) = parse_bulk(generate_input(T, Q, N, layout, max_k, seed))
+    queries = [q for q in queries if q[1] > 0]
+    (topics_tree, questions_tree, topics_grid) = nearby_rtree.build_indices(topics_points, questions)
+
+    summary = []
+    rows = []
+    for epsilon in (0.,) + tuple(epsilons):
+        elapsed = float('inf')
+        for r in xrange(runs):
+            start = time()
+            for (q_type, k, x0, y0) in queries:
+                nearby_rtree.answer_query(q_type, k, x0, y0, topics_tree, questions_tree, topics_questions,
+                                          epsilon=epsilon)
+            elapsed = min(elapsed, time() - start)
+
+        stats = []
+        for i in xrange(len(queries)):
+            (q_type, k, x0, y0) = queries[i]
+            s = nearby_rtree.approximate_query_stats(q_type, k, x0, y0, topics_tree, questions_tree, epsilon)
+            stats.append(s)
+            if epsilon > 0:
+                s = dict(s)
+                s.update({'query': i, 'type': q_type, 'k': k, 'epsilon': epsilon})
+                rows.append(s)
+        n = max(1, len(stats))
+        summary.append({'epsilon': epsilon, 'time': elapsed,
+                        'nodes': sum([s['nodes'] for s in stats]) / float(max(1, sum([s['exact_nodes'] for s in stats]))),
+                        'mean_error': sum([s['error'] for s in stats]) / n,
+                        'max_error': max([s['error'] for s in stats] + [0.]),
+                        'recall': sum([s['recall'] for s in stats]) / n})
+    return (summary, rows)
+
+''' Compares the results of the suite with the ones saved by a previous run.
+    @param old_results, new_results:    Two lists of results, as returned by benchmark_suite;
+    @param threshold:    The relative slowdown above which a phase is reported;
+    @return:    A list of strings, describing every phase that got slower than threshold and every engine that
+                returns answers different from the reference engine.
+'''
+def compare_results(old_results, new_results, threshold=0.2):
+    old = dict([((r['layout'], r['engine'], r['T'], r['Q'], r['N'], r['max_k']), r) for r in old_results])
+    regressions = []
+    for r in new_results:
+        if r['mismatches'] > 0:
+            regressions.append('{} ({}): {} answers differ from the reference engine'.format(
+                r['engine'], r['layout'], r['mismatches']))
+        o = old.get((r['layout'], r['engine'], r['T'], r['Q'], r['N'], r['max_k']))
+        if o is None:
+            continue
+        for phase in ('parse', 'build', 'query'):
+            if o[phase] > 0 and r[phase] > o[phase] * (1. + threshold):
+                regressions.append('{} ({}): {} {:.3f}s -> {:.3f}s'.format(r['engine'], r['layout'], phase,
+                                                                          o[phase], r[phase]))
+    return regressions
+
+
+''' Main.
+    Usage:
+        python nearby_benchmark.py suite [options]
+            Runs the benchmark suite (see benchmark_suite) and prints a summary; options:
+                -T T, -Q Q, -N N    Size of the generated inputs [Default 10000 1000 1000, the challenge's limits
+                                    for T and Q];
+                -k max_k            Maximum number of results of a query [Default 100];
+                -l layouts          Comma separated list of layouts [Default uniform,clustered,duplicate];
+                -e engines          Comma separated list of engines [Default nearby_rtree,nearby_fast,nearby];
+                -s seed             Seed of the random generator [Default 1];
+                -o filename         Saves the results in a JSON file;
+                -b filename         Compares the results with the ones saved in a JSON file by a previous run, and
+                                    reports the phases more than 20% slower.
+        python nearby_benchmark.py generate T Q N [layout max_k seed]
+            Writes a random input on stdout (see generate_input).
+        python nearby_benchmark.py engine input_file [max_jobs]
+            Throughput of the engine for 1..max_jobs worker processes (see benchmark_jobs).
+        python nearby_benchmark.py grid [T N n_res]
+            SS-tree vs uniform grid on t-type queries, for uniform and clustered topics (see benchmark_topics_engines).
+        python nearby_benchmark.py batch [T Q N max_k]
+            nearby_rtree.py's queries in input order vs batch mode, for each layout (see benchmark_batch).
+        python nearby_benchmark.py parse [T Q N]
+            Parse time alone, regular expressions vs bulk loader (see benchmark_parse).
+        python nearby_benchmark.py memory [T Q]
+            Memory taken by topics and questions, in MB per 10^6 topics, for each layout (see benchmark_memory).
+        python nearby_benchmark.py cache [T Q N max_k]
+            nearby_rtree.py's queries with and without the cache of results, for streams repeating from 10 to N
+            distinct locations (see benchmark_cache).
+'''
+if __name__ == '__main__':
+    if len(argv) > 1 and argv[1] == 'suite':
+        sizes = {'-T': 10000, '-Q': 1000, '-N': 1000, '-k': 100, '-s': 1}
+        layouts = LAYOUTS
+        engines = None
+        file_out = None
+        baseline = None
+        i = 2
+        while i + 1 < len(argv):
+            if argv[i] in sizes:
+                sizes[argv[i]] = int(argv[i + 1])
+            elif argv[i] == '-l':
+                layouts = argv[i + 1].split(',')
+            elif argv[i] == '-e':
+                engines = argv[i + 1].split(',')
+            elif argv[i] == '-o':
+                file_out = argv[i + 1]
+            elif argv[i] == '-b':
+                baseline = argv[i + 1]
+            else:
+                print 'Unknown option {}'.format(argv[i])
+                exit(1)
+            i += 2
+
+        results = benchmark_suite(sizes['-T'], sizes['-Q'], sizes['-N'], layouts, sizes['-k'], engines, sizes['-s'])
+        print '{:>10} {:>13} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10}'.format(
+            'layout', 'engine', 'parse (s)', 'build (s)', 'query (s)', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)', 'mismatches')
+        for r in results:
+            print '{:>10} {:>13} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10}'.format(
+                r['layout'], r['engine'], r['parse'], r['build'], r['query'],
+                r['latency_ms']['p50'], r['latency_ms']['p90'], r['latency_ms']['p99'], r['mismatches'])
+
+        if file_out is not None:
+            f = open(file_out, 'w')
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.close()
+        if baseline is not None:
+            f = open(baseline, 'r')
+            regressions = compare_results(json.load(f), results)
+            f.close()
+            for line in regressions:
+                print 'REGRESSION: ' + line
+            if len(regressions) > 0:
+                exit(2)
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'batch':
+        params = [int(a) for a in argv[2:6]]
+        (T, Q, N, max_k) = params + [100000, 10000, 10000, 100][len(params):]
+        print '{:>10} {:>14} {:>10} {:>8}'.format('layout', 'in order (s)', 'batch (s)', 'speedup')
+        for layout in LAYOUTS:
+            (in_order_time, batch_time) = benchmark_batch(T, Q, N, max_k, layout)
+            print '{:>10} {:>14.3f} {:>10.3f} {:>8.2f}'.format(layout, in_order_time, batch_time,
+                                                               in_order_time / batch_time)
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'approx':
+        params = [int(a) for a in argv[2:6]]
+        (T, Q, N, max_k) = params + [100000, 10000, 1000, 100][len(params):]
+        file_out = argv[6] if len(argv) > 6 else None
+        all_rows = []
+        print '{:>10} {:>7} {:>9} {:>8} {:>7} {:>11} {:>10} {:>7}'.format(
+            'layout', 'epsilon', 'time (s)', 'speedup', 'nodes', 'mean error', 'max error', 'recall')
+        for layout in LAYOUTS:
+            (summary, rows) = benchmark_approximate(T, Q, N, max_k, layout)
+            for r in summary:
+                print '{:>10} {:>7.2f} {:>9.3f} {:>8.2f} {:>7.2f} {:>11.4f} {:>10.4f} {:>7.3f}'.format(
+                    layout, r['epsilon'], r['time'], summary[0]['time'] / r['time'], r['nodes'],
+                    r['mean_error'], r['max_error'], r['recall'])
+            for r in rows:
+                r['layout'] = layout
+            all_rows.extend(rows)
+
+        if file_out is not None:
+            #Per query statistics, as CSV
+            columns = ['layout', 'epsilon', 'query', 'type', 'k', 'nodes', 'exact_nodes', 'error', 'recall']
+            f = open(file_out, 'w')
+            f.write(','.join(columns) + '\n')
+            for r in all_rows:
+                f.write(','.join([str(r[c]) for c in columns]) + '\n')
+            f.close()
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'fused':
+        params = [int(a) for a in argv[2:6]]
+        (T, Q, N, max_k) = params + [100000, 10000, 2000, 100][len(params):]
+        print '{:>10} {:>14} {:>11} {:>8}'.format('layout', 'separate (ms)', 'fused (ms)', 'speedup')
+        for layout in LAYOUTS:
+            (separate, fused) = benchmark_fused(T, Q, N, max_k, layout)
+            print '{:>10} {:>14.3f} {:>11.3f} {:>8.2f}'.format(layout, separate, fused, separate / fused)
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'parse':
+        params = [int(a) for a in argv[2:5]]
+        (T, Q, N) = params + [100000, 10000, 100000][len(params):]
+        print '{:>10} {:>10} {:>11} {:>15} {:>8}'.format('layout', 'regex (s)', 'arrays (s)', 'structures (s)',
+                                                        'speedup')
+        for layout in LAYOUTS:
+            (regex_time, arrays_time, structures_time) = benchmark_parse(T, Q, N, layout)
+            print '{:>10} {:>10.3f} {:>11.3f} {:>15.3f} {:>8.2f}'.format(layout, regex_time, arrays_time,
+                                                                        structures_time, regex_time / structures_time)
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'memory':
+        params = [int(a) for a in argv[2:4]]
+        (T, Q) = params + [1000000, 100000][len(params):]
+        print '{:>10} {:>12} {:>16} {:>13}'.format('layout', 'arrays (MB)', 'structures (MB)', 'indices (MB)')
+        for layout in LAYOUTS:
+            print '{:>10} {:>12.1f} {:>16.1f} {:>13.1f}'.format(layout, *benchmark_memory(T, Q, layout))
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'rtree-memory':
+        #Run by benchmark_memory
+        print '{} {}'.format(*measure_rtree_memory(int(argv[2]), int(argv[3]), argv[4], int(argv[5])))
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'cache':
+        params = [int(a) for a in argv[2:6]]
+        (T, Q, N, max_k) = params + [100000, 10000, 10000, 100][len(params):]
+        print '{:>9} {:>14} {:>12} {:>9} {:>9} {:>8}'.format('locations', 'uncached (ms)', 'cached (ms)', 'hit rate',
+                                                           'evictions', 'speedup')
+        for hot in (10, 100, 1000, N):
+            (uncached, cached, stats) = benchmark_cache(T, Q, N, max_k, hot)
+            print '{:>9} {:>14.3f} {:>12.3f} {:>9.3f} {:>9} {:>8.2f}'.format(hot, uncached, cached, stats['hit_rate'],
+                                                                           stats['evictions'], uncached / cached)
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'walk':
+        params = [int(a) for a in argv[2:6]]
+        (T, Q, N, max_k) = params + [100000, 100000, 1000, 100][len(params):]
+        print '{:>13} {:>11} {:>12}'.format('shared topics', 'walk (ms)', 'index (ms)')
+        for shared_topics in (T, 10000, 1000, 100):
+            if shared_topics <= T:
+                print '{:>13} {:>11.3f} {:>12.3f}'.format(shared_topics,
+                                                          *benchmark_questions_walk(T, Q, N, max_k, shared_topics))
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'generate':
+        (T, Q, N) = [int(a) for a in argv[2:5]]
+        layout = argv[5] if len(argv) > 5 else 'uniform'
+        max_k = int(argv[6]) if len(argv) > 6 else 100
+        seed = int(argv[7]) if len(argv) > 7 else 1
+        stdout.write(generate_input(T, Q, N, layout, max_k, seed))
+        exit(0)
+
+    if len(argv) > 1 and argv[1] == 'grid':
+        params = [int(a) for a in argv[2:5]]
+        (T, N, n_res) = params + [100000, 2000, 10][len(params):]
+        print '{:>10} {:>8} {:>10} {:>10}'.format('layout', 'engine', 'build (s)', 'query (ms)')
+        for layout in ('uniform', 'clustered'):
+            results = benchmark_topics_engines(T, N, n_res, layout)
+            for engine in ('sstree', 'grid'):
+                print '{:>10} {:>8} {:>10.3f} {:>10.3f}'.format(layout, engine, *results[engine])
+        exit(0)
+
+    if len(argv) < 3:
+        print 'Usage: python nearby_benchmark.py suite [options] | generate T Q N [layout max_k seed] | engine input_file [max_jobs] | grid [T N n_res] | batch [T Q N max_k] | approx [T Q N max_k csv_file] | walk [T Q N max_k] | fused [T Q N max_k] | cache [T Q N max_k] | parse [T Q N] | memory [T Q]'
+        exit(1)
+
+    max_jobs = None
+    if len(argv) > 3:
+        max_jobs = int(argv[3])
+
+    print '{:>4} {:>10} {:>12} {:>8}'.format('jobs', 'time (s)', 'queries/s', 'speedup')
+    results = benchmark_jobs(argv[1], argv[2], max_jobs)
+    for (jobs, elapsed, throughput) in results:
+        print '{:>4} {:>10.3f} {:>12.1f} {:>8.2f}'.format(jobs, elapsed, throughput, results[0][1] / elapsed)
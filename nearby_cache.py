@@ -0,0 +1,169 @@
+'''
+@author: mlarocca
+LRU cache of the results of nearby queries, for query streams that repeat the same locations.
+Entries are keyed by the type of the query and its (quantized) coordinates, and hold the results of the query with
+the largest number of results asked so far at that point: the answer for a smaller k is a prefix of the answer for
+a larger one (the candidates added by a larger k are farther than the k-th distance plus the tolerance from the
+query point, so they can never precede one of the first k results), and is obtained by slicing.
+Memory is bounded by the total number of results held: the least recently used entries are evicted first.
+When the indices change, the entries whose results might be affected are dropped through invalidate.
+'''
+from collections import OrderedDict
+from math import sqrt
+from time import time
+
+#Default maximum number of results held by the cache
+DEFAULT_CAPACITY = 1 << 20
+
+''' An LRU cache of query results.
+'''
+class QueryCache(object):
+
+    ''' Constructor
+        @param capacity:    The maximum number of results (summed over all the entries) held by the cache;
+        @param quantum:    The step of the grid on which query points are quantized: queries whose points fall in the
+                           same cell share their results, which are then approximate unless quantum is 0 (the default:
+                           only queries at exactly the same point share an entry).
+    '''
+    def __init__(self, capacity=DEFAULT_CAPACITY, quantum=0.):
+        self.capacity = capacity
+        self.quantum = quantum
+        #Entries, from the least to the most recently used: each one is a list [x0, y0, k, results, reach]
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.hits_time = self.misses_time = 0.
+
+    ''' Returns the key of a query.
+    '''
+    def __key(self, q_type, x0, y0):
+        if self.quantum > 0:
+            return (q_type, int(round(x0 / self.quantum)), int(round(y0 / self.quantum)))
+        return (q_type, x0, y0)
+
+    ''' Looks for the results of a query in the cache.
+        @param q_type:    The type of the query;
+        @param n_res:    The number of results required;
+        @param x0, y0:    The coordinates of the query point;
+        @return:    The list of the results, or None if they are not in the cache.
+    '''
+    def get(self, q_type, n_res, x0, y0):
+        key = self.__key(q_type, x0, y0)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.entries[key] = entry
+        (k, results) = entry[2:4]
+        if n_res <= k:
+            return results[:n_res]
+        elif len(results) < k:
+            #There are fewer results than k: the entry holds all of them
+            return results
+        return None
+
+    ''' Stores the results of a query, evicting the least recently used entries if needed.
+        @param q_type, n_res, x0, y0:    The query;
+        @param results:    The list of its results (ids, or anything else, as long as they are in order);
+        @param reach:    The distance from (x0, y0) beyond which no change in the indices can affect the results
+                         (the k-th distance plus the tolerance), or inf if unknown.
+    '''
+    def put(self, q_type, n_res, x0, y0, results, reach=float('inf')):
+        key = self.__key(q_type, x0, y0)
+        old_entry = self.entries.pop(key, None)
+        if old_entry is not None:
+            self.size -= len(old_entry[3])
+            if old_entry[2] > n_res:
+                #The old entry answers more queries
+                (x0, y0, n_res, results, reach) = old_entry
+        if len(results) > self.capacity:
+            return
+        self.entries[key] = [x0, y0, n_res, results, reach]
+        self.size += len(results)
+        while self.size > self.capacity:
+            (old_key, old_entry) = self.entries.popitem(last=False)
+            self.size -= len(old_entry[3])
+            self.evictions += 1
+
+    ''' Answers a query from the cache, or computes (and stores) its results, timing hits and misses separately.
+        @param q_type, n_res, x0, y0:    The query;
+        @param compute:    A function taking (q_type, n_res, x0, y0) and returning a pair (results, reach)
+                           (see put);
+        @return:    The list of the results.
+    '''
+    def answer(self, q_type, n_res, x0, y0, compute):
+        start = time()
+        results = self.get(q_type, n_res, x0, y0)
+        if results is not None:
+            self.hits += 1
+            self.hits_time += time() - start
+            return results
+        (results, reach) = compute(q_type, n_res, x0, y0)
+        self.put(q_type, n_res, x0, y0, results, reach)
+        self.misses += 1
+        self.misses_time += time() - start
+        return results
+
+    ''' Drops the entries that a change in the indices might affect.
+        @param q_type:    The type of the entries to drop, or None for all the types;
+        @param x, y:    The position of the change (f.i. of the topic added, removed, or attached to a question):
+                        only the entries whose reach (see put) covers it are dropped; if None, all the entries of
+                        the given type are dropped.
+    '''
+    def invalidate(self, q_type=None, x=None, y=None):
+        for (key, entry) in self.entries.items():
+            if q_type is not None and key[0] != q_type:
+                continue
+            if x is not None and sqrt((entry[0] - x) ** 2 + (entry[1] - y) ** 2) > entry[4]:
+                continue
+            del self.entries[key]
+            self.size -= len(entry[3])
+            self.invalidations += 1
+
+    ''' Returns the counters of the cache.
+        @return:    A dictionary with the number of hits, misses, evictions and invalidated entries, the hit rate,
+                    and the mean time of a hit and of a miss, in milliseconds.
+    '''
+    def stats(self):
+        queries = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'invalidations': self.invalidations, 'entries': len(self.entries), 'size': self.size,
+                'hit_rate': self.hits / float(queries) if queries > 0 else 0.,
+                'hit_ms': 1e3 * self.hits_time / self.hits if self.hits > 0 else 0.,
+                'miss_ms': 1e3 * self.misses_time / self.misses if self.misses > 0 else 0.}
+
+''' Puts a cache in front of a function answering single queries with formatted lines (see nearby_rtree.answer_query).
+    @param cache:    The QueryCache;
+    @param answer:    A function taking (q_type, n_res, x0, y0) and returning the answer, as a line of ids each followed
+                      by a space;
+    @return:    A function with the same signature as answer, returning the same lines.
+'''
+def cached_answer(cache, answer):
+    compute = lambda q_type, n_res, x0, y0: (split_line(answer(q_type, n_res, x0, y0)), float('inf'))
+    return lambda q_type, n_res, x0, y0: ''.join(cache.answer(q_type, n_res, x0, y0, compute)) if n_res > 0 else ''
+
+''' Puts a cache in front of a function answering pairs of co-located queries (see nearby_rtree.answer_co_located):
+    the pair is answered together only if neither query is in the cache.
+    @param cache:    The QueryCache;
+    @param answer:    A function answering single queries, already behind the cache (see cached_answer);
+    @param answer_pair:    A function taking two queries, as tuples (q_type, n_res, x0, y0), and returning the pair
+                           of their answers;
+    @return:    A function with the same signature as answer_pair, returning the same lines.
+'''
+def cached_answer_pair(cache, answer, answer_pair):
+    def answer_cached_pair(query, other):
+        start = time()
+        if cache.get(*query) is None and cache.get(*other) is None:
+            (line, other_line) = answer_pair(query, other)
+            cache.put(query[0], query[1], query[2], query[3], split_line(line))
+            cache.put(other[0], other[1], other[2], other[3], split_line(other_line))
+            cache.misses += 2
+            cache.misses_time += time() - start
+            return (line, other_line)
+        return (answer(*query), answer(*other))
+    return answer_cached_pair
+
+''' Splits a formatted line of results in the list of its ids, each one followed by a space, so that any prefix
+    of the list can be joined back into the line for fewer results.
+'''
+def split_line(line):
+    return ['{} '.format(i_d) for i_d in line.split()]
@@ -18,127 +18,246 @@ distance of a question from the query center and so the bound for each q-type qu
 Therefore, since we can expect Q<T (max{Q}=max{T}/10), a pessimistic bound for the whole proximity search algorithm is O(N*T)
 
 '''
-import re
-#from math import sqrt
-from sys import stdin
-
-INTEGER_RE = "(\d+)"            #Matches any non negative integer
-DOUBLE_RE = "(\d+\.\d*)"        #INVARIANT: x,y positive => reg exp supporting negative floating points "([-]?\d+\.\d*)" not needed
-SEPARATOR = ' '                 #We consider just spaces as separators
-#Regular expression for a topic
-TOPIC_REGEXP = INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
-#Regular expression for a query
-QUERY_REGEXP = '([a-zA-Z]{1})' + SEPARATOR +  INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
-    
+from math import sqrt
+from itertools import izip
+from sys import stdin, stdout, argv
+from time import time
+try:
+    import numpy as np
+except ImportError:
+    #The vectorized engine is not available: the pure Python one is used instead
+    np = None
+import nearby_parallel
+import nearby_parse
+from nearby_topk import BoundedTopK, sort_results
+from nearby_stats import QueryStats
+
 '''Constraints - grouped in one dictionary for sake of clarity'''
 CONSTRAINTS = {'T_limit': 10000, 'Q_limit':1000, 'N_limit':10000, 'Qn_limit':10, 'Coordinate_limits':{'min':0, 'max':10e6} }    
 
    
-'''Reads the input from a file f
-   The input is assumed to be formatted as follows:
-   First line: 3 integers T  Q  N
-   T lines composed by an integer and 2 doubles
-   Q lines composed by 2 integers q_id Qn and then another Qn integers
-   N lines composed by 1 char, 1 int and 2 doubles
+'''Reads the input from a file f (see nearby_parse.read_input for its format) for the pure Python engine.
    @param f:    The file from which the input should be read;
    @return: (topics, questions, queries)
-           Three lists containing the topics, questions and queries read from the input channel.
+           The topics, as arrays (t_ids, t_x, t_y), the questions with at least one topic, as arrays
+           (q_ids, q_offsets, q_topics) with the topics' dense indices (see nearby_parse.dense_questions),
+           and the queries, as returned by nearby_parse.read_input.
 '''
-def read_and_process_input(f):
-    line = f.readline()
-        
-    regex = re.compile(INTEGER_RE)  #Regular Expression for integers
-    #INVARIANT: the input is assumed well formed and adherent to the specs above
-    [T,Q,N]  = regex.findall(line)
-    
-    T = int(T)
-    Q = int(Q)
-    N = int(N)
-
-    topics = {}
-    questions = []
-
-    #Reads the topics list
-    regex = re.compile(TOPIC_REGEXP)
-    for i in range(T):
-        line = f.readline()
-        m = regex.match(line)
-        t_id = int(m.group(1))
-        (x,y) = map(lambda s: float(s), m.group(2,3))
-        topics[t_id] = (x, y)
-   
-    #Reads the questions list
-    regex = re.compile(INTEGER_RE)
-    for i in range(Q):
-        line = f.readline()
-        m = regex.findall(line)
-        
-        q_id = int(m[0])
-        Qn = int(m[1])
-        if (Qn!=0):
-            Qids = map(lambda s: int(s), m[2:Qn+2])        #could have been [2:len(m)], but it is better to trigger an exception if the input is not well formed
-            questions.append((q_id, Qids))
-    
-    #Reads the queries list            
-    regex = re.compile(QUERY_REGEXP)
-    for i in range(N):
-        line = f.readline()
-        m = regex.match(line)
-        q_type = m.group(1)
-        n_res = int(m.group(2))
-        (x0,y0) = map(lambda s: float(s), m.group(3,4))
-        
-
-        def compare_items((ia,da), (ib,db)):
-            #checks the distances first: must be greater than the threshold (distances are non-negatives!)
-            if da < db - 0.001:
-                return -1
-            elif da > db + 0.001:
-                return 1
-            else:
-                #if the distances are within threshold, then compares ids
-                return ib-ia
-        
+def read_input(f):
+    (topics, questions, queries) = nearby_parse.read_input(f)
+    return (topics, nearby_parse.dense_questions(topics, questions), queries)
+
+'''Reads the input from a file f and answers the queries one by one.
+   @param f:    The file from which the input should be read;
+   @param query_stats:    If not None, a QueryStats instance recording the counters and the wall time of every query
+                          (see nearby_stats.py): every topic (or question) is a candidate, and its distance is computed.
+'''
+def read_and_process_input(f, query_stats=None):
+    ((t_ids, t_x, t_y), (q_ids, q_offsets, q_topics), queries) = read_input(f)
+    T = len(t_ids)
+    Q = len(q_ids)
+    #Distances computed by a q-type query
+    questions_topics = len(q_topics)
+
+    for (q_type, n_res, x0, y0) in nearby_parse.queries_list(queries):
+        if query_stats is not None:
+            start = time()
+
         if q_type.lower()=='t':
-            queue = []
-                                  
-           
-            append = queue.append   #Optimization
-            for t_id, (x,y) in topics.iteritems():
-                append((t_id, (x-x0)**2 + (y-y0)**2))
+            #Only the n_res nearest topics (and the ones tied with the k-th) are kept
+            top_k = BoundedTopK(n_res)
+            push = top_k.push   #Optimization
+            d_max = top_k.bound
+            for (t_id, x, y) in izip(t_ids, t_x, t_y):
+                dist = sqrt((x-x0)**2 + (y-y0)**2)
+                if dist <= d_max:
+                    d_max = push(dist, t_id)
                 
-            queue = [it for (it,d) in sorted(queue, cmp=compare_items)][:n_res]
+            queue = top_k.ids()
             
             s = []
             for it in queue:
                 s .append( '{} '.format(it) )    
             s = ''.join(s)          #Optimization
             print s
+            if query_stats is not None:
+                query_stats.add('t', {'distances': T, 'unused': T - len(queue)}, time() - start)
         elif q_type.lower()=='q':
-            queue = []
-            
-            append = queue.append   #Optimization                
+            top_k = BoundedTopK(n_res)
+            push = top_k.push   #Optimization
+            d_max = top_k.bound
 
-            for (q_id, Qn) in questions:
+            for i in xrange(Q):
                 dist = 1e13      #x,y <= 10**6 => dist**2 <= 2 * 10**12
-                for t_id in Qn:
-                    (x, y) = topics[t_id]
-                    dist = min(dist, (x-x0)**2 + (y-y0)**2)        
-            
-                append((q_id, dist))
+                for t in q_topics[q_offsets[i]:q_offsets[i + 1]]:
+                    dist = min(dist, (t_x[t]-x0)**2 + (t_y[t]-y0)**2)
+                dist = sqrt(dist)
+                if dist <= d_max:
+                    d_max = push(dist, q_ids[i])
                 
-            queue = [it for (it,d) in sorted(queue, cmp=compare_items)][:n_res]
+            queue = top_k.ids()
             
             s = []
             for it in queue:
                 s .append( '{} '.format(it) )    
             s = ''.join(s)          #Optimization
             print s
+            if query_stats is not None:
+                query_stats.add('q', {'distances': questions_topics, 'unused': Q - len(queue)},
+                                time() - start)
 
     return  
     
 
 
+#Maximum number of distances computed at once for a block of queries (bounds the memory used by the distance matrices)
+BLOCK_ELEMENTS = 1 << 22
+
+''' Selects, for every row of a distance matrix, the n_res closest elements, ordered by ascending distance
+    and, for distances within 0.001, by descending id (see nearby_topk.sort_results).
+    The k-th smallest distance of each row is found with argpartition, and only the elements whose distance is
+    within the tolerance from it are sorted: no other element can be among the first k ones.
+    @param dist:    A (B, n) matrix of distances, one row per query;
+    @param ids:    An array with the n ids of the elements (columns of dist);
+    @param n_res:    The list of the number of results required for each row;
+    @return:    A list of B formatted lines, one for each row.
+'''
+def select_top_k(dist, ids, n_res):
+    (B, n) = dist.shape
+    lines = [''] * B
+    k = np.minimum(np.array(n_res, dtype=np.intp), n)
+    k_max = int(k.max()) if B > 0 else 0
+    if k_max == 0:
+        return lines
+
+    rows = np.arange(B)
+    partitioned = dist[rows[:, None], np.argpartition(dist, k_max - 1, axis=1)[:, :k_max]]
+    partitioned.sort(axis=1)
+    #Distance of the k-th nearest element of each row, plus the tolerance (rows with k == 0 get no candidate)
+    threshold = np.where(k > 0, partitioned[rows, np.maximum(k - 1, 0)] + 0.001, -1.)
+
+    (cand_rows, cand_cols) = np.nonzero(dist <= threshold[:, None])
+    bounds = np.searchsorted(cand_rows, np.arange(B + 1)).tolist()
+    cand_ids = ids[cand_cols].tolist()
+    cand_dist = dist[cand_rows, cand_cols].tolist()
+    k = k.tolist()
+    for i in xrange(B):
+        if k[i] == 0:
+            continue
+        start = bounds[i]
+        stop = bounds[i + 1]
+        queue = sort_results(zip(cand_dist[start:stop], cand_ids[start:stop]))[:k[i]]
+        lines[i] = ''.join(['{} '.format(it) for (d, it) in queue])
+    return lines
+
+''' Builds the arrays used by the vectorized engine (see read_and_process_input_numpy), wrapping the ones of the input.
+    @param topics:    The topics, as arrays (t_ids, t_x, t_y) (see nearby_parse.read_input);
+    @param questions:    The questions, as arrays (q_ids, q_offsets, q_topics) (see nearby_parse.read_input);
+    @return: (t_ids, t_x, t_y, q_ids, q_topics)
+             The topics' ids and coordinates, the ids of the questions with at least one topic and the (Q, max{Qn})
+             matrix of their topics' indices (shorter rows are padded repeating their first topic).
+'''
+def build_arrays(topics, questions):
+    (t_ids, t_x, t_y) = [numpy_array(a) for a in topics]
+    (q_ids, q_offsets, q_topics) = [numpy_array(a) for a in questions]
+
+    #Index of each topic id in t_ids
+    order = np.argsort(t_ids, kind='mergesort')
+    topics_index = order[np.searchsorted(t_ids[order], q_topics)]
+
+    lengths = np.diff(q_offsets)
+    non_empty = lengths > 0
+    q_ids = q_ids[non_empty]
+    starts = q_offsets[:-1][non_empty, None]
+    lengths = lengths[non_empty, None]
+    Qn_max = int(lengths.max()) if len(lengths) > 0 else 1
+    columns = np.arange(Qn_max)[None, :]
+    q_topics = topics_index[starts + np.where(columns < lengths, columns, 0)].astype(np.intp)
+    return (t_ids, t_x, t_y, q_ids, q_topics)
+
+''' Wraps an array of the input (see nearby_parse) in a NumPy array, without copying it.
+'''
+def numpy_array(a):
+    dtype = np.float64 if a.typecode == 'd' else np.int_
+    if len(a) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.frombuffer(a, dtype=dtype)
+
+'''Reads the input from a file f and answers the queries in blocks, using NumPy.
+   The topics coordinates are stored in two arrays, and for each block of queries the distances of all the
+   topics from all the query points are computed at once; for the questions, a (Q, max{Qn}) matrix holds the
+   indices of their topics (shorter rows are padded repeating their first topic) so that the distance of every
+   question is a min reduction over the distance matrix.
+   Distances are euclidean, as in nearby_rtree.py, and the same 0.001 tolerance is applied.
+   @param f:    The file from which the input should be read;
+   @param jobs:    If different from 1, the queries are answered by this many worker processes
+                   (see nearby_parallel.run_sharded);
+   @param query_stats:    If not None, a QueryStats instance recording the counters and the wall time of every query
+                          (see answer_queries_numpy); the queries are then answered in this process.
+'''
+def read_and_process_input_numpy(f, jobs=1, query_stats=None):
+    (topics, questions, (q_types, n_res, x0, y0)) = nearby_parse.read_input(f)
+    (t_ids, t_x, t_y, q_ids, q_topics) = build_arrays(topics, questions)
+    N = len(q_types)
+    q_types = [q_type.lower() for q_type in q_types]
+    (x0, y0) = (numpy_array(x0), numpy_array(y0))
+
+    state = (t_ids, t_x, t_y, q_ids, q_topics, q_types, n_res, x0, y0)
+    if jobs != 1 and query_stats is None:
+        nearby_parallel.run_sharded(answer_queries_slice, state, N, jobs, stdout)
+    else:
+        for lines in answer_queries_numpy(state, 0, N, query_stats):
+            stdout.write(lines)
+
+    return
+
+''' Answers a range of queries with the vectorized engine, one block at the time.
+    @param state:    The arrays describing topics, questions and queries (see read_and_process_input_numpy);
+    @param start, stop:    The range of the queries to answer;
+    @param query_stats:    If not None, a QueryStats instance recording the counters of every query (see nearby_stats.py):
+                           each query computes the distance of every topic (and reduces the ones of every question's
+                           topics), and its wall time is its share of the time of its block;
+    @return:    A generator yielding the output of each block of queries, one line each.
+'''
+def answer_queries_numpy(state, start, stop, query_stats=None):
+    (t_ids, t_x, t_y, q_ids, q_topics, q_types, n_res, x0, y0) = state
+    (Q, Qn_max) = q_topics.shape
+    T = len(t_ids)
+
+    block_size = max(1, BLOCK_ELEMENTS // max(T, Q * Qn_max))
+    for block_start in xrange(start, stop, block_size):
+        if query_stats is not None:
+            block_time = time()
+        block_stop = min(stop, block_start + block_size)
+        dist = np.sqrt((t_x[None, :] - x0[block_start:block_stop, None]) ** 2 +
+                       (t_y[None, :] - y0[block_start:block_stop, None]) ** 2)
+
+        lines = [''] * (block_stop - block_start)
+        t_rows = [i for i in xrange(block_stop - block_start) if q_types[block_start + i] == 't']
+        q_rows = [i for i in xrange(block_stop - block_start) if q_types[block_start + i] == 'q']
+        if t_rows:
+            for (i, line) in zip(t_rows, select_top_k(dist[t_rows], t_ids, [n_res[block_start + i] for i in t_rows])):
+                lines[i] = line
+        if q_rows and Q > 0:
+            q_dist = dist[q_rows][:, q_topics].min(axis=2)
+            for (i, line) in zip(q_rows, select_top_k(q_dist, q_ids, [n_res[block_start + i] for i in q_rows])):
+                lines[i] = line
+        if query_stats is not None:
+            elapsed = (time() - block_time) / (block_stop - block_start)
+            for i in xrange(block_start, block_stop):
+                if q_types[i] == 't':
+                    query_stats.add('t', {'distances': T, 'unused': T - min(n_res[i], T)}, elapsed)
+                else:
+                    query_stats.add('q', {'distances': T, 'unused': Q - min(n_res[i], Q)}, elapsed)
+        lines.append('')
+        yield '\n'.join(lines)
+
+''' Answers a contiguous slice of the queries, in a worker process (see nearby_parallel.run_sharded).
+    @param (start, stop):    The range of the queries to answer;
+    @return:    The output for those queries, one line each.
+'''
+def answer_queries_slice((start, stop)):
+    return ''.join(answer_queries_numpy(nearby_parallel.shared_state, start, stop))
 
 
 ''' Main.
@@ -146,6 +265,53 @@ def read_and_process_input(f):
     Usage:
         -f filename     Specifies a file from where the input should be read. If the option is not used or misused or the requested file
                         doesn't exist, the input is read from stdin.
+        -j jobs         Answers the queries using jobs worker processes, each one taking a contiguous slice of the queries
+                        (0 means one for each CPU) [Default is 1]; requires NumPy.
+        -s filename     Records counters and wall time of every query, and writes their aggregates and percentiles to the file,
+                        as JSON if its name ends with .json, as CSV otherwise (see nearby_stats.py); -j is then ignored.
 '''
 if __name__ == '__main__':
-    read_and_process_input(stdin)
+
+    file_in = stdin
+    jobs = 1
+    stats_file = None
+
+    i = 1
+    while i < len(argv):
+        if (argv[i] == '-f'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -f: filename required'
+                break
+            try:
+                file_in = open(argv[i], 'r')
+            except:
+                print 'The requested file: {} does not exist. Please insert your input from the terminal.'.format(argv[i])
+                file_in = stdin
+        elif (argv[i] == '-j'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -j: int required'
+                break
+            try:
+                jobs = int(argv[i])
+            except:
+                print 'Error using -j option: queries will be answered sequentially'
+                jobs = 1
+        elif (argv[i] == '-s'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -s: filename required'
+                break
+            stats_file = argv[i]
+        i += 1
+
+    query_stats = QueryStats() if stats_file is not None else None
+    if np is not None:
+        read_and_process_input_numpy(file_in, jobs, query_stats)
+    else:
+        read_and_process_input(file_in, query_stats)
+    if query_stats is not None:
+        query_stats.write(stats_file)
+    if file_in != stdin:
+        file_in.close()
@@ -0,0 +1,156 @@
+'''
+@author: mlarocca
+Uniform grid engine for the t-type queries of the nearby challenge.
+Topics lie in a bounded square, so they can be bucketed in a uniform grid of square cells, sized so that each cell
+holds a few topics on average; a k-nearest neighbours search visits the cell of the query point and then the rings
+of cells around it, one ring at the time, until the k-th distance found (plus the tolerance) is shorter than the
+distance of the query point from the border of the searched block of cells.
+Unlike the SS-tree, building the grid takes a single linear pass (no sorting, no bounding spheres), and a query
+touches only the cells near the query point; on the other hand, strongly clustered topics leave most cells empty
+and crowd a few of them, which the SS-tree adapts to.
+'''
+from math import sqrt, floor
+from nearby_topk import BoundedTopK
+from nearby_stats import count
+
+#Average number of topics per cell
+TOPICS_PER_CELL = 2
+
+''' A uniform grid over the bounding box of the topics.
+    Cells are stored in compressed form: the topics are sorted by cell, and the topics in cell c are the ones
+    between cell_start[c] and cell_start[c+1] in the lists xs, ys and ids.
+'''
+class UniformGrid(object):
+
+    ''' Constructor
+        @param topics:    A list of tuples (t_id, x, y);
+        @param topics_per_cell:    The average number of topics per cell, used to choose the size of the cells.
+    '''
+    def __init__(self, topics, topics_per_cell=TOPICS_PER_CELL):
+        T = len(topics)
+        if T == 0:
+            self.x_min = self.y_min = 0.
+            self.cell_size = 1.
+            self.n_cols = self.n_rows = 1
+            self.cell_start = [0, 0]
+            self.xs = self.ys = self.ids = []
+            return
+
+        x_min = min([x for (t_id, x, y) in topics])
+        x_max = max([x for (t_id, x, y) in topics])
+        y_min = min([y for (t_id, x, y) in topics])
+        y_max = max([y for (t_id, x, y) in topics])
+        #Square cells, so that rings of cells are squares as well: each side gets about sqrt(T / topics_per_cell) cells
+        side = max(x_max - x_min, y_max - y_min)
+        n_cells_side = max(1, int(sqrt(float(T) / topics_per_cell)))
+        cell_size = side / n_cells_side
+        if cell_size <= 0.:
+            #All the topics in the same point
+            cell_size = 1.
+        self.x_min = x_min
+        self.y_min = y_min
+        self.cell_size = cell_size
+        self.n_cols = min(n_cells_side, int((x_max - x_min) / cell_size) + 1)
+        self.n_rows = min(n_cells_side, int((y_max - y_min) / cell_size) + 1)
+
+        #Counting sort of the topics by cell
+        n_cols = self.n_cols
+        cells = [self.__cell(x, y) for (t_id, x, y) in topics]
+        cell_start = [0] * (n_cols * self.n_rows + 1)
+        for (col, row) in cells:
+            cell_start[row * n_cols + col + 1] += 1
+        for c in xrange(1, len(cell_start)):
+            cell_start[c] += cell_start[c - 1]
+        position = cell_start[:-1]
+        xs = [0.] * T
+        ys = [0.] * T
+        ids = [0] * T
+        for i in xrange(T):
+            (col, row) = cells[i]
+            c = row * n_cols + col
+            pos = position[c]
+            position[c] = pos + 1
+            (ids[pos], xs[pos], ys[pos]) = topics[i]
+        self.cell_start = cell_start
+        self.xs = xs
+        self.ys = ys
+        self.ids = ids
+
+    ''' Returns the (column, row) of the cell containing a point, or of the closest cell if the point is outside the grid.
+    '''
+    def __cell(self, x, y):
+        col = int(floor((x - self.x_min) / self.cell_size))
+        row = int(floor((y - self.y_min) / self.cell_size))
+        return (min(self.n_cols - 1, max(0, col)), min(self.n_rows - 1, max(0, row)))
+
+    ''' k-nearest neighbours search for the topics closest to a point (t-type query), by ring expansion.
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of topics required (must be positive);
+        @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats):
+                         rings are counted as nodes and cells as leaves;
+        @return:    The ids of the n_res topics closest to (x0, y0), sorted by ascending distance and
+                    (for distances within 0.001) by descending id.
+    '''
+    def topics_knn(self, x0, y0, n_res, stats=None):
+        xs = self.xs
+        ys = self.ys
+        ids = self.ids
+        cell_start = self.cell_start
+        n_cols = self.n_cols
+        n_rows = self.n_rows
+        x_min = self.x_min
+        y_min = self.y_min
+        cell_size = self.cell_size
+        (col, row) = self.__cell(x0, y0)
+
+        top_k = BoundedTopK(n_res)
+        push = top_k.push
+        d_max = top_k.bound
+        #Counters, updated once per run of adjacent cells
+        cells_scanned = points_checked = 0
+
+        r = 0
+        while True:
+            #The cells of ring r, clipped to the grid: whole rows at the top and the bottom, and then the columns
+            #on the sides (without the corners)
+            c_min = max(0, col - r)
+            c_max = min(n_cols - 1, col + r)
+            ring = []
+            for rr in (row - r, row + r):
+                if 0 <= rr < n_rows:
+                    ring.append((rr * n_cols + c_min, rr * n_cols + c_max + 1))
+                if r == 0:
+                    break
+            for cc in (col - r, col + r):
+                if r > 0 and 0 <= cc < n_cols:
+                    for rr in xrange(max(0, row - r + 1), min(n_rows - 1, row + r - 1) + 1):
+                        c = rr * n_cols + cc
+                        ring.append((c, c + 1))
+
+            for (c_first, c_stop) in ring:
+                cells_scanned += c_stop - c_first
+                points_checked += cell_start[c_stop] - cell_start[c_first]
+                #Cells first..stop-1 are adjacent in the same row, so their topics are contiguous
+                for i in xrange(cell_start[c_first], cell_start[c_stop]):
+                    dist = sqrt((xs[i] - x0) ** 2 + (ys[i] - y0) ** 2)
+                    if dist <= d_max:
+                        d_max = push(dist, ids[i])
+
+            #Every topic not visited yet lies beyond one of the (unclipped) sides of the block of rings 0..r
+            lower_bound = float('inf')
+            if col - r > 0:
+                lower_bound = min(lower_bound, x0 - (x_min + (col - r) * cell_size))
+            if col + r < n_cols - 1:
+                lower_bound = min(lower_bound, x_min + (col + r + 1) * cell_size - x0)
+            if row - r > 0:
+                lower_bound = min(lower_bound, y0 - (y_min + (row - r) * cell_size))
+            if row + r < n_rows - 1:
+                lower_bound = min(lower_bound, y_min + (row + r + 1) * cell_size - y0)
+            if lower_bound == float('inf') or lower_bound > d_max:
+                break
+            r += 1
+
+        results = top_k.ids()
+        if stats is not None:
+            count(stats, r + 1, cells_scanned, points_checked, points_checked - len(results))
+        return results
@@ -0,0 +1,37 @@
+'''
+@author: mlarocca
+Sharded execution of the query phase of the nearby engines (nearby_rtree.py, nearby_fast.py).
+Queries are independent from each other once the index has been built, so the index is built once in the main process,
+and then a pool of worker processes is forked: each worker inherits the index (copy-on-write, no pickling is involved),
+gets a contiguous slice of the queries and returns its formatted result lines, which are written in the original order.
+'''
+from multiprocessing import Pool, cpu_count
+
+#State shared with the worker processes: set before the pool is forked, so that every worker inherits it
+shared_state = None
+
+''' Answers a list of queries using a pool of worker processes.
+    @param worker:    A module-level function taking a tuple (start, stop) and returning the output for the queries
+                      in that range as a single string (it can access the state through nearby_parallel.shared_state);
+    @param state:    The index and the queries, shared with the workers;
+    @param n_queries:    The total number of queries;
+    @param jobs:    The number of worker processes (if not positive, one for each CPU);
+    @param f_out:    The file where the results are written, in the same order as the queries.
+'''
+def run_sharded(worker, state, n_queries, jobs, f_out):
+    global shared_state
+
+    if jobs <= 0:
+        jobs = cpu_count()
+    slice_size = max(1, (n_queries + jobs - 1) // jobs)
+    slices = [(start, min(n_queries, start + slice_size)) for start in xrange(0, n_queries, slice_size)]
+
+    shared_state = state
+    pool = Pool(jobs)
+    try:
+        for lines in pool.imap(worker, slices):
+            f_out.write(lines)
+    finally:
+        pool.close()
+        pool.join()
+        shared_state = None
@@ -0,0 +1,218 @@
+'''
+@author: mlarocca
+Bulk loader of the input of the nearby engines (nearby.py, nearby_fast.py, nearby_rtree.py).
+The whole input is read at once and split on whitespace, and no regular expression is used: topics and queries
+take a fixed number of tokens each, so every field of a section is a strided slice of the tokens (f.i. the ids of
+the topics are one token every three), converted with a single map into a typed array ('l' for ids and numbers of
+results, 'd' for coordinates). Only the questions, whose lines have different lengths, are walked one at a time,
+and they are stored as flat arrays: the ids of the topics of all the questions, one after the other, and the offset
+where each question's topics start.
+The arrays can be wrapped by NumPy without copying them (numpy.frombuffer).
+stream_input reads only the topics and questions up front, and yields the queries one at a time as their lines
+arrive, for engines that answer them while the input is still being read (a callback run before each line is read
+lets them write the answers they hold before the read blocks).
+The engines then refer to each topic by its dense index, its position in the topics' arrays, instead of its id:
+dense_questions remaps the topics of the questions, and invert_questions builds the inverted lists of the questions
+of each topic with the same flat layout (offsets plus values), so that no dictionary is needed once the input is read.
+'''
+from array import array
+from itertools import izip, islice
+
+''' Reads the whole input.
+    The input is assumed to be formatted as follows:
+    First line: 3 integers T  Q  N
+    T lines composed by an integer and 2 doubles
+    Q lines composed by 2 integers q_id Qn and then another Qn integers
+    N lines composed by 1 char, 1 int and 2 doubles
+    Only the number of tokens matters, not how they are split on lines.
+    @param f:    The file from which the input should be read;
+    @return: (topics, questions, queries)
+             The topics, as arrays (t_ids, t_x, t_y), the questions, as arrays (q_ids, q_offsets, q_topics)
+             (see parse_questions) and the queries, as (q_types, n_res, x0, y0), where q_types is a list of strings.
+'''
+def read_input(f):
+    tokens = f.read().split()
+    #INVARIANT: the input is assumed well formed and adherent to the specs above
+    (T, Q, N) = [int(t) for t in tokens[:3]]
+    (topics, end) = parse_topics(tokens, 3, T)
+    (questions, end) = parse_questions(tokens, end, Q)
+    (queries, end) = parse_queries(tokens, end, N)
+    return (topics, questions, queries)
+
+''' Reads the topics and questions, leaving the queries to be read while they are answered.
+    The input is read one line at a time (no read-ahead), so the queries of a pipe are yielded as soon as they arrive,
+    and only the current line of the queries section is held in memory.
+    @param f:    The file from which the input should be read;
+    @param before_read:    A function with no arguments called before each line is read (f.i. to flush the output
+                           while a pipe may block), or None;
+    @return: (topics, questions, queries)
+             The topics and questions, as in read_input, and a generator yielding the queries, as tuples
+             (q_type, n_res, x0, y0) (see iter_queries).
+'''
+def stream_input(f, before_read=None):
+    tokens = iter_tokens(f, before_read)
+    (T, Q, N) = [int(t) for t in islice(tokens, 3)]
+    topics = parse_topics(list(islice(tokens, 3 * T)), 0, T)[0]
+
+    questions_tokens = []
+    for i in xrange(Q):
+        head = list(islice(tokens, 2))
+        questions_tokens.extend(head)
+        questions_tokens.extend(islice(tokens, int(head[1])))
+    questions = parse_questions(questions_tokens, 0, Q)[0]
+    return (topics, questions, iter_queries(tokens, N))
+
+''' Splits a file in its tokens, reading one line at a time.
+    @param f:    The file to read;
+    @param before_read:    A function with no arguments called before each line is read, or None;
+    @return:    A generator yielding the tokens, as strings.
+'''
+def iter_tokens(f, before_read=None):
+    while True:
+        if before_read is not None:
+            before_read()
+        line = f.readline()
+        if not line:
+            return
+        for token in line.split():
+            yield token
+
+''' Converts the queries section of the input as its tokens are read.
+    @param tokens:    An iterator over the tokens of the input, positioned at the start of the section;
+    @param N:    The number of queries;
+    @return:    A generator yielding the queries, as tuples (q_type, n_res, x0, y0).
+'''
+def iter_queries(tokens, N):
+    for i in xrange(N):
+        (q_type, n_res, x0, y0) = islice(tokens, 4)
+        yield (q_type, int(n_res), float(x0), float(y0))
+
+''' Reads the queries left in a file, for callers that have read the rest of the input line by line.
+    @param f:    The file from which the queries should be read;
+    @param N:    The number of queries;
+    @return:    The queries, as (q_types, n_res, x0, y0) (see parse_queries).
+'''
+def read_queries(f, N):
+    return parse_queries(f.read().split(), 0, N)[0]
+
+''' Converts the topics section of the input.
+    @param tokens:    The tokens of the input;
+    @param start:    The index of the first token of the section;
+    @param T:    The number of topics;
+    @return: ((t_ids, t_x, t_y), end)
+             The arrays of the ids and coordinates of the topics, and the index of the first token after the section.
+'''
+def parse_topics(tokens, start, T):
+    end = start + 3 * T
+    t_ids = array('l', map(int, tokens[start:end:3]))
+    t_x = array('d', map(float, tokens[start + 1:end:3]))
+    t_y = array('d', map(float, tokens[start + 2:end:3]))
+    return ((t_ids, t_x, t_y), end)
+
+''' Converts the questions section of the input.
+    The lines are walked once, converting only the number of topics of each question to find where the next one
+    starts; all the ids are then converted at once, and the topics of each question sliced from them.
+    @param tokens:    The tokens of the input;
+    @param start:    The index of the first token of the section;
+    @param Q:    The number of questions;
+    @return: ((q_ids, q_offsets, q_topics), end)
+             The array of the ids of the questions (all of them, including the ones with no topic), the array of the
+             Q + 1 offsets in q_topics where the topics of each question start (the topics of the i-th question are
+             q_topics[q_offsets[i]:q_offsets[i+1]]), the array of the ids of the topics of all the questions, and the
+             index of the first token after the section.
+'''
+def parse_questions(tokens, start, Q):
+    heads = []
+    end = start
+    for i in xrange(Q):
+        heads.append(end - start)
+        end += int(tokens[end + 1]) + 2
+    values = map(int, tokens[start:end])
+
+    q_ids = array('l', [values[h] for h in heads])
+    q_offsets = array('l', [0]) * (Q + 1)
+    q_topics = array('l')
+    for i in xrange(Q):
+        h = heads[i]
+        q_topics.extend(values[h + 2:h + 2 + values[h + 1]])
+        q_offsets[i + 1] = len(q_topics)
+    return ((q_ids, q_offsets, q_topics), end)
+
+''' Converts the queries section of the input.
+    @param tokens:    The tokens of the input;
+    @param start:    The index of the first token of the section;
+    @param N:    The number of queries;
+    @return: ((q_types, n_res, x0, y0), end)
+             The list of the types of the queries (as they are in the input, 't' or 'q'), the arrays of their numbers
+             of results and coordinates, and the index of the first token after the section.
+'''
+def parse_queries(tokens, start, N):
+    end = start + 4 * N
+    q_types = tokens[start:end:4]
+    n_res = array('l', map(int, tokens[start + 1:end:4]))
+    x0 = array('d', map(float, tokens[start + 2:end:4]))
+    y0 = array('d', map(float, tokens[start + 3:end:4]))
+    return ((q_types, n_res, x0, y0), end)
+
+''' Remaps the topics of the questions from their ids to their dense indices, dropping the questions with no topic.
+    @param topics:    The topics, as returned by read_input;
+    @param questions:    The questions, as returned by read_input;
+    @return: (q_ids, q_offsets, q_topics)
+             The questions with at least one topic, in the same layout as in read_input, but with q_topics holding
+             the indices of the topics in the topics' arrays.
+'''
+def dense_questions(topics, questions):
+    (q_ids, q_offsets, q_topics) = questions
+    index = dict(izip(topics[0], xrange(len(topics[0]))))
+    non_empty = [i for i in xrange(len(q_ids)) if q_offsets[i + 1] > q_offsets[i]]
+    #The questions dropped have no topic, so the offsets of the others' topics do not change
+    return (array('l', [q_ids[i] for i in non_empty]), array('l', [0] + [q_offsets[i + 1] for i in non_empty]),
+            array('l', [index[t_id] for t_id in q_topics]))
+
+''' Builds the inverted lists of the questions for which each topic is relevant (counting sort of the links).
+    @param questions:    The questions, as returned by dense_questions;
+    @param T:    The number of topics;
+    @return: (t_offsets, t_questions)
+             The array of the T + 1 offsets in t_questions where the questions of each topic start, and the array
+             of the ids of the questions of all the topics: the questions of the topic with index i are
+             t_questions[t_offsets[i]:t_offsets[i+1]], in the same order as in the input.
+'''
+def invert_questions(questions, T):
+    (q_ids, q_offsets, q_topics) = questions
+    t_offsets = array('l', [0]) * (T + 1)
+    for t in q_topics:
+        t_offsets[t + 1] += 1
+    for t in xrange(T):
+        t_offsets[t + 1] += t_offsets[t]
+
+    t_questions = array('l', [0]) * len(q_topics)
+    position = t_offsets[:-1]
+    for i in xrange(len(q_ids)):
+        q_id = q_ids[i]
+        for t in q_topics[q_offsets[i]:q_offsets[i + 1]]:
+            t_questions[position[t]] = q_id
+            position[t] += 1
+    return (t_offsets, t_questions)
+
+''' Lists the topics.
+    @param topics:    The topics, as returned by read_input;
+    @return:    The list of the topics, as tuples (t_id, x, y).
+'''
+def topics_list(topics):
+    return zip(*topics)
+
+''' Lists the questions with at least one topic.
+    @param questions:    The questions, as returned by read_input;
+    @return:    The list of the questions with at least one topic, as tuples (q_id, Qids), Qids being a list.
+'''
+def questions_list(questions):
+    (q_ids, q_offsets, q_topics) = questions
+    return [(q_ids[i], q_topics[q_offsets[i]:q_offsets[i + 1]].tolist())
+            for i in xrange(len(q_ids)) if q_offsets[i + 1] > q_offsets[i]]
+
+''' Lists the queries.
+    @param queries:    The queries, as returned by read_input;
+    @return:    The list of the queries, as tuples (q_type, n_res, x0, y0).
+'''
+def queries_list(queries):
+    return zip(*queries)
@@ -1,820 +1,2325 @@
-import re
+import os
+import mmap
 #from math import sqrt
-from sys import stdin
+from sys import stdin, stdout, stderr, argv
+from math import sqrt, ceil
+from operator import attrgetter
+from itertools import izip
 from array import array
-from math import sqrt
-
-INTEGER_RE = "(\d+)"            #Matches any non negative integer
-DOUBLE_RE = "(\d+\.\d*)"        #INVARIANT: x,y positive => reg exp supporting negative floating points "([-]?\d+\.\d*)" not needed
-SEPARATOR = ' '                 #We consider just spaces as separators
-#Regular expression for a topic
-TOPIC_REGEXP = INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
-#Regular expression for a query
-QUERY_REGEXP = '([a-zA-Z]{1})' + SEPARATOR +  INTEGER_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + DOUBLE_RE + SEPARATOR + '*'
+from heapq import heappush, heappop
+from struct import Struct, pack
+from hashlib import sha1
+from time import time
+import nearby_parallel
+import nearby_grid
+import nearby_parse
+from nearby_topk import BoundedTopK, IndexedTopK, sort_results, TOLERANCE
+from nearby_stats import QueryStats, count
+from nearby_cache import QueryCache, cached_answer, cached_answer_pair
 
 #DEBUG
 #file_out = open('nearby_results.txt', 'w')
 #file_log = open('nearby_debug.txt', 'w')
    
-'''Reads the input from a file f
-   The input is assumed to be formatted as follows:
-   First line: 3 integers T  Q  N
-   T lines composed by an integer and 2 doubles
-   Q lines composed by 2 integers q_id Qn and then another Qn integers
-   N lines composed by 1 char, 1 int and 2 doubles
-   @param f:    The file from which the input should be read;
-   @return: (topics, questions, queries)
-           Three lists containing the topics, questions and queries read from the input channel.
+#Maximum number of points or children for each topic
+MAX_ELEMENTS_PER_CLUSTER = 16
+SPLIT_SIZE = MAX_ELEMENTS_PER_CLUSTER / 2
+
+''' A point (topic) stored in the leaves of a SS-tree.
+    Points and nodes are allocated by the hundreds of thousands, so both classes use __slots__ instead of a
+    per-instance dictionary: each instance takes a fraction of the memory of the equivalent dict, and attribute
+    access in the search loops avoids hashing string keys.
 '''
-def read_and_process_input(f):
-    line = f.readline()
+class SSPoint(object):
+    __slots__ = ('x', 'y', 't_id', 'index')
 
-    regex = re.compile(INTEGER_RE)  #Regular Expression for integers
-    #INVARIANT: the input is assumed well formed and adherent to the specs above
-    [T,Q,N]  = regex.findall(line)
-    
-    T = int(T)
-    Q = int(Q)
-    N = int(N)
+    ''' Constructor
+        @param x:    Point's x coordinate;
+        @param y:    Point's y coordinate;
+        @param t_id:    The topic's ID;
+        @param index:    The topic's dense index, its position in the arrays of the topics read from the input
+                         (see nearby_parse.dense_questions), or None for the topics of a NearbyIndex.
+    '''
+    def __init__(self, x, y, t_id, index=None):
+        self.x = x
+        self.y = y
+        self.t_id = t_id
+        self.index = index
 
-    topics = {}
-    questions = []
+''' A node of a SS-tree: a leaf holds a list of points, an intermediate node a list of children nodes;
+    in both cases (x, y) is the centroid and radius the radius of the bounding sphere of the whole subtree.
+'''
+class SSNode(object):
+    __slots__ = ('leaf', 'points', 'children', 'parent', 'x', 'y', 'radius', 'x_var', 'y_var')
 
-    #Maximum number of points or children for each topic
-    max_elements_per_cluster = 16
-    split_size = max_elements_per_cluster / 2
+    ''' Constructor
+        @param leaf:    True iff the node is a leaf;
+        @param entries:    The list of points (for a leaf) or of children nodes (for an intermediate node).
+    '''
+    def __init__(self, leaf, entries):
+        self.leaf = leaf
+        if leaf:
+            self.points = entries
+            self.children = None
+        else:
+            self.points = None
+            self.children = entries
+        self.parent = None
+        self.x = self.y = 0.
+        self.radius = 0.
+        self.x_var = self.y_var = 0.
 
+''' A leaf of the questions index: its points are the topics relevant for the question, so the leaf's bounding sphere
+    is the bounding sphere of the question itself.
+'''
+class SSQuestionNode(SSNode):
+    __slots__ = ('q_id',)
 
-    ''' Creates the empty root of an SS-tree.
-        @return:     The newly created tree root.
+    ''' Constructor
+        @param q_id:    The question's ID;
+        @param points:    The (non empty) list of the points of the topics relevant for the question.
     '''
-    def ss_make_tree():
-        tree = {'points': [], 'leaf':True, 'parent': None, 'x':0., 'y':0.}
-        return tree
+    def __init__(self, q_id, points):
+        SSNode.__init__(self, True, points)
+        self.q_id = q_id
+
+
+''' Creates the empty root of an SS-tree.
+    @return:     The newly created tree root.
+'''
+def ss_make_tree():
+    tree = SSNode(True, [])
+    return tree
+
+
+''' Inserts a point (topic) in a SS-tree; If necessary, splits the tree node in which the point was inserted
+    and fixes the tree structure from that node up to the root.
     
+    @param new_point:   The point to be inserted;
+                        The point must be an SSPoint instance.
+    @param tree:    The root of the tree in which the point is going to be inserted;
+    @return tree:    The root of the tree, possibly a new one if the old root has been split.
+'''
+def ss_tree_insert(new_point, tree):
+    x_new_point = new_point.x
+    y_new_point = new_point.y
     
-    ''' Inserts a point (topic) in a SS-tree; If necessary, splits the tree node in which the point was inserted
-        and fixes the tree structure from that node up to the root.
-        
-        @param new_point:   The point to be inserted;
-                            The point must be a dictionary with three fields:
-                            -    'x':    Point's x coordinate;
-                            -    'y':    Point's y coordinate;
-                            -    't_id':    The topic's ID.
-        @param tree:    The root of the tree in which the point is going to be inserted;
-        @return tree:    The root of the tree, possibly a new one if the old root has been split.
-    '''
-    def ss_tree_insert(new_point, tree):
-        x_new_point = new_point['x']
-        y_new_point = new_point['y']
+    #Looks for the right leaf (the one with the closest centroid) to which the new_point should be added.
+    #INVARIANT:    The empty tree's root is a (empty) leaf.
+    node = tree
+    while not node.leaf:
+        children = node.children
+        child = children[0]
+        min_dist = (child.x - x_new_point) ** 2 + (child.y - y_new_point) ** 2
+        min_index = 0
+        for i in range(1,len(children)):
+            child = children[i]
+            dist = (child.x - x_new_point) ** 2 + (child.y - y_new_point) ** 2
+            if dist < min_dist:
+                min_index = i
+                min_dist = dist
+        node = children[min_index]
         
-        #Looks for the right leaf (the one with the closest centroid) to which the new_point should be added.
-        #INVARIANT:    The empty tree's root is a (empty) leaf.
-        node = tree
-        while not node['leaf']:
-            children = node['children']
-            child = children[0]
-            min_dist = (child['x'] - x_new_point) ** 2 + (child['y'] - y_new_point) ** 2
-            min_index = 0
-            for i in range(1,len(children)):
-                child = children[i]
-                dist = (child['x'] - x_new_point) ** 2 + (child['y'] - y_new_point) ** 2
-                if dist < min_dist:
-                    min_index = i
-                    min_dist = dist
-            node = children[min_index]
-            
 
-        #Now adds the new point to the leaf it has found.
+    #Now adds the new point to the leaf it has found.
+    
+    #INVARIANT: node is a leaf
+    points = node.points
+    if len(points) < MAX_ELEMENTS_PER_CLUSTER:
+        #No split neeeded to add the point to this node
         
-        #INVARIANT: node is a leaf
-        points = node['points']
-        if len(points) < max_elements_per_cluster:
-            #No split neeeded to add the point to this node
-            
-            #Can add the new_point to this node
-            old_x_node = x_node = node['x']
-            old_y_node = y_node = node['y']     
+        #Can add the new_point to this node
+        old_x_node = x_node = node.x
+        old_y_node = y_node = node.y     
+        
+        #Compute the new centroid for the node
+        n_p = len(points)
+        x_node *= n_p
+        y_node *= n_p
+        x_node += x_new_point
+        y_node += y_new_point
+        points.append(new_point)
+        n_p += 1
+        x_node /= n_p
+        y_node /= n_p
+        node.x = x_node
+        node.y = y_node
             
-            #Compute the new centroid for the node
+        #Compute node's radius and variance      
+        radius = 0.
+        x_var = y_var = 0.
+        for point in points:
+            #INVARIANT: points don't have radius
+            x_dist = (x_node - point.x) ** 2
+            y_dist = (y_node - point.y) ** 2
+            radius = max(radius, x_dist + y_dist)
+            #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
+            x_var = max(x_var, x_dist)
+            y_var = max(y_var, y_dist)
+        node.radius = sqrt(radius)
+        node.x_var = x_var
+        node.y_var = y_var
+        
+        #Propagates the change all the way to the root
+        node_parent = node.parent
+        while node_parent != None:
+            tmp_x = x_node_parent = node_parent.x
+            tmp_y = y_node_parent = node_parent.y 
+            n_p = len(node_parent.children)
+            x_node_parent *= n_p
+            y_node_parent *= n_p
+            x_node_parent += x_node - old_x_node
+            y_node_parent += y_node - old_y_node
+            old_x_node = tmp_x
+            old_y_node = tmp_y
+            x_node_parent /= n_p
+            y_node_parent /= n_p   
+            node_parent.x = x_node_parent
+            node_parent.y = y_node_parent 
+                                       
+            radius = 0.
+            x_var = y_var = 0.
+            for child_node in node_parent.children:
+                x_dist = (x_node_parent - child_node.x) ** 2
+                y_dist = (y_node_parent - child_node.y) ** 2
+                radius = max(radius, sqrt(x_dist + y_dist) + child_node.radius)                  
+                #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
+                x_var = max(x_var, x_dist + child_node.radius ** 2)
+                y_var = max(y_var, y_dist + child_node.radius ** 2)
+           
+            node_parent.radius = radius
+            node_parent.x_var = x_var
+            node_parent.y_var = y_var
+                                            
+            node = node_parent
+            node_parent = node.parent
+    else:
+        #len(children) == MAX_ELEMENTS_PER_CLUSTER => The leaf must be split
+        
+        #Splits along the direction with highest variance
+        if node.x_var >= node.y_var:
+            points.sort(key=attrgetter('x'))
+        else:
+            points.sort(key=attrgetter('y'))
+        
+        #The new nodes have exactly half the elements of the old one
+        new_node_1 = SSNode(True, points[:SPLIT_SIZE])
+        new_node_2 = SSNode(True, points[SPLIT_SIZE:])
+    
+        
+        #Compute the centroids for the new nodes
+        for new_node in [new_node_1, new_node_2]:
+            points = new_node.points
+            x_node = 0.
+            y_node = 0.
+            for point in points: 
+                x_node += point.x
+                y_node += point.y
             n_p = len(points)
-            x_node *= n_p
-            y_node *= n_p
-            x_node += x_new_point
-            y_node += y_new_point
-            points.append(new_point)
-            n_p += 1
             x_node /= n_p
             y_node /= n_p
-            node['x'] = x_node
-            node['y'] = y_node
-                
-            #Compute node's radius and variance      
+            
+            new_node.x = x_node
+            new_node.y = y_node
+
+        #Adds the new point to the one of the two new nodes that is closest to the old centroid
+        x_node = node.x
+        y_node = node.y
+        dist_1 = (x_node - new_node_1.x) ** 2 + (y_node - new_node_1.y) ** 2 
+        dist_2 = (x_node - new_node_2.x) ** 2 + (y_node - new_node_2.y) ** 2
+        
+        if (dist_1 > dist_2):
+            new_node = new_node_2
+            new_node_2 = new_node_1
+            new_node_1 = new_node
+        
+        #INVARIANT: at this point new_node_1 is the one of the two new nodes closest to the old node's centroid
+        #Adds the new point to new_node_1
+        points = new_node_1.points       
+        n_p = len(points)  
+        #Updates new_node_1's centroid
+        x_node = new_node_1.x
+        y_node = new_node_1.y
+        x_node *= n_p
+        y_node *= n_p            
+        x_node += new_point.x
+        y_node += new_point.y
+        points.append(new_point)
+        n_p += 1
+        new_node_1.x = x_node / n_p
+        new_node_1.y = y_node / n_p
+                    
+        #Compute the radius of the new nodes
+        for new_node in [new_node_1, new_node_2]:
+            
+            x_node = new_node.x
+            y_node = new_node.y
+            
             radius = 0.
             x_var = y_var = 0.
-            for point in points:
-                #INVARIANT: points don't have radius
-                x_dist = (x_node - point['x']) ** 2
-                y_dist = (y_node - point['y']) ** 2
+            for point in new_node.points:
+                #INVARIANT: point don't have radius
+                x_dist = (x_node - point.x) ** 2
+                y_dist = (y_node - point.y) ** 2
                 radius = max(radius, x_dist + y_dist)
                 #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
                 x_var = max(x_var, x_dist)
                 y_var = max(y_var, y_dist)
-            node['radius'] = sqrt(radius)
-            node['x_var'] = x_var
-            node['y_var'] = y_var
-            
-            #Propagates the change all the way to the root
-            node_parent = node['parent']
-            while node_parent != None:
-                tmp_x = x_node_parent = node_parent['x']
-                tmp_y = y_node_parent = node_parent['y'] 
-                n_p = len(node_parent['children'])
-                x_node_parent *= n_p
-                y_node_parent *= n_p
-                x_node_parent += x_node - old_x_node
-                y_node_parent += y_node - old_y_node
-                old_x_node = tmp_x
-                old_y_node = tmp_y
-                x_node_parent /= n_p
-                y_node_parent /= n_p   
-                node_parent['x'] = x_node_parent
-                node_parent['y'] = y_node_parent 
-                                           
-                radius = 0.
-                x_var = y_var = 0.
-                for child_node in node_parent['children']:
-                    x_dist = (x_node_parent - child_node['x']) ** 2
-                    y_dist = (y_node_parent - child_node['y']) ** 2
-                    radius = max(radius, sqrt(x_dist + y_dist) + child_node['radius'])                  
-                    #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
-                    x_var = max(x_var, x_dist + child_node['radius'] ** 2)
-                    y_var = max(y_var, y_dist + child_node['radius'] ** 2)
-               
-                node_parent['radius'] = radius
-                node_parent['x_var'] = x_var
-                node_parent['y_var'] = y_var
-                                                
-                node = node_parent
-                node_parent = node['parent']
-        else:
-            #len(children) == max_elements_per_cluster => The leaf must be split
-            
-            #Splits along the direction with highest variance
-            if node['x_var'] >= node['y_var']:
-                points.sort(key=lambda p: p['x'])
-            else:
-                points.sort(key=lambda p: p['y'])
-            
-            #The new nodes have exactly half the elements of the old one
-            new_node_1 = {'points': points[:split_size], 'leaf': True}
-            new_node_2 = {'points': points[split_size:], 'leaf': True}          
-        
-            
-            #Compute the centroids for the new nodes
-            for new_node in [new_node_1, new_node_2]:
-                points = new_node['points']
-                x_node = 0.
-                y_node = 0.
-                for point in points: 
-                    x_node += point['x']
-                    y_node += point['y']
-                n_p = len(points)
-                x_node /= n_p
-                y_node /= n_p
                 
-                new_node['x'] = x_node
-                new_node['y'] = y_node
-    
-            #Adds the new point to the one of the two new nodes that is closest to the old centroid
-            x_node = node['x']
-            y_node = node['y']
-            dist_1 = (x_node - new_node_1['x']) ** 2 + (y_node - new_node_1['y']) ** 2 
-            dist_2 = (x_node - new_node_2['x']) ** 2 + (y_node - new_node_2['y']) ** 2
-            
-            if (dist_1 > dist_2):
-                new_node = new_node_2
-                new_node_2 = new_node_1
-                new_node_1 = new_node
-            
-            #INVARIANT: at this point new_node_1 is the one of the two new nodes closest to the old node's centroid
-            #Adds the new point to new_node_1
-            points = new_node_1['points']       
-            n_p = len(points)  
-            #Updates new_node_1's centroid
-            x_node = new_node_1['x']
-            y_node = new_node_1['y']
-            x_node *= n_p
-            y_node *= n_p            
-            x_node += new_point['x']
-            y_node += new_point['y']
-            points.append(new_point)
-            n_p += 1
-            new_node_1['x'] = x_node / n_p
-            new_node_1['y'] = y_node / n_p
-                        
-            #Compute the radius of the new nodes
-            for new_node in [new_node_1, new_node_2]:
-                
-                x_node = new_node['x']
-                y_node = new_node['y']
-                
-                radius = 0.
-                x_var = y_var = 0.
-                for point in new_node['points']:
-                    #INVARIANT: point don't have radius
-                    x_dist = (x_node - point['x']) ** 2
-                    y_dist = (y_node - point['y']) ** 2
-                    radius = max(radius, x_dist + y_dist)
-                    #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
-                    x_var = max(x_var, x_dist)
-                    y_var = max(y_var, y_dist)
-                    
-                new_node['radius'] = sqrt(radius)
-                new_node['x_var'] = x_var
-                new_node['y_var'] = y_var      
-                                
+            new_node.radius = sqrt(radius)
+            new_node.x_var = x_var
+            new_node.y_var = y_var      
+                            
+        
+        #INVARIANT: at this new_point new_node_1 is the closest to the centroid of node, so it takes its place among the
+        #childrens of its parent
+        node_parent = node.parent
+        
+        if node_parent == None:
+            #The node that has just been split was the root: so it must create a new root...
+            tree = SSNode(False, [new_node_1, new_node_2])
+            tree.x = (new_node_1.x + new_node_2.x)/2
+            tree.y = (new_node_1.y + new_node_2.y)/2
+            x_dist_1 = (new_node_1.x - tree.x) ** 2
+            x_dist_2 = (new_node_2.x - tree.x) ** 2
+            y_dist_1 = (new_node_1.y - tree.y) ** 2
+            y_dist_2 = (new_node_2.y - tree.y) ** 2                                
+            tree.radius = max(sqrt(x_dist_1 + y_dist_1) + new_node_1.radius,
+                                 sqrt(x_dist_2 + y_dist_2) + new_node_2.radius)
+            tree.x_var = max(x_dist_1 + new_node_1.radius ** 2, 
+                                x_dist_2 + new_node_2.radius ** 2)
+            tree.y_var = max(y_dist_1 + new_node_1.radius ** 2,
+                                y_dist_2 + new_node_2.radius ** 2)
             
-            #INVARIANT: at this new_point new_node_1 is the closest to the centroid of node, so it takes its place among the
-            #childrens of its parent
-            node_parent = node['parent']
+            new_node_1.parent = new_node_2.parent = tree
             
-            if node_parent == None:
-                #The node that has just been split was the root: so it must create a new root...
-                tree = {'children': [new_node_1, new_node_2], 'leaf':False, 'parent': None, 
-                        'x': (new_node_1['x'] + new_node_2['x'])/2,
-                        'y': (new_node_1['y'] + new_node_2['y'])/2}
-                x_dist_1 = (new_node_1['x'] - tree['x']) ** 2
-                x_dist_2 = (new_node_2['x'] - tree['x']) ** 2
-                y_dist_1 = (new_node_1['y'] - tree['y']) ** 2
-                y_dist_2 = (new_node_2['y'] - tree['y']) ** 2                                
-                tree['radius'] = max(sqrt(x_dist_1 + y_dist_1) + new_node_1['radius'],
-                                     sqrt(x_dist_2 + y_dist_2) + new_node_2['radius'])
-                tree['x_var'] = max(x_dist_1 + new_node_1['radius'] ** 2, 
-                                    x_dist_2 + new_node_2['radius'] ** 2)
-                tree['y_var'] = max(y_dist_1 + new_node_1['radius'] ** 2,
-                                    y_dist_2 + new_node_2['radius'] ** 2)
-                
-                new_node_1['parent'] = new_node_2['parent'] = tree
+            #... and return it
+            return tree                  
+        else:
+            #Replaces the old node (the one just split) with the closest of the newly created
+            new_node_1.parent = node_parent
+      
+            node_parent.children.remove(node)
+            node_parent.children.append(new_node_1)
+        
+
+            while node_parent != None:
+                node = node_parent
+                children = node.children
                 
-                #... and return it
-                return tree                  
-            else:
-                #Replaces the old node (the one just split) with the closest of the newly created
-                new_node_1['parent'] = node_parent
-          
-                node_parent['children'].remove(node)
-                node_parent['children'].append(new_node_1)
-            
-    
-                while node_parent != None:
-                    node = node_parent
-                    children = node['children']
+                #Checks if there is still a node resulting from the split of one of its children
+                #INVARIANT:    new_node_2 is the farthest of the two resulting node from the split
+                if new_node_2:
                     
-                    #Checks if there is still a node resulting from the split of one of its children
-                    #INVARIANT:    new_node_2 is the farthest of the two resulting node from the split
-                    if new_node_2:
+                    if len(children) < MAX_ELEMENTS_PER_CLUSTER:
+                        #No need for farther splits: just append the new node
+                        children.append(new_node_2)
+                        new_node_2.parent = node
+                        new_node_2 = None                   
+                    else:
+                        #Must split this node too
+                        old_node = new_node_2
                         
-                        if len(children) < max_elements_per_cluster:
-                            #No need for farther splits: just append the new node
-                            children.append(new_node_2)
-                            new_node_2['parent'] = node
-                            new_node_2 = None                   
+                        #Split the children along the axes with the biggest variance
+                        if node.x_var >= node.y_var:
+                            children.sort(key=attrgetter('x'))
                         else:
-                            #Must split this node too
-                            old_node = new_node_2
+                            children.sort(key=attrgetter('y'))                            
                             
-                            #Split the children along the axes with the biggest variance
-                            if node['x_var'] >= node['y_var']:
-                                children.sort(key=lambda p: p['x'])
-                            else:
-                                children.sort(key=lambda p: p['y'])                            
-                                
-                            new_children = children[:split_size]
-                            new_node_1 = {'children': new_children, 'leaf': node['leaf']}
-                            for child in new_children:
-                                child['parent'] = new_node_1
-
-                            new_children = children[split_size:]
-                            new_node_2 = {'children': new_children, 'leaf': node['leaf']}
-                            for child in new_children:
-                                child['parent'] = new_node_2                         
-                           
-                            #Compute the centroids
-                            for new_node in [new_node_1, new_node_2]:
-                                x_node = 0.
-                                y_node = 0.
-                                for child in new_node['children']: 
-                                    x_node += child['x']
-                                    y_node += child['y']
-                                n_p = len(new_node['children'])
-                                new_node['x'] = x_node / n_p
-                                new_node['y'] = y_node / n_p
-
-                            #Finds the one of the new nodes closest to the original centroid  
-                            dist_1 = (node['x'] - new_node_1['x']) ** 2 + (node['y'] - new_node_1['y']) ** 2 
-                            dist_2 = (node['x'] - new_node_2['x']) ** 2 + (node['y'] - new_node_2['y']) ** 2
+                        new_children = children[:SPLIT_SIZE]
+                        new_node_1 = SSNode(node.leaf, new_children)
+                        for child in new_children:
+                            child.parent = new_node_1
+
+                        new_children = children[SPLIT_SIZE:]
+                        new_node_2 = SSNode(node.leaf, new_children)
+                        for child in new_children:
+                            child.parent = new_node_2                         
+                       
+                        #Compute the centroids
+                        for new_node in [new_node_1, new_node_2]:
+                            x_node = 0.
+                            y_node = 0.
+                            for child in new_node.children: 
+                                x_node += child.x
+                                y_node += child.y
+                            n_p = len(new_node.children)
+                            new_node.x = x_node / n_p
+                            new_node.y = y_node / n_p
+
+                        #Finds the one of the new nodes closest to the original centroid  
+                        dist_1 = (node.x - new_node_1.x) ** 2 + (node.y - new_node_1.y) ** 2 
+                        dist_2 = (node.x - new_node_2.x) ** 2 + (node.y - new_node_2.y) ** 2
+                        
+                        if (dist_1 > dist_2):
+                            new_node = new_node_2
+                            new_node_2 = new_node_1
+                            new_node_1 = new_node   
                             
-                            if (dist_1 > dist_2):
-                                new_node = new_node_2
-                                new_node_2 = new_node_1
-                                new_node_1 = new_node   
-                                
-                            #INVARIANT:    At this point new_node_1 is the one of two nodes resulting from the split
-                            #                closest to the orginal centroid
-                            n_p = len(new_node_1['children'])
-                            new_node_1['children'].append(old_node)
-                            old_node['parent'] = new_node_1
+                        #INVARIANT:    At this point new_node_1 is the one of two nodes resulting from the split
+                        #                closest to the orginal centroid
+                        n_p = len(new_node_1.children)
+                        new_node_1.children.append(old_node)
+                        old_node.parent = new_node_1
+                        
+                        x_node = new_node_1.x
+                        y_node = new_node_1.y
+                        x_node *= n_p
+                        y_node *= n_p
+                        x_node += old_node.x
+                        y_node += old_node.y
+                        n_p += 1
+                        new_node_1.x = x_node / n_p
+                        new_node_1.y = y_node / n_p
+                        
+                        #Compute the radiuses and the variances
+                        for new_node in [new_node_1, new_node_2]:
+
+                            x_node = new_node.x
+                            y_node = new_node.y
                             
-                            x_node = new_node_1['x']
-                            y_node = new_node_1['y']
-                            x_node *= n_p
-                            y_node *= n_p
-                            x_node += old_node['x']
-                            y_node += old_node['y']
-                            n_p += 1
-                            new_node_1['x'] = x_node / n_p
-                            new_node_1['y'] = y_node / n_p
+                            radius = 0.
+                            x_var = y_var = 0.
                             
-                            #Compute the radiuses and the variances
-                            for new_node in [new_node_1, new_node_2]:
-
-                                x_node = new_node['x']
-                                y_node = new_node['y']
-                                
-                                radius = 0.
-                                x_var = y_var = 0.
-                                
-                                for child_node in new_node['children']:
-                                    x_dist = (x_node - child_node['x']) ** 2
-                                    y_dist = (y_node - child_node['y']) ** 2
-                                    radius = max(radius, sqrt(x_dist  + y_dist) + child_node['radius'])  
-                                    #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
-                                    x_var = max(x_var, x_dist + child_node['radius'] ** 2)
-                                    y_var = max(y_var, y_dist + child_node['radius'] ** 2)
-                                
-                                new_node['radius'] = radius
-                                new_node['x_var'] = x_var
-                                new_node['y_var'] = y_var  
+                            for child_node in new_node.children:
+                                x_dist = (x_node - child_node.x) ** 2
+                                y_dist = (y_node - child_node.y) ** 2
+                                radius = max(radius, sqrt(x_dist  + y_dist) + child_node.radius)  
+                                #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
+                                x_var = max(x_var, x_dist + child_node.radius ** 2)
+                                y_var = max(y_var, y_dist + child_node.radius ** 2)
                             
-                            #Checks whether the root has been split                            
-                            node_parent = node['parent']
-                            if node_parent == None:
-                                #Has just split the root
-                                tree = {'children': [new_node_1, new_node_2], 'leaf':False, 'parent': None, 
-                                        'x': (new_node_1['x'] + new_node_2['x'])/2,
-                                        'y': (new_node_1['y'] + new_node_2['y'])/2}
-                                x_dist_1 = (new_node_1['x'] - tree['x']) ** 2
-                                x_dist_2 = (new_node_2['x'] - tree['x']) ** 2
-                                y_dist_1 = (new_node_1['y'] - tree['y']) ** 2
-                                y_dist_2 = (new_node_2['y'] - tree['y']) ** 2                                
-                                tree['radius'] = max(sqrt(x_dist_1 + y_dist_1) + new_node_1['radius'],
-                                                     sqrt(x_dist_2 + y_dist_2) + new_node_2['radius'])
-                                tree['x_var'] = max(x_dist_1 + new_node_1['radius'] ** 2, x_dist_2 + new_node_2['radius'] ** 2)
-                                tree['y_var'] = max(y_dist_1 + new_node_1['radius'] ** 2, y_dist_2 + new_node_2['radius'] ** 2)
-                                new_node_1['parent'] = new_node_2['parent'] = tree
-                                return tree                                  
-                            else:
-                                new_node_1['parent'] = node_parent   
-                          
-                                node_parent['children'].remove(node)
-                                node_parent['children'].append(new_node_1)
-                                
-                                #node doesn't exist anymore, and for new_node_1 and new_node_2 everything has been computed
-                                #and therefore can go to the next iteration
-                                continue
+                            new_node.radius = radius
+                            new_node.x_var = x_var
+                            new_node.y_var = y_var  
+                        
+                        #Checks whether the root has been split                            
+                        node_parent = node.parent
+                        if node_parent == None:
+                            #Has just split the root
+                            tree = SSNode(False, [new_node_1, new_node_2])
+                            tree.x = (new_node_1.x + new_node_2.x)/2
+                            tree.y = (new_node_1.y + new_node_2.y)/2
+                            x_dist_1 = (new_node_1.x - tree.x) ** 2
+                            x_dist_2 = (new_node_2.x - tree.x) ** 2
+                            y_dist_1 = (new_node_1.y - tree.y) ** 2
+                            y_dist_2 = (new_node_2.y - tree.y) ** 2                                
+                            tree.radius = max(sqrt(x_dist_1 + y_dist_1) + new_node_1.radius,
+                                                 sqrt(x_dist_2 + y_dist_2) + new_node_2.radius)
+                            tree.x_var = max(x_dist_1 + new_node_1.radius ** 2, x_dist_2 + new_node_2.radius ** 2)
+                            tree.y_var = max(y_dist_1 + new_node_1.radius ** 2, y_dist_2 + new_node_2.radius ** 2)
+                            new_node_1.parent = new_node_2.parent = tree
+                            return tree                                  
+                        else:
+                            new_node_1.parent = node_parent   
+                      
+                            node_parent.children.remove(node)
+                            node_parent.children.append(new_node_1)
                             
-                    #Updates node's centroid, radius and variances                       
-                    x_node = 0.
-                    y_node = 0.
-                    
-                    for child_node in children:
-                        x_node += child_node['x']
-                        y_node += child_node['y']
-                    
-                    n_p = len(children)
-                    x_node /= n_p
-                    y_node /= n_p
-                    node['x'] = x_node
-                    node['y'] = y_node
-                                         
-                    radius = 0.
-                    x_var = y_var = 0.
-                    for child_node in children:
-                        x_dist = (x_node - child_node['x']) ** 2
-                        y_dist = (y_node - child_node['y']) ** 2
-                        radius = max(radius, sqrt(x_dist + y_dist) + child_node['radius'])
-                        x_var = max(x_var, x_dist + child_node['radius'] ** 2)
-                        y_var = max(y_var, y_dist + child_node['radius'] ** 2)
+                            #node doesn't exist anymore, and for new_node_1 and new_node_2 everything has been computed
+                            #and therefore can go to the next iteration
+                            continue
                         
-                    node['radius'] = radius
-                    node['x_var'] = x_var
-                    node['y_var'] = y_var                        
-    
-                    node_parent = node['parent']
-        
-        return tree      
+                #Updates node's centroid, radius and variances                       
+                x_node = 0.
+                y_node = 0.
+                
+                for child_node in children:
+                    x_node += child_node.x
+                    y_node += child_node.y
+                
+                n_p = len(children)
+                x_node /= n_p
+                y_node /= n_p
+                node.x = x_node
+                node.y = y_node
+                                     
+                radius = 0.
+                x_var = y_var = 0.
+                for child_node in children:
+                    x_dist = (x_node - child_node.x) ** 2
+                    y_dist = (y_node - child_node.y) ** 2
+                    radius = max(radius, sqrt(x_dist + y_dist) + child_node.radius)
+                    x_var = max(x_var, x_dist + child_node.radius ** 2)
+                    y_var = max(y_var, y_dist + child_node.radius ** 2)
+                    
+                node.radius = radius
+                node.x_var = x_var
+                node.y_var = y_var                        
+
+                node_parent = node.parent
     
-    #Creates the SS-tree for the topics (points)
-    topics_tree = ss_make_tree()
-
-    #List of the questions for which a topic is relevant
-    topics_relevant_questions = {}
-
-    #Reads the topics list
-    regex = re.compile(TOPIC_REGEXP)
-    for i in range(T):
-        line = f.readline()
-        m = regex.match(line)
-        t_id = int(m.group(1))
-        (x,y) = map(lambda s: float(s), m.group(2,3))
-        topics[t_id] = (x, y)
-        #Add the topic to the SS-tree
-        topics_tree = ss_tree_insert({'x':x, 'y':y, 't_id':t_id}, topics_tree)
-        #List of the questions for which a topic is relevant (initializes it)
-        topics_relevant_questions[t_id] = []
- 
-                                  
-    #Reads the questions list
-    regex = re.compile(INTEGER_RE)
-    for i in range(Q):
-        line = f.readline()
-        m = regex.findall(line)
-        
-        q_id = int(m[0])
-        Qn = int(m[1])
-        
-        if (Qn!=0):
-            Qids = map(lambda s: int(s), m[2:Qn+2])        #could have been [2:len(m)], but it is better to trigger an exception if the input is not well formed
-            questions.append((q_id, Qids))
+    return tree
+
+''' Computes centroid, radius and variances of a leaf from the points it contains.
+    @param node:    The (non empty) leaf to update.
+'''
+def ss_leaf_update(node):
+    points = node.points
+    x_node = 0.
+    y_node = 0.
+    for point in points:
+        x_node += point.x
+        y_node += point.y
+    n_p = len(points)
+    x_node /= n_p
+    y_node /= n_p
+    node.x = x_node
+    node.y = y_node
+
+    radius = 0.
+    x_var = y_var = 0.
+    for point in points:
+        #INVARIANT: points don't have radius
+        x_dist = (x_node - point.x) ** 2
+        y_dist = (y_node - point.y) ** 2
+        radius = max(radius, x_dist + y_dist)
+        #We don't need the exact variance, we can do fine with an estimate based on max distance form the centroid
+        x_var = max(x_var, x_dist)
+        y_var = max(y_var, y_dist)
+    node.radius = sqrt(radius)
+    node.x_var = x_var
+    node.y_var = y_var
+
+''' Computes centroid, radius and variances of an intermediate node from its children.
+    @param node:    The (non empty) intermediate node to update.
+'''
+def ss_node_update(node):
+    children = node.children
+    x_node = 0.
+    y_node = 0.
+    for child_node in children:
+        x_node += child_node.x
+        y_node += child_node.y
+    n_p = len(children)
+    x_node /= n_p
+    y_node /= n_p
+    node.x = x_node
+    node.y = y_node
+
+    radius = 0.
+    x_var = y_var = 0.
+    for child_node in children:
+        x_dist = (x_node - child_node.x) ** 2
+        y_dist = (y_node - child_node.y) ** 2
+        radius = max(radius, sqrt(x_dist + y_dist) + child_node.radius)
+        x_var = max(x_var, x_dist + child_node.radius ** 2)
+        y_var = max(y_var, y_dist + child_node.radius ** 2)
+    node.radius = radius
+    node.x_var = x_var
+    node.y_var = y_var
+
+''' Builds a SS-tree from a whole set of points at once, using the Sort-Tile-Recursive packing:
+    the points are sorted by x and cut in vertical slices, then every slice is sorted by y and
+    packed in full leaves; the same procedure is applied to the centroids of the leaves to build
+    the level above, and so on until a single root is left.
+    Compared to inserting the points one by one, every centroid, radius and variance is computed
+    just once, and nodes are (almost) full and spatially compact, so their bounding spheres are tighter.
+
+    @param points:   The list of points to be added to the tree;
+                     Every point must be an SSPoint instance.
+    @return tree:    The root of the newly created tree.
+'''
+def ss_tree_bulk_load(points):
+    if len(points) <= MAX_ELEMENTS_PER_CLUSTER:
+        #Everything fits in a single leaf
+        tree = ss_make_tree()
+        if len(points) == 0:
+            return tree
+        nodes = [tree]
+        tree.points = list(points)
+    else:
+        #Packs the points in leaves
+        nodes = []
+        for group in str_tiles(points):
+            nodes.append(SSNode(True, group))
+
+    for node in nodes:
+        ss_leaf_update(node)
+
+    return ss_tree_pack(nodes)
+
+''' Packs a list of nodes, all at the same depth and with their bounds already computed, in the
+    upper levels of a SS-tree (see ss_tree_bulk_load).
+    @param nodes:    The (non empty) list of nodes to pack;
+    @return tree:    The root of the tree having those nodes at its lowest level.
+'''
+def ss_tree_pack(nodes):
+    #Packs each level in the one above, until only the root is left
+    while len(nodes) > 1:
+        if len(nodes) <= MAX_ELEMENTS_PER_CLUSTER:
+            groups = [nodes]
+        else:
+            groups = str_tiles(nodes)
+
+        nodes = []
+        for children in groups:
+            node = SSNode(False, children)
+            for child_node in children:
+                child_node.parent = node
+            ss_node_update(node)
+            nodes.append(node)
+
+    tree = nodes[0]
+    tree.parent = None
+    return tree
+
+''' Sort-Tile-Recursive partitioning of a list of entries (points or nodes, both having x and y attributes)
+    into groups of at most MAX_ELEMENTS_PER_CLUSTER entries.
+    @param entries:    The entries to partition;
+    @return:    The list of groups, each one a list of entries close to each other.
+'''
+def str_tiles(entries):
+    n_p = len(entries)
+    n_groups = (n_p + MAX_ELEMENTS_PER_CLUSTER - 1) // MAX_ELEMENTS_PER_CLUSTER
+    n_slices = int(ceil(sqrt(n_groups)))
+    slice_size = n_slices * MAX_ELEMENTS_PER_CLUSTER
+
+    entries = sorted(entries, key=attrgetter('x'))
+    groups = []
+    for i in xrange(0, n_p, slice_size):
+        vertical_slice = entries[i:i + slice_size]
+        vertical_slice.sort(key=attrgetter('y'))
+        for j in xrange(0, len(vertical_slice), MAX_ELEMENTS_PER_CLUSTER):
+            groups.append(vertical_slice[j:j + MAX_ELEMENTS_PER_CLUSTER])
+    return groups
+
+
+#Minimum number of points or children for each node but the root: nodes left with fewer entries after a deletion are dissolved
+MIN_ELEMENTS_PER_CLUSTER = SPLIT_SIZE / 2
+#Tolerance used when checking whether a point lies inside a bounding sphere (radii are affected by rounding errors)
+SPHERE_EPSILON = 1e-6
+
+''' Returns the height of the subtree rooted in node (0 for a leaf).
+'''
+def ss_node_height(node):
+    height = 0
+    while not node.leaf:
+        node = node.children[0]
+        height += 1
+    return height
+
+''' Looks for the leaf holding a given point: only the subtrees whose bounding sphere contains the point are visited.
+    @param point:    The SSPoint to look for (compared by identity);
+    @param tree:    The root of the tree;
+    @return:    The leaf holding point, or None if the point is not in the tree.
+'''
+def ss_tree_find_leaf(point, tree):
+    x = point.x
+    y = point.y
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.leaf:
+            for p in node.points:
+                if p is point:
+                    return node
+        else:
+            for child in node.children:
+                if sqrt((child.x - x) ** 2 + (child.y - y) ** 2) <= child.radius + SPHERE_EPSILON:
+                    stack.append(child)
+    return None
+
+''' Splits a node with too many entries in two halves, along the direction with the highest variance of the entries.
+    @param node:    The node to split;
+    @return:    The two new nodes, with their bounds already computed (their parent is not set).
+'''
+def ss_node_split(node):
+    if node.leaf:
+        entries = node.points
+    else:
+        entries = node.children
+    n_p = len(entries)
+    x_mean = sum([e.x for e in entries]) / n_p
+    y_mean = sum([e.y for e in entries]) / n_p
+    x_var = sum([(e.x - x_mean) ** 2 for e in entries])
+    y_var = sum([(e.y - y_mean) ** 2 for e in entries])
+    if x_var >= y_var:
+        entries = sorted(entries, key=attrgetter('x'))
+    else:
+        entries = sorted(entries, key=attrgetter('y'))
+
+    new_nodes = (SSNode(node.leaf, entries[:n_p / 2]), SSNode(node.leaf, entries[n_p / 2:]))
+    for new_node in new_nodes:
+        if node.leaf:
+            ss_leaf_update(new_node)
+        else:
+            for child in new_node.children:
+                child.parent = new_node
+            ss_node_update(new_node)
+    return new_nodes
+
+''' Walks from a node up to the root, splitting every node that has more than MAX_ELEMENTS_PER_CLUSTER entries
+    and recomputing the bounds of the others: this restores the SS-tree invariants after an entry has been added
+    to (or removed from) node, touching only the nodes on the path to the root.
+    @param node:    The node that has been changed;
+    @param tree:    The root of the tree;
+    @return:    The root of the tree, possibly a new one if the old root has been split.
+'''
+def ss_tree_fix_up(node, tree):
+    while node is not None:
+        if node.leaf:
+            n_p = len(node.points)
+        else:
+            n_p = len(node.children)
+        parent = node.parent
+
+        if n_p > MAX_ELEMENTS_PER_CLUSTER:
+            (new_node_1, new_node_2) = ss_node_split(node)
+            if parent is None:
+                tree = SSNode(False, [new_node_1, new_node_2])
+                new_node_1.parent = new_node_2.parent = tree
+                ss_node_update(tree)
+                return tree
+            parent.children.remove(node)
+            parent.children.append(new_node_1)
+            parent.children.append(new_node_2)
+            new_node_1.parent = new_node_2.parent = parent
+        elif n_p > 0:
+            if node.leaf:
+                ss_leaf_update(node)
+            else:
+                ss_node_update(node)
+        node = parent
+    return tree
+
+''' Inserts a whole subtree in a SS-tree, as a child of a node at the right level so that all the leaves
+    stay at the same depth.
+    @param new_node:    The root of the subtree to insert (its bounds must be already computed);
+    @param tree:    The root of the tree, or None for an empty tree;
+    @return:    The root of the tree, possibly a new one.
+'''
+def ss_tree_insert_node(new_node, tree):
+    new_node.parent = None
+    if tree is None:
+        return new_node
+
+    height = ss_node_height(new_node)
+    tree_height = ss_node_height(tree)
+    if height >= tree_height:
+        #INVARIANT: height == tree_height, the subtree can't be higher than the tree it is inserted in
+        root = SSNode(False, [tree, new_node])
+        tree.parent = new_node.parent = root
+        ss_node_update(root)
+        return root
+
+    #Goes down, choosing the child with the closest centroid, until it reaches the level just above the new node
+    node = tree
+    while tree_height > height + 1:
+        node = min(node.children, key=lambda c: (c.x - new_node.x) ** 2 + (c.y - new_node.y) ** 2)
+        tree_height -= 1
+
+    node.children.append(new_node)
+    new_node.parent = node
+    return ss_tree_fix_up(node, tree)
+
+''' Removes an entry from a SS-tree node and restores the tree invariants: nodes left with fewer than
+    MIN_ELEMENTS_PER_CLUSTER entries are detached from the tree, and their entries are inserted back
+    (points through ss_tree_insert, subtrees through ss_tree_insert_node, at their original level).
+    @param node:    The node holding the entry;
+    @param entry:    The point (if node is a leaf) or child node to remove;
+    @param tree:    The root of the tree;
+    @return:    The root of the tree, or None if the tree is left without any leaf.
+'''
+def ss_tree_remove(node, entry, tree):
+    if node.leaf:
+        node.points.remove(entry)
+    else:
+        node.children.remove(entry)
+        entry.parent = None
+
+    orphans = []
+    while node.parent is not None:
+        parent = node.parent
+        if node.leaf:
+            entries = node.points
+        else:
+            entries = node.children
+        if len(entries) < MIN_ELEMENTS_PER_CLUSTER:
+            parent.children.remove(node)
+            orphans.append(node)
+        elif node.leaf:
+            ss_leaf_update(node)
+        else:
+            ss_node_update(node)
+        node = parent
+
+    #INVARIANT: node is the root
+    while not node.leaf and len(node.children) == 1:
+        node = node.children[0]
+        node.parent = None
+    if node.leaf:
+        if len(node.points) > 0:
+            ss_leaf_update(node)
+        else:
+            node.x = node.y = node.radius = node.x_var = node.y_var = 0.
+    elif len(node.children) > 0:
+        ss_node_update(node)
+    else:
+        node = None
+    tree = node
+
+    for orphan in orphans:
+        if orphan.leaf:
+            for point in orphan.points:
+                if tree is None:
+                    tree = ss_make_tree()
+                tree = ss_tree_insert(point, tree)
+        else:
+            for child in orphan.children:
+                tree = ss_tree_insert_node(child, tree)
+    return tree
+
+''' k-nearest neighbours search for a point in a SS-tree of topics (t-type query).
+    Best-first search: nodes are visited in order of increasing distance of the border of their bounding sphere
+    from the query point, and the topics met are kept in a bounded top-k container; once it holds n_res topics,
+    every node farther than the k-th distance (plus the tolerance) is pruned.
+    @param tree:    The root of the topics SS-tree;
+    @param x0, y0:    The coordinates of the query point;
+    @param n_res:    The number of topics required (must be positive);
+    @param epsilon:    If positive, the search is approximate (see ss_tree_topics_search);
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats);
+    @return:    The ids of the n_res topics closest to (x0, y0), sorted by ascending distance and
+                (for distances within 0.001) by descending id.
+'''
+def ss_tree_topics_knn(tree, x0, y0, n_res, epsilon=0., stats=None):
+    return [i_d for (d, i_d) in ss_tree_topics_search(tree, x0, y0, n_res, epsilon=epsilon, stats=stats)]
+
+''' The search performed by ss_tree_topics_knn, returning the distances of the results as well.
+    With a positive epsilon the search is approximate: the distance of each node is multiplied by (1 + epsilon),
+    so nodes are pruned as soon as their distance is within a factor (1 + epsilon) from the k-th distance found;
+    the k-th distance returned is then at most (1 + epsilon) times the exact one (plus the tolerance).
+    @param tree, x0, y0, n_res:    See ss_tree_topics_knn;
+    @param limit:    An upper bound, known in advance, for the k-th distance plus the tolerance, used to prune
+                     the search from the start (see answer_queries_batch);
+    @param epsilon:    The approximation factor (0 for an exact search);
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats);
+    @return:    The list of tuples (distance, id) of the n_res topics closest to (x0, y0), sorted as for ss_tree_topics_knn.
+'''
+def ss_tree_topics_search(tree, x0, y0, n_res, limit=float('inf'), epsilon=0., stats=None):
+    top_k = BoundedTopK(n_res, limit=limit)
+    push = top_k.push
+    d_max = top_k.bound
+    scale = 1. + epsilon
+    #Counters, updated once per node
+    expanded = scanned = points_checked = spheres_checked = 0
+
+    queue = [(0., tree)]
+    while len(queue) > 0:
+        (d, node) = heappop(queue)
+        if d > d_max:
+            break
+
+        if node.leaf:
+            points = node.points
+            scanned += 1
+            points_checked += len(points)
+            for p in points:
+                new_dist = sqrt((p.x - x0) ** 2 + (p.y - y0) ** 2)
+                if new_dist <= d_max:
+                    d_max = push(new_dist, p.t_id)
+        else:
+            expanded += 1
+            spheres_checked += len(node.children)
+            for child in node.children:
+                dist = sqrt((child.x - x0) ** 2 + (child.y - y0) ** 2)
+                radius = child.radius
+                if dist <= radius:
+                    dist = 0.
+                else:
+                    dist = (dist - radius) * scale
+                if dist <= d_max:
+                    heappush(queue, (dist, child))
+
+    results = top_k.items()
+    if stats is not None:
+        count(stats, expanded, scanned, points_checked + spheres_checked, points_checked - len(results))
+    return results
+
+''' k-nearest neighbours search for the questions closest to a point (q-type query), performed on the SS-tree
+    of topics: topics are visited from the closest to the farthest, and each one is expanded to the questions
+    for which it is relevant.
+    The best distance of every question met is kept in an IndexedTopK, which updates it in O(log n_res) and always
+    knows the n_res-th smallest one: once n_res questions have been met, every topic and node farther than it
+    (plus the tolerance) is pruned.
+    @param tree:    The root of the topics SS-tree;
+    @param topics_questions:    The inverted lists of the questions of each topic, indexed by the topics' dense
+                                indices (see nearby_parse.invert_questions);
+    @param x0, y0:    The coordinates of the query point;
+    @param n_res:    The number of questions required (must be positive);
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats);
+    @return:    The ids of the n_res questions closest to (x0, y0), sorted as for ss_tree_topics_knn.
+'''
+def ss_tree_questions_knn(tree, topics_questions, x0, y0, n_res, stats=None):
+    (t_offsets, t_questions) = topics_questions
+    questions = IndexedTopK(n_res)
+    update = questions.update
+    kth_distance = questions.kth_distance
+    d_max = float('inf')
+    #Counters, updated once per node
+    expanded = scanned = points_checked = spheres_checked = 0
+
+    queue = [(0., tree)]
+    while len(queue) > 0:
+        (d, node) = heappop(queue)
+        if d > d_max:
+            break
+
+        if node.leaf:
+            points = node.points
+            scanned += 1
+            points_checked += len(points)
+            for p in points:
+                new_dist = sqrt((p.x - x0) ** 2 + (p.y - y0) ** 2)
+                if new_dist > d_max:
+                    continue
+                useful = False
+                for j in xrange(t_offsets[p.index], t_offsets[p.index + 1]):
+                    if update(t_questions[j], new_dist):
+                        useful = True
+                if useful:
+                    d_max = kth_distance() + TOLERANCE
+        else:
+            expanded += 1
+            spheres_checked += len(node.children)
+            for child in node.children:
+                dist = sqrt((child.x - x0) ** 2 + (child.y - y0) ** 2)
+                radius = child.radius
+                if dist <= radius:
+                    dist = 0.
+                else:
+                    dist -= radius
+                if dist <= d_max:
+                    heappush(queue, (dist, child))
+
+    #Only the questions within the tolerance from the n_res-th distance can be among the results
+    results = sort_results([(d, q_id) for (q_id, d) in questions.distances.iteritems() if d <= d_max])[:n_res]
+    if stats is not None:
+        count(stats, expanded, scanned, points_checked + spheres_checked, len(questions) - len(results))
+    return [i_d for (d, i_d) in results]
+
+
+''' Answers a t-type and a q-type query at the same point with a single best-first traversal of the SS-tree of
+    topics: each topic met is pushed in the topics' top-k (as in ss_tree_topics_search) and expanded to its
+    questions (as in ss_tree_questions_knn). Each of the two searches keeps its own threshold, and a node is pruned
+    only when it is farther than both of them.
+    @param tree:    The root of the topics SS-tree;
+    @param topics_questions:    The inverted lists of the questions of each topic, indexed by the topics' dense
+                                indices (see nearby_parse.invert_questions);
+    @param x0, y0:    The coordinates of the query point;
+    @param t_res, q_res:    The number of topics and of questions required (both must be positive);
+    @param t_limit, q_limit:    Upper bounds, known in advance, for the k-th distance plus the tolerance of the two
+                                searches (see answer_queries_batch);
+    @return:    A pair with the lists of tuples (distance, id) of the t_res closest topics and of the q_res closest
+                questions, sorted as for ss_tree_topics_knn.
+'''
+def ss_tree_fused_search(tree, topics_questions, x0, y0, t_res, q_res, t_limit=float('inf'),
+                         q_limit=float('inf')):
+    (t_offsets, t_questions) = topics_questions
+    top_k = BoundedTopK(t_res, limit=t_limit)
+    push = top_k.push
+    t_max = top_k.bound
+    questions = IndexedTopK(q_res)
+    update = questions.update
+    kth_distance = questions.kth_distance
+    q_max = q_limit
+    d_max = max(t_max, q_max)
+
+    queue = [(0., tree)]
+    while len(queue) > 0:
+        (d, node) = heappop(queue)
+        if d > d_max:
+            break
+
+        if node.leaf:
+            for p in node.points:
+                new_dist = sqrt((p.x - x0) ** 2 + (p.y - y0) ** 2)
+                if new_dist <= t_max:
+                    t_max = push(new_dist, p.t_id)
+                if new_dist <= q_max:
+                    useful = False
+                    for j in xrange(t_offsets[p.index], t_offsets[p.index + 1]):
+                        if update(t_questions[j], new_dist):
+                            useful = True
+                    if useful:
+                        q_max = min(q_limit, kth_distance() + TOLERANCE)
+            d_max = max(t_max, q_max)
+        else:
+            for child in node.children:
+                dist = sqrt((child.x - x0) ** 2 + (child.y - y0) ** 2)
+                radius = child.radius
+                if dist <= radius:
+                    dist = 0.
+                else:
+                    dist -= radius
+                if dist <= d_max:
+                    heappush(queue, (dist, child))
+
+    questions_results = sort_results([(d, q_id) for (q_id, d) in questions.distances.iteritems() if d <= q_max])
+    return (top_k.items(), questions_results[:q_res])
+
+''' Range query: finds all the topics within a given distance from a point.
+    Depth-first visit of the SS-tree: a node whose bounding sphere lies entirely outside the circle of the query is
+    skipped, and a node whose sphere lies entirely inside it is emitted whole, listing the topics of its subtree
+    without computing their distances; only the leaves crossing the border of the circle are checked point by point.
+    @param tree:    The root of the topics SS-tree;
+    @param x0, y0:    The coordinates of the query point;
+    @param radius:    The radius of the query;
+    @return:    The ids of all the topics whose distance from (x0, y0) is not greater than radius, in no particular order.
+'''
+def ss_tree_topics_range(tree, x0, y0, radius):
+    results = []
+    #Subtrees entirely inside the circle
+    inside = []
+    stack = [tree]
+    while len(stack) > 0:
+        node = stack.pop()
+        dist = sqrt((node.x - x0) ** 2 + (node.y - y0) ** 2)
+        if dist + node.radius + SPHERE_EPSILON <= radius:
+            inside.append(node)
+        elif dist - node.radius > radius:
+            continue
+        elif node.leaf:
+            for p in node.points:
+                if sqrt((p.x - x0) ** 2 + (p.y - y0) ** 2) <= radius:
+                    results.append(p.t_id)
+        else:
+            stack.extend(node.children)
+
+    while len(inside) > 0:
+        node = inside.pop()
+        if node.leaf:
+            results.extend([p.t_id for p in node.points])
+        else:
+            inside.extend(node.children)
+    return results
+
+''' Finds up to n_res topics closest to a point, among the ones within a given distance from it: the k-nearest
+    neighbours search of ss_tree_topics_knn, pruning from the start every node farther than radius.
+    @param tree:    The root of the topics SS-tree;
+    @param x0, y0:    The coordinates of the query point;
+    @param n_res:    The maximum number of topics required (must be positive);
+    @param radius:    The radius of the query;
+    @return:    The ids of (at most) n_res topics within radius from (x0, y0), sorted as for ss_tree_topics_knn.
+'''
+def ss_tree_topics_knn_within(tree, x0, y0, n_res, radius):
+    return [i_d for (d, i_d) in ss_tree_topics_search(tree, x0, y0, n_res, limit=radius)]
+
+''' Range query for questions: finds all the questions with at least one relevant topic within a given distance from
+    a point, expanding the topics found by ss_tree_topics_range through the topic -> questions inverted lists.
+    @param tree:    The root of the topics SS-tree;
+    @param topics_relevant_questions:    A dictionary with the questions for which each topic is relevant;
+    @param x0, y0:    The coordinates of the query point;
+    @param radius:    The radius of the query;
+    @return:    The ids of all the questions whose distance from (x0, y0) is not greater than radius,
+                in no particular order.
+'''
+def ss_tree_questions_range(tree, topics_relevant_questions, x0, y0, radius):
+    questions = set()
+    for t_id in ss_tree_topics_range(tree, x0, y0, radius):
+        questions.update(topics_relevant_questions[t_id])
+    return list(questions)
+
+''' Finds up to n_res questions closest to a point, among the ones within a given distance from it, through the
+    topic -> questions inverted lists.
+    Best-first search on the SS-tree of topics, in which topics are pushed back in the queue with their exact
+    distance: they are popped in order of increasing distance, so the first topic met for each question gives the
+    distance of the question. Nodes farther than radius, or than the k-th question's distance (plus the tolerance),
+    are pruned.
+    @param tree:    The root of the topics SS-tree;
+    @param topics_relevant_questions:    A dictionary with the questions for which each topic is relevant;
+    @param x0, y0:    The coordinates of the query point;
+    @param n_res:    The maximum number of questions required (must be positive);
+    @param radius:    The radius of the query;
+    @return:    The ids of (at most) n_res questions within radius from (x0, y0), sorted as for ss_tree_topics_knn.
+'''
+def ss_tree_questions_knn_within(tree, topics_relevant_questions, x0, y0, n_res, radius):
+    top_k = BoundedTopK(n_res, limit=radius)
+    d_max = top_k.bound
+    found = set()
+
+    #Entries are (distance, exact, entry): exact is 1 iff entry is a topic id and distance is its exact distance
+    queue = [(0., 0, tree)]
+    while len(queue) > 0:
+        (d, exact, entry) = heappop(queue)
+        if d > d_max:
+            break
+
+        if exact:
+            for q_id in topics_relevant_questions[entry]:
+                if q_id not in found:
+                    found.add(q_id)
+                    d_max = top_k.push(d, q_id)
+        elif entry.leaf:
+            for p in entry.points:
+                dist = sqrt((p.x - x0) ** 2 + (p.y - y0) ** 2)
+                if dist <= d_max:
+                    heappush(queue, (dist, 1, p.t_id))
+        else:
+            for child in entry.children:
+                dist = sqrt((child.x - x0) ** 2 + (child.y - y0) ** 2)
+                r = child.radius
+                if dist <= r:
+                    dist = 0.
+                else:
+                    dist -= r
+                if dist <= d_max:
+                    heappush(queue, (dist, 0, child))
+
+    return top_k.ids()
+
+''' Builds the questions index: a SS-tree whose leaves are the questions themselves, each one bounded by the
+    sphere around the points of its topics; the leaves are then packed in the upper levels with the same
+    Sort-Tile-Recursive method used for the topics.
+    A question whose topics are far apart would have a huge sphere, useless for pruning: so the topics of each
+    question are grouped by the leaf of the topics tree that holds them, and every group gets its own leaf
+    (and its own, tight, sphere) in the index.
+    @param questions:    An iterable over the questions, as tuples (q_id, points), points being the non empty list
+                         of the SSPoints of the question's topics;
+    @param topics_tree:    The root of the topics SS-tree;
+    @return:    The root of the index, or None if there is no question.
+'''
+def ss_questions_index(questions, topics_tree):
+
+    #Numbers the leaves of the topics tree, and finds the leaf of each topic
+    topics_leaf = {}
+    stack = [topics_tree]
+    n_leaves = 0
+    while len(stack) > 0:
+        node = stack.pop()
+        if node.leaf:
+            for p in node.points:
+                topics_leaf[p] = n_leaves
+            n_leaves += 1
+        else:
+            stack.extend(node.children)
+
+    nodes = []
+    for (q_id, points) in questions:
+        groups = {}
+        for p in points:
+            groups.setdefault(topics_leaf[p], []).append(p)
+        for points in groups.itervalues():
+            node = SSQuestionNode(q_id, points)
+            ss_leaf_update(node)
+            nodes.append(node)
+
+    if len(nodes) == 0:
+        return None
+    return ss_tree_pack(nodes)
+
+''' k-nearest neighbours search for the questions closest to a point (q-type query), performed on the questions index.
+    Best-first search: nodes are visited in order of increasing distance of the border of their bounding sphere
+    from the query point, a lower bound for the distance of every question in them; when a leaf is reached, the
+    exact distance of its nearest topic is computed and pushed back in the queue: the first time one of the
+    leaves of a question is popped with its exact distance, that is the distance of the question.
+    The distance of a leaf is also an upper bound for the distance of its question: once n_res distinct questions
+    have one, every node farther than the k-th of them (plus the tolerance) is pruned, so whole groups of questions
+    are discarded at once.
+    @param tree:    The root of the questions index (see ss_questions_index);
+    @param x0, y0:    The coordinates of the query point;
+    @param n_res:    The number of questions required (must be positive);
+    @param epsilon:    If positive, the search is approximate (see ss_questions_index_search);
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats);
+    @return:    The ids of the n_res questions closest to (x0, y0), sorted as for ss_tree_topics_knn.
+'''
+def ss_questions_index_knn(tree, x0, y0, n_res, epsilon=0., stats=None):
+    return [i_d for (d, i_d) in ss_questions_index_search(tree, x0, y0, n_res, epsilon=epsilon, stats=stats)]
+
+''' The search performed by ss_questions_index_knn, returning the distances of the results as well.
+    With a positive epsilon the search is approximate, as for ss_tree_topics_search: the lower bounds of the nodes
+    (but not the exact distances of the leaves) are multiplied by (1 + epsilon).
+    @param tree, x0, y0, n_res:    See ss_questions_index_knn;
+    @param limit:    An upper bound, known in advance, for the k-th distance plus the tolerance, used to prune
+                     the search from the start (see answer_queries_batch);
+    @param epsilon:    The approximation factor (0 for an exact search);
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats):
+                     the candidates are the leaves (groups of topics of a question) whose distance is computed;
+    @return:    The list of tuples (distance, id) of the n_res questions closest to (x0, y0), sorted as for
+                ss_tree_topics_knn.
+'''
+def ss_questions_index_search(tree, x0, y0, n_res, limit=float('inf'), epsilon=0., stats=None):
+    if tree is None:
+        return []
+
+    results = []
+    found = set()
+    #The n_res smallest upper bounds of distinct questions computed so far
+    upper_bounds = BoundedTopK(n_res, limit=limit)
+    bounded = set()
+    d_max = upper_bounds.bound
+    scale = 1. + epsilon
+    #Counters, updated once per node
+    expanded = scanned = points_checked = spheres_checked = 0
+
+    #Entries are (distance, exact, node): exact is 1 iff node is a leaf and distance is its exact distance
+    queue = [(0., 0, tree)]
+    while len(queue) > 0:
+        (d, exact, node) = heappop(queue)
+        if d > d_max:
+            break
+
+        if exact:
+            q_id = node.q_id
+            if q_id not in found:
+                found.add(q_id)
+                results.append((d, q_id))
+        elif node.leaf:
+            q_id = node.q_id
+            if q_id in found:
+                continue
+            scanned += 1
+            points_checked += len(node.points)
+            #The distance of the leaf is the one of its nearest topic
+            dist = sqrt(min([(p.x - x0) ** 2 + (p.y - y0) ** 2 for p in node.points]))
+            if dist <= d_max:
+                heappush(queue, (dist, 1, node))
+                if q_id not in bounded:
+                    bounded.add(q_id)
+                    d_max = upper_bounds.push(dist, q_id)
+        else:
+            expanded += 1
+            spheres_checked += len(node.children)
+            for child in node.children:
+                dist = sqrt((child.x - x0) ** 2 + (child.y - y0) ** 2)
+                radius = child.radius
+                if dist <= radius:
+                    dist = 0.
+                else:
+                    dist = (dist - radius) * scale
+                if dist <= d_max:
+                    heappush(queue, (dist, 0, child))
+
+    results = sort_results(results)[:n_res]
+    if stats is not None:
+        count(stats, expanded, scanned, points_checked + spheres_checked, scanned - len(results))
+    return results
+
+''' A long-lived index of topics and questions, answering t-type and q-type queries between updates.
+    Topics are kept in a SS-tree and questions in the questions index (see ss_questions_index); both are bulk-loaded
+    on construction and then maintained incrementally: every update only touches the nodes on the path from the
+    changed leaf to the root (plus the few entries reinserted when a node is dissolved), so it costs O(log T)
+    (or O(log Q)) and queries keep the same pruning as on a freshly built tree.
+    Each question is split in groups of close topics, every group being a leaf of the questions index: a topic
+    attached to a question joins the group whose sphere already contains it, or starts a new group otherwise.
+    The results of kNN queries can be kept in a QueryCache (see nearby_cache): every update drops just the cached
+    results whose reach covers the position of the topic changed.
+'''
+class NearbyIndex(object):
+
+    ''' Constructor
+        @param topics:    An iterable of tuples (t_id, x, y);
+        @param questions:    An iterable of tuples (q_id, Qids), where Qids is the list of the ids of the topics
+                             relevant for the question;
+        @param cache:    If not None, the QueryCache holding the results of topics_knn and questions_knn.
+    '''
+    def __init__(self, topics=(), questions=(), cache=None):
+        self.cache = cache
+        self.topics = {}
+        #The set of questions for which each topic is relevant
+        self.topics_relevant_questions = {}
+        #The groups (leaves of the questions index) of each question
+        self.questions = {}
+        for (t_id, x, y) in topics:
+            if t_id in self.topics:
+                raise KeyError(t_id)
+            self.topics[t_id] = SSPoint(x, y, t_id)
+            self.topics_relevant_questions[t_id] = set()
+        self.topics_tree = ss_tree_bulk_load(self.topics.values())
+
+        non_empty_questions = []
+        for (q_id, Qids) in questions:
+            if q_id in self.questions:
+                raise KeyError(q_id)
+            self.questions[q_id] = []
+            Qids = list(set(Qids))
             for t_id in Qids:
-                topics_relevant_questions[t_id].append(q_id)
-    
-    #Uses a statically allocated array of doubles for the distances' heap, to avoid runtime checks and improve performance   
-    heap = array('d', range(100))       #INVARIANT:    no more than 100 results are required for each query
-    
-  
-    #Reads and processes the queries list            
-    regex = re.compile(QUERY_REGEXP)
-    for i in range(N):
-        line = f.readline()
-        m = regex.match(line)
-        q_type = m.group(1)
-        n_res = int(m.group(2))
-        if n_res == 0:
-            print ''
-#DEBUG        file_out.write('\n')
-            continue    
-        
-        (x0,y0) = map(lambda s: float(s), m.group(3,4))
-        
-        ''' Compares two elements of the solution: each element is a tuple (distance, ID),
-            If the two distances are within a tolerance of 0.001 they are (by specs)
-            considered equals, so in that case the couple with the highest ID is
-            smaller; otherwise the order is determined by the two distances.
-            
-            @param (da,ia):     The first tuple to compare;
-            @param (db,ib):     The second tuple to compare;
-            @return:    An integer n:
-                        < 0     <=>    (da,ia) < (db,ib)     [da-db < -0.001 or ia > ib]
-                        > 0     <=>    (da,ia) > (db,ib)     [da-db > 0.001 or ia < ib]
-                        0       <=>    (da,ia) == (db,ib)    [fabs(da-db) < 0.001 and ia == ib]            
-        '''
-        def compare_items((da,ia), (db,ib)):
-            #checks the distances first: must be greater than the threshold (distances are non-negatives!)
-            if da < db - 0.001:
-                return -1
-            elif da > db + 0.001:
-                return 1
+                self.topics_relevant_questions[t_id].add(q_id)
+            if len(Qids) > 0:
+                non_empty_questions.append((q_id, Qids))
+        self.questions_tree = ss_questions_index([(q_id, [self.topics[t_id] for t_id in Qids])
+                                                  for (q_id, Qids) in non_empty_questions], self.topics_tree)
+        if self.questions_tree is not None:
+            for group in self.__question_groups(self.questions_tree):
+                self.questions[group.q_id].append(group)
+
+    ''' Lists all the leaves of the questions index below a node.
+    '''
+    def __question_groups(self, node):
+        groups = []
+        stack = [node]
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.leaf:
+                groups.append(node)
             else:
-                #if the distances are within threshold, then compares ids
-                return ib - ia
-        
-        #Switches the type of query
+                stack.extend(node.children)
+        return groups
+
+    ''' Adds a new topic.
+        @param t_id:    The topic's ID (must not be already in the index);
+        @param x, y:    The topic's coordinates.
+    '''
+    def add_topic(self, t_id, x, y):
+        if t_id in self.topics:
+            raise KeyError(t_id)
+        point = SSPoint(x, y, t_id)
+        self.topics[t_id] = point
+        self.topics_relevant_questions[t_id] = set()
+        self.topics_tree = ss_tree_insert(point, self.topics_tree)
+        if self.cache is not None:
+            self.cache.invalidate('t', x, y)
+
+    ''' Removes a topic, detaching it from all the questions for which it is relevant.
+        @param t_id:    The topic's ID.
+    '''
+    def remove_topic(self, t_id):
+        point = self.topics[t_id]
+        for q_id in list(self.topics_relevant_questions[t_id]):
+            self.detach_topic(q_id, t_id)
+        self.__remove_point(point)
+        del self.topics[t_id]
+        del self.topics_relevant_questions[t_id]
+
+    ''' Moves a topic to a new position.
+        @param t_id:    The topic's ID;
+        @param x, y:    The topic's new coordinates.
+    '''
+    def move_topic(self, t_id, x, y):
+        point = self.topics[t_id]
+        relevant_questions = list(self.topics_relevant_questions[t_id])
+        for q_id in relevant_questions:
+            self.__detach_point(q_id, point)
+        self.__remove_point(point)
+        point.x = x
+        point.y = y
+        self.topics_tree = ss_tree_insert(point, self.topics_tree)
+        if self.cache is not None:
+            self.cache.invalidate('t', x, y)
+        for q_id in relevant_questions:
+            self.__attach_point(q_id, point)
+
+    ''' Adds a new question.
+        @param q_id:    The question's ID (must not be already in the index);
+        @param Qids:    The ids of the topics relevant for the question.
+    '''
+    def add_question(self, q_id, Qids=()):
+        if q_id in self.questions:
+            raise KeyError(q_id)
+        self.questions[q_id] = []
+        for t_id in Qids:
+            self.attach_topic(q_id, t_id)
+
+    ''' Removes a question.
+        @param q_id:    The question's ID.
+    '''
+    def remove_question(self, q_id):
+        for group in list(self.questions[q_id]):
+            for point in list(group.points):
+                self.detach_topic(q_id, point.t_id)
+        del self.questions[q_id]
+
+    ''' Marks a topic as relevant for a question (nothing happens if it already is).
+        @param q_id:    The question's ID;
+        @param t_id:    The topic's ID.
+    '''
+    def attach_topic(self, q_id, t_id):
+        if q_id not in self.questions:
+            raise KeyError(q_id)
+        relevant_questions = self.topics_relevant_questions[t_id]
+        if q_id in relevant_questions:
+            return
+        relevant_questions.add(q_id)
+        self.__attach_point(q_id, self.topics[t_id])
+
+    ''' Marks a topic as no longer relevant for a question (nothing happens if it wasn't).
+        @param q_id:    The question's ID;
+        @param t_id:    The topic's ID.
+    '''
+    def detach_topic(self, q_id, t_id):
+        relevant_questions = self.topics_relevant_questions[t_id]
+        if q_id not in relevant_questions:
+            return
+        relevant_questions.remove(q_id)
+        self.__detach_point(q_id, self.topics[t_id])
+
+    ''' Finds the topics closest to a point.
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of topics required;
+        @return:    The ids of the n_res topics closest to (x0, y0), sorted as for ss_tree_topics_knn.
+    '''
+    def topics_knn(self, x0, y0, n_res):
+        if n_res <= 0:
+            return []
+        if self.cache is not None:
+            return self.cache.answer('t', n_res, x0, y0, self.__search)
+        return ss_tree_topics_knn(self.topics_tree, x0, y0, n_res)
+
+    ''' Finds the questions closest to a point.
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of questions required;
+        @return:    The ids of the n_res questions closest to (x0, y0), sorted as for ss_tree_topics_knn.
+    '''
+    def questions_knn(self, x0, y0, n_res):
+        if n_res <= 0:
+            return []
+        if self.cache is not None:
+            return self.cache.answer('q', n_res, x0, y0, self.__search)
+        return ss_questions_index_knn(self.questions_tree, x0, y0, n_res)
+
+    ''' Finds the topics within a given distance from a point (see ss_tree_topics_range).
+        @param x0, y0:    The coordinates of the query point;
+        @param radius:    The radius of the query;
+        @param n_res:    The maximum number of topics required, or None for all of them;
+        @return:    The ids of the topics within radius from (x0, y0): if n_res is given, (at most) the n_res closest
+                    ones, sorted as for ss_tree_topics_knn, otherwise all of them, in no particular order.
+    '''
+    def topics_within(self, x0, y0, radius, n_res=None):
+        if n_res is None:
+            return ss_tree_topics_range(self.topics_tree, x0, y0, radius)
+        if n_res <= 0:
+            return []
+        return ss_tree_topics_knn_within(self.topics_tree, x0, y0, n_res, radius)
+
+    ''' Finds the questions within a given distance from a point (see ss_tree_questions_range).
+        @param x0, y0:    The coordinates of the query point;
+        @param radius:    The radius of the query;
+        @param n_res:    The maximum number of questions required, or None for all of them;
+        @return:    The ids of the questions within radius from (x0, y0): if n_res is given, (at most) the n_res closest
+                    ones, sorted as for ss_tree_topics_knn, otherwise all of them, in no particular order.
+    '''
+    def questions_within(self, x0, y0, radius, n_res=None):
+        if n_res is None:
+            return ss_tree_questions_range(self.topics_tree, self.topics_relevant_questions, x0, y0, radius)
+        if n_res <= 0:
+            return []
+        return ss_tree_questions_knn_within(self.topics_tree, self.topics_relevant_questions, x0, y0, n_res, radius)
+
+    ''' Answers a kNN query for the cache (see QueryCache.answer): the reach of the results is their largest
+        distance plus the tolerance, or inf if there are fewer than n_res of them (a topic anywhere could join them).
+    '''
+    def __search(self, q_type, n_res, x0, y0):
         if q_type == 't':
-            #Init the heap to an empty max-heap
-            heap_size = 0
-            #Keeps track of the candidates to nearest neighbours found
-            heap_elements = []          
-
-            #Starts a search in the topics SS-tree;
-            #All the topics are pushed in a bounded max-heap which holds at most n_res distances
-            #(the n_res smallest ones) so that, once the heap is full, its first element is
-            #the kth distance discovered so var, and this value can be used to prune the search
-            #on the SS-tree.
-            
-            if topics_tree['leaf']:
-                #The tree has only one node, the root: so every point must be examined
-                points = topics_tree['points']
-                for p in points:
-                    t_id = p['t_id']
-                    x = p['x']
-                    y = p['y']
-
-                    new_dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
-
-                    if heap_size == n_res:
-                        if new_dist > heap[0]:
-                            #The heap is full: if the new value is greather than the kth distance,
-                            #then it can't be one of the k nearest neighbour's distances                               
-                            continue
-                    
-                        heap_elements.append((new_dist, t_id))                
-                        pos = 0
-                        # Bubble up the greater child until hitting a leaf.
-                        child_pos = 2 * pos + 1    # leftmost child position
-                        while child_pos < heap_size:
-                            # Set childpos to index of greater child.
-                            right_pos = child_pos + 1
-                            if right_pos < heap_size and heap[child_pos] < heap[right_pos]:
-                                child_pos = right_pos
-                            # Move the greater child up.
-                            if heap[child_pos] <= new_dist:
-                                break
-                            heap[pos] = heap[child_pos]
-                            pos = child_pos
-                            child_pos = 2*pos + 1
-                        heap[pos] = new_dist           
-                    else:
-                        heap_elements.append((new_dist, t_id))                
-                        heap[heap_size] = new_dist
-                        pos = heap_size
-                        heap_size += 1
-                        # Follow the path to the root, moving parents down until finding a place
-                        # newitem fits.
-                        while pos > 0:
-                            parent_pos = (pos - 1) >> 1
-                            parent = heap[parent_pos]
-                            if new_dist > parent:
-                                heap[pos] = parent
-                                pos = parent_pos
-                            else:
-                                break
-                        heap[pos] = new_dist                    
+            results = ss_tree_topics_search(self.topics_tree, x0, y0, n_res)
+        else:
+            results = ss_questions_index_search(self.questions_tree, x0, y0, n_res)
+        if len(results) < n_res:
+            reach = float('inf')
+        else:
+            reach = max([d for (d, i_d) in results]) + TOLERANCE
+        return ([i_d for (d, i_d) in results], reach)
+
+    ''' Removes a point from the topics tree.
+    '''
+    def __remove_point(self, point):
+        leaf = ss_tree_find_leaf(point, self.topics_tree)
+        self.topics_tree = ss_tree_remove(leaf, point, self.topics_tree)
+        if self.topics_tree is None:
+            self.topics_tree = ss_make_tree()
+        if self.cache is not None:
+            self.cache.invalidate('t', point.x, point.y)
+
+    ''' Adds a topic's point to one of the groups of a question: the first group whose sphere contains the point,
+        or a new one.
+    '''
+    def __attach_point(self, q_id, point):
+        if self.cache is not None:
+            self.cache.invalidate('q', point.x, point.y)
+        groups = self.questions[q_id]
+        for group in groups:
+            if (len(group.points) < MAX_ELEMENTS_PER_CLUSTER and
+                    sqrt((group.x - point.x) ** 2 + (group.y - point.y) ** 2) <= group.radius):
+                group.points.append(point)
+                ss_leaf_update(group)
+                if group.parent is not None:
+                    self.questions_tree = ss_tree_fix_up(group.parent, self.questions_tree)
+                return
+
+        group = SSQuestionNode(q_id, [point])
+        ss_leaf_update(group)
+        groups.append(group)
+        self.questions_tree = ss_tree_insert_node(group, self.questions_tree)
+
+    ''' Removes a topic's point from the group of a question holding it; empty groups are removed from the index.
+    '''
+    def __detach_point(self, q_id, point):
+        if self.cache is not None:
+            self.cache.invalidate('q', point.x, point.y)
+        groups = self.questions[q_id]
+        for group in groups:
+            if point in group.points:
+                break
+        group.points.remove(point)
+        if len(group.points) > 0:
+            ss_leaf_update(group)
+            if group.parent is not None:
+                self.questions_tree = ss_tree_fix_up(group.parent, self.questions_tree)
+        else:
+            groups.remove(group)
+            if group.parent is None:
+                #INVARIANT: group was the root
+                self.questions_tree = None
             else:
-                queue = []
-                #Adds all the root's children to the queue, and examines them in order of increasing distance
-                #of their border from the query point
-                children = topics_tree['children']
-                for child in children:
-                    dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                    radius = child['radius']
-                    if dist <= radius:
-                        dist = 0
-                    else:
-                        dist -= radius
-                    queue.append((dist, radius, child))
+                self.questions_tree = ss_tree_remove(group.parent, group, self.questions_tree)
 
-                queue.sort(key=lambda q:q[0], reverse=True)
-                
-                while len(queue) > 0:
-                    (d, r, node) = queue.pop()
-                    
-                    if node['leaf']:
-                        points = node['points']
-                        for p in points:
-                            t_id = p['t_id']
-                            x = p['x']
-                            y = p['y']
-
-                            new_dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
-                        
-                            if heap_size == n_res:    
-                                #The heap is full: if the new value is greather than the kth distance,
-                                #then it can't be one of the k nearest neighbour's distances                       
-                                if new_dist > heap[0]:                                   
-                                    continue
-                                
-                                heap_elements.append((new_dist, t_id))
-                                #heap[0] = new_dist
-                                pos = 0
-                                # Bubble up the greater child until hitting a leaf.
-                                child_pos = 2 * pos + 1    # leftmost child position
-                                while child_pos < heap_size:
-                                    # Set childpos to index of greater child.
-                                    right_pos = child_pos + 1
-                                    if right_pos < heap_size and heap[child_pos] < heap[right_pos]:
-                                        child_pos = right_pos
-                                    # Move the greater child up.
-                                    if heap[child_pos] <= new_dist:
-                                        break
-                                    heap[pos] = heap[child_pos]
-                                    pos = child_pos
-                                    child_pos = 2*pos + 1
-                                heap[pos] = new_dist           
-                            else:
-                                heap_elements.append((new_dist, t_id))
-                                heap[heap_size] = new_dist
-                                pos = heap_size
-                                heap_size += 1
-                                # Follow the path to the root, moving parents down until it finds a place
-                                #where new_item fits.
-                                while pos > 0:
-                                    parent_pos = (pos - 1) >> 1
-                                    parent = heap[parent_pos]
-                                    if new_dist > parent:
-                                        heap[pos] = parent
-                                        pos = parent_pos
-                                    else:
-                                        break
-                                heap[pos] = new_dist
-                                
-                        #Checks if now the queue is full
-                        if heap_size == n_res:
-                            #If it is so, filters the queue
-                            #The heap is full: if the distance of the border of the node from the query point
-                            #is greather than the kth distance then no point in that node can be one of the
-                            #k nearest neighbour's                              
-                            d_max = heap[0]                                  
-                            queue = [(d, r, n) for (d, r, n) in queue if d <= d_max]                                
-                    else:
-                        if heap_size < n_res:
-                            for child in node['children']:
-                                dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                                radius = child['radius']
-                                if dist <= radius:
-                                    dist = 0
-                                else:
-                                    dist -= radius
-                                queue.append((dist, radius, child))
-                             
-                            queue.sort(key=lambda q:q[0], reverse=True)
-                        else:
-                            d_max = heap[0]        
-                            queue = [(d, r, n) for (d, r, n) in queue if d <= d_max]                            
-                            for child in node['children']:
-                                dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                                radius = child['radius']
-                                if dist <= radius:
-                                    dist = 0
-                                else:
-                                    dist -= radius
-                                
-                                if dist <= d_max:
-                                    #The heap is full: if the distance of the border of the node from the query point
-                                    #is greather than the kth distance then no point in that node can be one of the
-                                    #k nearest neighbour's                                       
-                                    queue.append((dist, radius, child))
-
-                            queue = sorted([(d, r, n) for (d, r, n) in queue if d <= d_max],
-                                           key=lambda q:q[0], reverse=True)
-                                                            
-            #Filters the possible nearest neighbours such that their distance is not greater than the the distance of the kth
-            #nearest neighbour (plus the tolerance)
-            s = ['{} '.format(i_d) for (d, i_d) in 
-                        sorted([(d, i_d) for (d, i_d) in heap_elements if d <= heap[0] + 0.001], 
-                               cmp=compare_items)[:n_res]]
-            
-            print ''.join(s)
-#DEBUG            
-#            file_out.write(''.join(s))
-#            file_out.write('\n')        
-        else:    
-            #query type 'q'
-            
-            #Starts a query on the topics, and as soon as it encounters new topics
-            #(from the closest ones to the query point to the farthest) 
-            
-            questions_heap = []
-            heap_elements = {}
-            
-            if topics_tree['leaf']:
-                #The SS-tree for topics is just made of a root node:
-                #All the points must be checked
-   
-                points = topics_tree['points']
-                for p in points:
-                    t_id = p['t_id']
-                    (x,y) = topics[t_id]
+#On-disk image of the indices (see ss_image_write): all the records are little-endian, with no padding
+IMAGE_MAGIC = 'SSTI'
+IMAGE_VERSION = 1
+#magic, version, digest of the input, number of: topics tree nodes, points, inverted lists links, questions index nodes,
+#questions index entries
+IMAGE_HEADER = Struct('<4sI20siiiii')
+#x, y, radius, leaf, first, count, key: the entries of a node are the records first..first+count-1 of the nodes table
+#(intermediate nodes), of the points table (leaves of the topics tree) or of the questions entries (leaves of the
+#questions index, whose key is the q_id)
+IMAGE_NODE = Struct('<dddiiii')
+#x, y, t_id
+IMAGE_POINT = Struct('<ddi')
+IMAGE_INT = Struct('<i')
 
-                    new_dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
+''' Computes the digest of the topics and questions section of an input, used to check whether an image is stale.
+    @param T, Q:    The number of topics and questions;
+    @param topics_lines, questions_lines:    The lines of the input describing topics and questions;
+    @return:    The SHA-1 digest, as a 20 bytes string.
+'''
+def ss_image_digest(T, Q, topics_lines, questions_lines):
+    digest = sha1('{} {}\n'.format(T, Q))
+    for line in topics_lines:
+        digest.update(line)
+    for line in questions_lines:
+        digest.update(line)
+    return digest.digest()
 
-                    if len(heap_elements) >= n_res:
-                        if new_dist > questions_heap[n_res-1] + 0.001:
-                            continue
-                        
-                        useful = False
-                        for q_id in topics_relevant_questions[t_id]:
-                            if q_id in heap_elements and heap_elements[q_id] <= new_dist:
-                                continue
-                            else:
-                                useful = True
-                                heap_elements[q_id] = new_dist
-                        
-                        if useful:
-                            questions_heap = sorted(heap_elements.itervalues())
-                    else:
-                        
-                        for q_id in topics_relevant_questions[t_id]:
-                            if q_id in heap_elements and heap_elements[q_id] <= new_dist:
-                                    continue
-                            else:
-                                heap_elements[q_id] = new_dist
-                        if len(heap_elements) >= n_res:
-                            questions_heap = sorted(heap_elements.itervalues())      
+''' Lists the nodes of a SS-tree in breadth-first order, so that the children of every node are contiguous,
+    as records for the image.
+    @param tree:    The root of the tree;
+    @param entries:    The list to which the entries of the leaves are appended, in the same order as the leaves;
+    @param entry_record:    A function mapping a leaf's entry to the record appended to entries;
+    @return:    The list of the nodes' records, the root being the first one.
+'''
+def ss_image_nodes(tree, entries, entry_record):
+    records = []
+    nodes = [tree]
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        i += 1
+        if node.leaf:
+            key = getattr(node, 'q_id', 0)
+            records.append((node.x, node.y, node.radius, 1, len(entries), len(node.points), key))
+            for p in node.points:
+                entries.append(entry_record(p))
+        else:
+            records.append((node.x, node.y, node.radius, 0, len(nodes), len(node.children), 0))
+            nodes.extend(node.children)
+    return records
+
+''' Saves the indices built from an input in a flat binary file, that later runs on the same topics and questions
+    can map in memory and query directly (see SSTreeImage) instead of parsing the input and building the trees.
+    The file is written under a temporary name and then renamed, so that a reader never sees a partial image.
+    @param file_name:    The image file's name;
+    @param digest:    The digest of the input (see ss_image_digest);
+    @param topics_tree:    The root of the topics SS-tree;
+    @param questions_tree:    The root of the questions index, or None if there is no question;
+    @param topics_questions:    The inverted lists of the questions of each topic, indexed by the topics' dense
+                                indices (see nearby_parse.invert_questions).
+'''
+def ss_image_write(file_name, digest, topics_tree, questions_tree, topics_questions):
+    points = []
+    nodes = ss_image_nodes(topics_tree, points, lambda p: p)
+    points_index = {}
+    for i in xrange(len(points)):
+        points_index[points[i]] = i
+
+    #Inverted lists: the questions of the i-th point are links[links_first[i]:links_first[i+1]]
+    (t_offsets, t_questions) = topics_questions
+    links_first = [0]
+    links = []
+    for p in points:
+        links.extend(t_questions[t_offsets[p.index]:t_offsets[p.index + 1]])
+        links_first.append(len(links))
+
+    q_entries = []
+    if questions_tree is None:
+        q_nodes = []
+    else:
+        q_nodes = ss_image_nodes(questions_tree, q_entries, lambda p: points_index[p])
+
+    chunks = [IMAGE_HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, digest, len(nodes), len(points), len(links),
+                                len(q_nodes), len(q_entries))]
+    chunks.extend([IMAGE_NODE.pack(*record) for record in nodes])
+    chunks.extend([IMAGE_POINT.pack(p.x, p.y, p.t_id) for p in points])
+    chunks.append(pack('<{}i'.format(len(links_first)), *links_first))
+    chunks.append(pack('<{}i'.format(len(links)), *links))
+    chunks.extend([IMAGE_NODE.pack(*record) for record in q_nodes])
+    chunks.append(pack('<{}i'.format(len(q_entries)), *q_entries))
+
+    tmp_name = file_name + '.tmp'
+    f = open(tmp_name, 'wb')
+    try:
+        f.write(''.join(chunks))
+    finally:
+        f.close()
+    os.rename(tmp_name, file_name)
+
+''' The indices saved by ss_image_write, memory-mapped and queried in place: records are unpacked only when the
+    searches visit them, so opening an image takes the same time regardless of its size, and the pages actually
+    touched by the queries are the only ones read from disk.
+    The searches are the same best-first searches of ss_questions_index_knn, and give the same results as the
+    ones on the trees the image was built from.
+'''
+class SSTreeImage(object):
+
+    ''' Constructor
+        @param file_name:    The image file's name;
+        @raise ValueError:    If the file is not a valid image.
+    '''
+    def __init__(self, file_name):
+        f = open(file_name, 'rb')
+        try:
+            size = os.fstat(f.fileno()).st_size
+            if size < IMAGE_HEADER.size:
+                raise ValueError('{} is not a valid image'.format(file_name))
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        (magic, version, self.digest, n_nodes, n_points, n_links, n_q_nodes, n_q_entries) = \
+            IMAGE_HEADER.unpack_from(self.mm, 0)
+        if magic != IMAGE_MAGIC or version != IMAGE_VERSION:
+            self.mm.close()
+            raise ValueError('{} is not a valid image'.format(file_name))
+
+        self.nodes_offset = IMAGE_HEADER.size
+        self.points_offset = self.nodes_offset + n_nodes * IMAGE_NODE.size
+        self.links_first_offset = self.points_offset + n_points * IMAGE_POINT.size
+        self.links_offset = self.links_first_offset + (n_points + 1) * IMAGE_INT.size
+        self.q_nodes_offset = self.links_offset + n_links * IMAGE_INT.size
+        self.q_entries_offset = self.q_nodes_offset + n_q_nodes * IMAGE_NODE.size
+        self.has_questions_index = n_q_nodes > 0
+        if self.q_entries_offset + n_q_entries * IMAGE_INT.size != size:
+            self.mm.close()
+            raise ValueError('{} is truncated'.format(file_name))
+
+    ''' Closes the memory map.
+    '''
+    def close(self):
+        self.mm.close()
+
+    ''' k-nearest neighbours search for the topics closest to a point (t-type query).
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of topics required (must be positive);
+        @return:    The ids of the n_res topics closest to (x0, y0), sorted as for ss_tree_topics_knn.
+    '''
+    def topics_knn(self, x0, y0, n_res):
+        mm = self.mm
+        node_at = IMAGE_NODE.unpack_from
+        point_at = IMAGE_POINT.unpack_from
+        nodes_offset = self.nodes_offset
+        points_offset = self.points_offset
+
+        top_k = BoundedTopK(n_res)
+        push = top_k.push
+        d_max = top_k.bound
+
+        queue = [(0., 0)]
+        while len(queue) > 0:
+            (d, i) = heappop(queue)
+            if d > d_max:
+                break
+
+            (x, y, radius, leaf, first, count, key) = node_at(mm, nodes_offset + i * IMAGE_NODE.size)
+            if leaf:
+                for j in xrange(first, first + count):
+                    (x, y, t_id) = point_at(mm, points_offset + j * IMAGE_POINT.size)
+                    dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
+                    if dist <= d_max:
+                        d_max = push(dist, t_id)
             else:
-                queue = []
-                
-                #Adds all the root's children to the queue, and then examine them one by one from the closest points to the
-                #query point to the farthest ones: for each one checks the queries for which the topic is relevant
-                #and for each of this queries checks if other closer relevant topics have been already found or not.
-                #When at list n_res different questions have been met, starts comparing the distance from the query point
-                #of farthest one to the distances (from the query point) of the SS-tree nodes' borders, pruning the search
-                #on the nodes too far away.
-                children = topics_tree['children']
-                for child in children:
-                    dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                    radius = child['radius']
-                    if dist <= radius:
-                        dist = 0
-                    else:
-                        dist -= radius
-                    queue.append((dist, radius, child))
+                self.__push_children(queue, nodes_offset, first, count, x0, y0, d_max)
 
-                queue.sort(key=lambda q:q[0], reverse=True)
-                
-                while len(queue) > 0:
-                    (d, r, node) = queue.pop()
-                    
-                    if node['leaf']:
-                        points = node['points']
-                        for p in points:
-                            t_id = p['t_id']
-                            (x,y) = topics[t_id]
-
-                            new_dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)                           
-                                              
-                            if len(heap_elements) >= n_res:
-                                if new_dist > questions_heap[n_res-1] + 0.001:
-                                    continue
-                                
-                                useful = False
-                                for q_id in topics_relevant_questions[t_id]:
-                                    if q_id in heap_elements and heap_elements[q_id] <= new_dist:
-                                        continue
-                                    else:
-                                        useful = True
-                                        heap_elements[q_id] = new_dist
-                                
-                                if useful:
-                                    questions_heap = sorted(heap_elements.itervalues())
-                            else:
-                                
-                                for q_id in topics_relevant_questions[t_id]:
-                                    if q_id in heap_elements and heap_elements[q_id] <= new_dist:
-                                        continue
-                                    else:
-                                        heap_elements[q_id] = new_dist
-                                        
-                                if len(heap_elements) >= n_res:
-                                    questions_heap = sorted(heap_elements.itervalues())
-                                
-                        #Checks if it has already found at least n_res questions
-                        if len(heap_elements) >= n_res:
-                            #If it is so, filters the queue
-                            d_max = questions_heap[n_res-1] + 0.001                                  
-                            queue = [(d, r, n) for (d, r, n) in queue if d <= d_max]                                
-                    else:
-                        
-                        if len(heap_elements) < n_res:
-                            for child in node['children']:
-                                dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                                radius = child['radius']
-                                if dist <= radius:
-                                    dist = 0
-                                else:
-                                    dist -= radius
-                                queue.append((dist, radius, child))
-                              
-                            queue.sort(key=lambda q:q[0], reverse=True)
-                        else:
-                            for child in node['children']:
-                                dist = sqrt((child['x'] - x0) ** 2 + (child['y'] - y0) ** 2)
-                                radius = child['radius']
-                                if dist <= radius:
-                                    dist = 0
-                                else:
-                                    dist -= radius
-                                d_max = questions_heap[n_res-1] + 0.001
-                                if dist <= d_max:
-                                    queue.append((dist, radius, child))
+        return top_k.ids()
 
-                            queue = sorted([(d, r, n) for (d, r, n) in queue if d <= d_max], key=lambda q:q[0], reverse=True)
-  
+    ''' k-nearest neighbours search for the questions closest to a point (q-type query) on the questions index
+        (see ss_questions_index_knn).
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of questions required (must be positive);
+        @return:    The ids of the n_res questions closest to (x0, y0), sorted as for ss_tree_topics_knn.
+    '''
+    def questions_knn(self, x0, y0, n_res):
+        if not self.has_questions_index:
+            return []
+        mm = self.mm
+        node_at = IMAGE_NODE.unpack_from
+        point_at = IMAGE_POINT.unpack_from
+        int_at = IMAGE_INT.unpack_from
+        q_nodes_offset = self.q_nodes_offset
+        q_entries_offset = self.q_entries_offset
+        points_offset = self.points_offset
 
+        results = []
+        found = set()
+        #The n_res smallest upper bounds of distinct questions computed so far
+        upper_bounds = BoundedTopK(n_res)
+        bounded = set()
+        d_max = upper_bounds.bound
 
-                
-            s = ['{} '.format(i_d) for (d, i_d) in 
-                 sorted([(d, i_d) for (i_d, d) in heap_elements.iteritems()],
-                        cmp=compare_items)[:n_res] ]
-            
-            print ''.join(s)
-#DEBUG            
-#            file_out.write(''.join(s))
-#            file_out.write('\n')        
+        #Entries are (distance, exact, node index): exact is 1 iff the node is a leaf and distance is its exact distance
+        queue = [(0., 0, 0)]
+        while len(queue) > 0:
+            (d, exact, i) = heappop(queue)
+            if d > d_max:
+                break
+
+            (x, y, radius, leaf, first, count, q_id) = node_at(mm, q_nodes_offset + i * IMAGE_NODE.size)
+            if exact:
+                if q_id not in found:
+                    found.add(q_id)
+                    results.append((d, q_id))
+            elif leaf:
+                if q_id in found:
+                    continue
+                #The distance of the leaf is the one of its nearest topic
+                dist = float('inf')
+                for j in xrange(first, first + count):
+                    (x, y, t_id) = point_at(mm, points_offset +
+                                            int_at(mm, q_entries_offset + j * IMAGE_INT.size)[0] * IMAGE_POINT.size)
+                    dist = min(dist, (x - x0) ** 2 + (y - y0) ** 2)
+                dist = sqrt(dist)
+                if dist <= d_max:
+                    heappush(queue, (dist, 1, i))
+                    if q_id not in bounded:
+                        bounded.add(q_id)
+                        d_max = upper_bounds.push(dist, q_id)
+            else:
+                self.__push_children(queue, q_nodes_offset, first, count, x0, y0, d_max, (0,))
+
+        return [i_d for (d, i_d) in sort_results(results)[:n_res]]
+
+    ''' k-nearest neighbours search for the questions closest to a point (q-type query) on the topics tree:
+        topics are visited in order of increasing distance, so the first topic met for each question gives
+        the distance of the question, read from the topic's inverted list.
+        @param x0, y0:    The coordinates of the query point;
+        @param n_res:    The number of questions required (must be positive);
+        @return:    The ids of the n_res questions closest to (x0, y0), sorted as for ss_tree_topics_knn.
+    '''
+    def questions_topics_knn(self, x0, y0, n_res):
+        mm = self.mm
+        node_at = IMAGE_NODE.unpack_from
+        point_at = IMAGE_POINT.unpack_from
+        int_at = IMAGE_INT.unpack_from
+        nodes_offset = self.nodes_offset
+        points_offset = self.points_offset
+        links_first_offset = self.links_first_offset
+        links_offset = self.links_offset
 
-    return  
+        results = []
+        found = set()
+        d_max = float('inf')
 
+        #Entries are (distance, is_point, index): index refers to the points table iff is_point is 1
+        queue = [(0., 0, 0)]
+        while len(queue) > 0:
+            (d, is_point, i) = heappop(queue)
+            if d > d_max:
+                break
+
+            if is_point:
+                start = int_at(mm, links_first_offset + i * IMAGE_INT.size)[0]
+                stop = int_at(mm, links_first_offset + (i + 1) * IMAGE_INT.size)[0]
+                for j in xrange(start, stop):
+                    q_id = int_at(mm, links_offset + j * IMAGE_INT.size)[0]
+                    if q_id not in found:
+                        found.add(q_id)
+                        results.append((d, q_id))
+                        if len(results) == n_res:
+                            d_max = d + 0.001
+                continue
+
+            (x, y, radius, leaf, first, count, key) = node_at(mm, nodes_offset + i * IMAGE_NODE.size)
+            if leaf:
+                for j in xrange(first, first + count):
+                    (x, y, t_id) = point_at(mm, points_offset + j * IMAGE_POINT.size)
+                    dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
+                    if dist <= d_max:
+                        heappush(queue, (dist, 1, j))
+            else:
+                self.__push_children(queue, nodes_offset, first, count, x0, y0, d_max, (0,))
+
+        return [i_d for (d, i_d) in sort_results(results)[:n_res]]
+
+    ''' Answers a single query (see answer_query).
+        @param q_type:    The type of the query, 't' or 'q';
+        @param n_res:    The number of results required;
+        @param x0, y0:    The coordinates of the query point;
+        @param questions_index:    If True, q-type queries are answered on the questions index, otherwise on the topics tree;
+        @return:    The ids of the results, formatted as a single line (without line terminator).
+    '''
+    def answer_query(self, q_type, n_res, x0, y0, questions_index=True):
+        if n_res == 0:
+            return ''
+
+        if q_type == 't':
+            result = self.topics_knn(x0, y0, n_res)
+        elif questions_index:
+            result = self.questions_knn(x0, y0, n_res)
+        else:
+            result = self.questions_topics_knn(x0, y0, n_res)
+
+        return ''.join(['{} '.format(i_d) for i_d in result])
+
+    ''' Pushes in the queue the children first..first+count-1 of a node whose border is not farther than d_max
+        from the query point, as tuples (distance of the border,) + tag + (child index,).
+    '''
+    def __push_children(self, queue, nodes_offset, first, count, x0, y0, d_max, tag=()):
+        mm = self.mm
+        node_at = IMAGE_NODE.unpack_from
+        for j in xrange(first, first + count):
+            (x, y, radius, leaf, c_first, c_count, key) = node_at(mm, nodes_offset + j * IMAGE_NODE.size)
+            dist = sqrt((x - x0) ** 2 + (y - y0) ** 2)
+            if dist <= radius:
+                dist = 0.
+            else:
+                dist -= radius
+            if dist <= d_max:
+                heappush(queue, (dist,) + tag + (j,))
+
+''' Opens the image of an input's indices, if it is up to date.
+    @param file_name:    The image file's name;
+    @param digest:    The digest of the input (see ss_image_digest);
+    @return:    The SSTreeImage, or None if the file doesn't exist, is not a valid image or was built from
+                a different input.
+'''
+def ss_image_load(file_name, digest):
+    try:
+        image = SSTreeImage(file_name)
+    except (IOError, OSError, ValueError, mmap.error):
+        return None
+    if image.digest != digest:
+        image.close()
+        return None
+    return image
+
+''' Parses the topics and questions of the input.
+    @param topics_lines:    The list of the T lines describing the topics;
+    @param questions_lines:    The list of the Q lines describing the questions;
+    @return: (topics_points, topics_questions, questions)
+             As for load_topics_and_questions.
+'''
+def parse_topics_and_questions(topics_lines, questions_lines):
+    #The lines are split in their tokens and converted as the whole input is (see nearby_parse.read_input)
+    (topics, end) = nearby_parse.parse_topics(''.join(topics_lines).split(), 0, len(topics_lines))
+    (questions, end) = nearby_parse.parse_questions(''.join(questions_lines).split(), 0, len(questions_lines))
+    return load_topics_and_questions(topics, questions)
+
+''' Loads the topics and questions read by nearby_parse.read_input: the topics are referred to by their dense
+    indices, and the questions and their inverted lists are kept in flat arrays (see nearby_parse.py).
+    @param topics:    The topics, as arrays (t_ids, t_x, t_y);
+    @param questions:    The questions, as arrays (q_ids, q_offsets, q_topics);
+    @return: (topics_points, topics_questions, questions)
+             The list of the topics' SSPoints, in the order of their dense indices, the inverted lists of the
+             questions of each topic (see nearby_parse.invert_questions), and the questions with at least one
+             topic, as arrays (q_ids, q_offsets, q_topics) with the topics' dense indices.
+'''
+def load_topics_and_questions(topics, questions):
+    (t_ids, t_x, t_y) = topics
+    topics_points = [SSPoint(x, y, t_id, i) for (i, t_id, x, y) in izip(xrange(len(t_ids)), t_ids, t_x, t_y)]
+    questions = nearby_parse.dense_questions(topics, questions)
+    return (topics_points, nearby_parse.invert_questions(questions, len(t_ids)), questions)
+
+''' Builds the indices used to answer the queries.
+    @param topics_points:    The list of the topics' SSPoints, in the order of their dense indices;
+    @param questions:    The questions with at least one topic, as arrays (q_ids, q_offsets, q_topics) with the
+                         topics' dense indices (see load_topics_and_questions);
+    @param questions_index:    If True, the questions index is built (see ss_questions_index);
+    @param grid:    If True, the uniform grid of the topics is built (see nearby_grid.UniformGrid);
+    @return: (topics_tree, questions_tree, topics_grid)
+             The root of the topics SS-tree, the root of the questions index and the grid (None if not built).
+'''
+def build_indices(topics_points, questions, questions_index=True, grid=False):
+    #Creates the SS-tree for the topics (points): since the whole set of topics is known in advance,
+    #the tree is bulk-loaded instead of inserting the topics one at a time
+    topics_tree = ss_tree_bulk_load(topics_points)
+
+    if questions_index:
+        (q_ids, q_offsets, q_topics) = questions
+        questions_points = ((q_ids[i], [topics_points[t] for t in q_topics[q_offsets[i]:q_offsets[i + 1]]])
+                            for i in xrange(len(q_ids)))
+        questions_tree = ss_questions_index(questions_points, topics_tree)
+    else:
+        questions_tree = None
+    if grid:
+        topics_grid = nearby_grid.UniformGrid([(p.t_id, p.x, p.y) for p in topics_points])
+    else:
+        topics_grid = None
+    return (topics_tree, questions_tree, topics_grid)
+
+''' Reads the queries left in a file (see nearby_parse.read_queries).
+    @param f:    The file from which the queries should be read;
+    @param N:    The number of queries;
+    @return:    The list of the queries, as tuples (q_type, n_res, x0, y0).
+'''
+def read_queries(f, N):
+    return nearby_parse.queries_list(nearby_parse.read_queries(f, N))
+
+'''Reads the input from a file f
+   The input is assumed to be formatted as follows:
+   First line: 3 integers T  Q  N
+   T lines composed by an integer and 2 doubles
+   Q lines composed by 2 integers q_id Qn and then another Qn integers
+   N lines composed by 1 char, 1 int and 2 doubles
+   @param f:    The file from which the input should be read;
+   @param questions_index:    If True (default), q-type queries are answered using an index built on the questions
+                              bounding spheres; otherwise they are answered walking the topics tree.
+   @param jobs:    If different from 1, all the queries are read and then answered by this many worker processes
+                   (see nearby_parallel.run_sharded); otherwise the queries are answered one by one.
+   @param image_file:    If not None, the name of the image of the indices (see ss_image_write): if it is up to date
+                         with the topics and questions in the input, these are not parsed and the queries are answered
+                         on the memory-mapped image; otherwise the indices are built as usual and the image is (re)written.
+                         The image is not used when grid is True.
+   @param grid:    If True, t-type queries are answered with a uniform grid of the topics (see nearby_grid.UniformGrid)
+                   instead of the topics SS-tree.
+   @param batch:    If True, all the queries are read and then answered in the order of a Hilbert curve
+                    (see answer_queries_batch); not used with the image.
+   @param cache:    If not None, a QueryCache (see nearby_cache) through which the queries are answered, so that
+                    queries repeating the location of a previous one are answered by slicing its results; the cache
+                    is not used with batch, with stats_file, or with more than one job.
+'''
+def read_and_process_input(f, questions_index=True, jobs=1, image_file=None, grid=False, batch=False, epsilon=0.,
+                           stats_file=None, cache=None):
+    if grid or epsilon > 0 or stats_file is not None:
+        image_file = None
+    if batch or stats_file is not None or jobs != 1:
+        cache = None
+    if image_file is not None:
+        #INVARIANT: the input is assumed well formed and adherent to the specs above
+        (T, Q, N) = [int(t) for t in f.readline().split()]
+
+        #The raw lines are only hashed to check the image, and parsed just if it is stale
+        topics_lines = [f.readline() for i in xrange(T)]
+        questions_lines = [f.readline() for i in xrange(Q)]
+        digest = ss_image_digest(T, Q, topics_lines, questions_lines)
+        image = ss_image_load(image_file, digest)
+        if image is not None:
+            del topics_lines, questions_lines
+            answer = lambda q_type, n_res, x0, y0: image.answer_query(q_type, n_res, x0, y0, questions_index)
+            if cache is not None:
+                answer = cached_answer(cache, answer)
+            process_queries(read_queries(f, N), answer, jobs)
+            return
+        (topics_points, topics_questions, questions) = parse_topics_and_questions(topics_lines, questions_lines)
+        queries = read_queries(f, N)
+    else:
+        #The whole input is read and converted at once (see nearby_parse.py)
+        (topics, questions, queries) = nearby_parse.read_input(f)
+        (topics_points, topics_questions, questions) = load_topics_and_questions(topics, questions)
+        queries = nearby_parse.queries_list(queries)
+        del topics
+    (topics_tree, questions_tree, topics_grid) = build_indices(topics_points, questions,
+                                                               questions_index or image_file is not None, grid)
+    del topics_points
+
+    if image_file is not None:
+        del topics_lines, questions_lines
+        try:
+            ss_image_write(image_file, digest, topics_tree, questions_tree, topics_questions)
+        except (IOError, OSError), e:
+            stderr.write('Unable to write the image {}: {}\n'.format(image_file, e))
+
+    if not questions_index:
+        questions_tree = None
+    answer = lambda q_type, n_res, x0, y0: answer_query(q_type, n_res, x0, y0, topics_tree, questions_tree,
+                                                        topics_questions, topics_grid, epsilon)
+    if batch:
+        answer_batch = lambda queries: answer_queries_batch(queries, topics_tree, questions_tree,
+                                                            topics_questions, topics_grid, epsilon)
+    else:
+        answer_batch = None
+    if topics_grid is None and epsilon == 0:
+        answer_pair = lambda query, other: answer_co_located(query, other, topics_tree, topics_questions)
+    else:
+        answer_pair = None
+
+    if stats_file is not None:
+        #Queries are answered one by one, in input order, recording their counters and wall time
+        query_stats = QueryStats()
+        def answer(q_type, n_res, x0, y0):
+            stats = {}
+            start = time()
+            line = answer_query(q_type, n_res, x0, y0, topics_tree, questions_tree, topics_questions,
+                                topics_grid, epsilon, stats)
+            query_stats.add(q_type, stats, time() - start)
+            return line
+        process_queries(queries, answer)
+        query_stats.write(stats_file)
+        return
+
+    if cache is not None:
+        answer = cached_answer(cache, answer)
+        if answer_pair is not None:
+            answer_pair = cached_answer_pair(cache, answer, answer_pair)
+    process_queries(queries, answer, jobs, answer_batch, answer_pair)
+    return
+
+''' Answers the queries, writing the answers in the same order.
+    @param queries:    The list of the queries, as tuples (q_type, n_res, x0, y0);
+    @param answer:    A function taking (q_type, n_res, x0, y0) and returning the answer to the query, as a single line;
+    @param jobs:    If different from 1, the queries are answered by this many worker processes
+                    (see nearby_parallel.run_sharded); otherwise they are answered one by one.
+    @param answer_batch:    If not None, a function taking a list of queries and returning the list of their answers:
+                            all the queries are answered at once (or a slice at the time, by each worker process);
+    @param answer_pair:    If not None, a function taking two consecutive co-located queries (see co_located) and
+                           returning the pair of their answers, used instead of answer for them.
+'''
+def process_queries(queries, answer, jobs=1, answer_batch=None, answer_pair=None):
+    if jobs != 1:
+        nearby_parallel.run_sharded(answer_queries_slice, (queries, answer, answer_batch, answer_pair), len(queries),
+                                    jobs, stdout)
+        return
+    if answer_batch is not None:
+        stdout.write(''.join(['{}\n'.format(line) for line in answer_batch(queries)]))
+        return
+    for line in answer_queries_list(queries, answer, answer_pair):
+        print line
+    return
+
+''' Answers a list of queries one by one, answering together each pair of consecutive co-located queries.
+    @param queries:    The list of the queries, as tuples (q_type, n_res, x0, y0);
+    @param answer, answer_pair:    See process_queries;
+    @return:    The list of the answers, in the same order as the queries.
+'''
+def answer_queries_list(queries, answer, answer_pair=None):
+    lines = []
+    i = 0
+    while i < len(queries):
+        if answer_pair is not None and i + 1 < len(queries) and co_located(queries[i], queries[i + 1]):
+            lines.extend(answer_pair(queries[i], queries[i + 1]))
+            i += 2
+        else:
+            lines.append(answer(*queries[i]))
+            i += 1
+    return lines
+
+''' Answers a single query.
+    @param q_type:    The type of the query, 't' or 'q';
+    @param n_res:    The number of results required;
+    @param x0, y0:    The coordinates of the query point;
+    @param topics_tree:    The root of the topics SS-tree;
+    @param questions_tree:    The root of the questions index, or None to answer q-type queries walking the topics tree;
+    @param topics_questions:    The inverted lists of the questions of each topic, indexed by the topics' dense
+                                indices (see nearby_parse.invert_questions);
+    @param topics_grid:    If not None, the uniform grid of the topics used for t-type queries instead of the topics tree;
+    @param epsilon:    The approximation factor of the searches on the SS-trees (see ss_tree_topics_search);
+                       the grid and the walk of the topics tree are always exact;
+    @param stats:    If not None, a dictionary of counters, updated with the ones of the search (see nearby_stats);
+    @return:    The ids of the results, formatted as a single line (without line terminator).
+'''
+def answer_query(q_type, n_res, x0, y0, topics_tree, questions_tree, topics_questions, topics_grid=None,
+                 epsilon=0., stats=None):
+    if n_res == 0:
+        return ''
+
+    #Switches the type of query
+    if q_type == 't':
+        if topics_grid is not None:
+            result = topics_grid.topics_knn(x0, y0, n_res, stats)
+        else:
+            result = ss_tree_topics_knn(topics_tree, x0, y0, n_res, epsilon, stats)
+    elif questions_tree is not None:
+        result = ss_questions_index_knn(questions_tree, x0, y0, n_res, epsilon, stats)
+    else:
+        result = ss_tree_questions_knn(topics_tree, topics_questions, x0, y0, n_res, stats)
+
+    return ''.join(['{} '.format(i_d) for i_d in result])
+
+''' Checks whether two queries can be answered together by ss_tree_fused_search: one t-type and one q-type query
+    at the same point, both requiring some results.
+    @param query, other:    The two queries, as tuples (q_type, n_res, x0, y0);
+    @return:    True iff the two queries are co-located.
+'''
+def co_located(query, other):
+    return ((query[0] == 't') != (other[0] == 't') and query[2] == other[2] and query[3] == other[3] and
+            query[1] > 0 and other[1] > 0)
+
+''' Answers two co-located queries (see co_located) with a single traversal of the topics tree.
+    @param query, other:    The two queries, as tuples (q_type, n_res, x0, y0);
+    @param topics_tree:    The root of the topics SS-tree;
+    @param topics_questions:    The inverted lists of the questions of each topic, indexed by the topics' dense
+                                indices (see nearby_parse.invert_questions);
+    @return:    The answers to the two queries, formatted as for answer_query, in the same order as the queries.
+'''
+def answer_co_located(query, other, topics_tree, topics_questions):
+    if query[0] == 't':
+        (t_query, q_query) = (query, other)
+    else:
+        (t_query, q_query) = (other, query)
+    (topics, questions) = ss_tree_fused_search(topics_tree, topics_questions, t_query[2], t_query[3],
+                                               t_query[1], q_query[1])
+    t_line = ''.join(['{} '.format(i_d) for (d, i_d) in topics])
+    q_line = ''.join(['{} '.format(i_d) for (d, i_d) in questions])
+    if query[0] == 't':
+        return (t_line, q_line)
+    else:
+        return (q_line, t_line)
+
+''' Answers a query both approximately and exactly, and measures the quality of the approximation.
+    @param q_type, n_res, x0, y0:    The query (n_res must be positive);
+    @param topics_tree:    The root of the topics SS-tree;
+    @param questions_tree:    The root of the questions index;
+    @param epsilon:    The approximation factor;
+    @return:    A dictionary with the number of nodes visited by the approximate ('nodes') and the exact
+                ('exact_nodes') search, the relative error of the approximate k-th distance ('error', 0 if the
+                exact k-th distance is within the tolerance from 0), and the fraction of the exact results that
+                are also in the approximate ones ('recall').
+'''
+def approximate_query_stats(q_type, n_res, x0, y0, topics_tree, questions_tree, epsilon):
+    if q_type == 't':
+        search = lambda epsilon, stats: ss_tree_topics_search(topics_tree, x0, y0, n_res, epsilon=epsilon, stats=stats)
+    else:
+        search = lambda epsilon, stats: ss_questions_index_search(questions_tree, x0, y0, n_res, epsilon=epsilon,
+                                                                  stats=stats)
+    approximate_stats = {}
+    approximate = search(epsilon, approximate_stats)
+    exact_stats = {}
+    exact = search(0., exact_stats)
+
+    stats = {'nodes': approximate_stats['nodes'] + approximate_stats['leaves'],
+             'exact_nodes': exact_stats['nodes'] + exact_stats['leaves'], 'error': 0., 'recall': 1.}
+    if len(exact) > 0:
+        exact_kth = max([d for (d, i_d) in exact])
+        approximate_kth = max([d for (d, i_d) in approximate])
+        if exact_kth > 0.001:
+            stats['error'] = (approximate_kth - exact_kth) / exact_kth
+        exact_ids = set([i_d for (d, i_d) in exact])
+        stats['recall'] = len(exact_ids.intersection([i_d for (d, i_d) in approximate])) / float(len(exact_ids))
+    return stats
+
+#Order of the Hilbert curve used to sort the queries of a batch: coordinates are quantized on a 2^16 x 2^16 grid
+HILBERT_ORDER = 16
+#Number of previous queries (of the same type) considered to seed the pruning radius of a search in a batch
+BATCH_WINDOW = 8
+
+''' Computes the position of a cell along the Hilbert curve covering a square grid.
+    @param x, y:    The (integer) coordinates of the cell, between 0 and 2^order - 1;
+    @param order:    The order of the curve;
+    @return:    The index of the cell along the curve.
+'''
+def hilbert_index(x, y, order=HILBERT_ORDER):
+    n = 1 << order
+    d = 0
+    s = n >> 1
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        #Rotates the quadrant, so that the curve inside it starts and ends at the right corners
+        if ry == 0:
+            if rx == 1:
+                x = n - 1 - x
+                y = n - 1 - y
+            (x, y) = (y, x)
+        s >>= 1
+    return d
+
+''' Answers a batch of queries, visiting them along a Hilbert curve instead of in input order: consecutive
+    queries are then close to each other, and each search can start with a pruning radius taken from the previous
+    queries of the same type. If a previous query found at least n_res results, all within distance d from its
+    point, then they are all within d + delta from the new point (delta being the distance between the two points),
+    so the new k-th distance can't be larger than that, and every node farther than it is pruned right away,
+    before any result is found; the smallest such radius among the last BATCH_WINDOW queries is used (queries ask
+    for different numbers of results, so the very last one might not have found enough of them).
+    Consecutive searches also touch the same subtrees, which stay in the CPU caches.
+    Queries answered with the grid or walking the topics tree are not seeded; a t-type and a q-type query at the
+    same point are answered together, with a single traversal of the topics tree (see ss_tree_fused_search).
+    @param queries:    The list of the queries, as tuples (q_type, n_res, x0, y0);
+    @param topics_tree, questions_tree, topics_questions, topics_grid, epsilon:    See answer_query;
+    @return:    The list of the answers, formatted as for answer_query, in the same order as the queries.
+'''
+def answer_queries_batch(queries, topics_tree, questions_tree, topics_questions, topics_grid=None,
+                         epsilon=0.):
+    lines = [''] * len(queries)
+    if len(queries) == 0:
+        return lines
+
+    #Quantizes the bounding box of the query points
+    x_min = min([x0 for (q_type, n_res, x0, y0) in queries])
+    y_min = min([y0 for (q_type, n_res, x0, y0) in queries])
+    side = max(max([x0 for (q_type, n_res, x0, y0) in queries]) - x_min,
+               max([y0 for (q_type, n_res, x0, y0) in queries]) - y_min)
+    scale = ((1 << HILBERT_ORDER) - 1) / side if side > 0 else 0.
+    #Queries at the same point end up next to each other
+    order = sorted(xrange(len(queries)),
+                   key=lambda i: (hilbert_index(int((queries[i][2] - x_min) * scale), int((queries[i][3] - y_min) * scale)),
+                                  queries[i][2], queries[i][3]))
+
+    #The last queries of each type, as (x0, y0, results)
+    previous = {'t': [], 'q': []}
+
+    #The pruning radius for a query, taken from the previous ones of the same type
+    def seed_limit(q_type, n_res, x0, y0):
+        limit = float('inf')
+        for (x_p, y_p, results) in previous[q_type]:
+            if len(results) >= n_res:
+                #The first n_res results of the previous query are all within this distance from (x0, y0)
+                limit = min(limit, max([d for (d, i_d) in results[:n_res]]) +
+                                   sqrt((x0 - x_p) ** 2 + (y0 - y_p) ** 2) + 0.001)
+        return limit
+
+    def remember(q_type, x0, y0, results):
+        window = previous[q_type]
+        window.append((x0, y0, results))
+        if len(window) > BATCH_WINDOW:
+            del window[0]
+
+    fuse = topics_grid is None and epsilon == 0
+    pos = 0
+    while pos < len(order):
+        i = order[pos]
+        pos += 1
+        (q_type, n_res, x0, y0) = queries[i]
+        if n_res == 0:
+            continue
+        if fuse and pos < len(order) and co_located(queries[i], queries[order[pos]]):
+            #A t-type and a q-type query at the same point: a single traversal answers both
+            j = order[pos]
+            pos += 1
+            (t_i, q_i) = (i, j) if q_type == 't' else (j, i)
+            (topics, questions) = ss_tree_fused_search(topics_tree, topics_questions, x0, y0,
+                                                       queries[t_i][1], queries[q_i][1],
+                                                       seed_limit('t', queries[t_i][1], x0, y0),
+                                                       seed_limit('q', queries[q_i][1], x0, y0))
+            remember('t', x0, y0, topics)
+            remember('q', x0, y0, questions)
+            lines[t_i] = ''.join(['{} '.format(i_d) for (d, i_d) in topics])
+            lines[q_i] = ''.join(['{} '.format(i_d) for (d, i_d) in questions])
+            continue
+        if (q_type == 't' and topics_grid is not None) or (q_type != 't' and questions_tree is None):
+            lines[i] = answer_query(q_type, n_res, x0, y0, topics_tree, questions_tree, topics_questions,
+                                    topics_grid, epsilon)
+            continue
+
+        limit = seed_limit(q_type, n_res, x0, y0)
+        if q_type == 't':
+            results = ss_tree_topics_search(topics_tree, x0, y0, n_res, limit, epsilon)
+        else:
+            results = ss_questions_index_search(questions_tree, x0, y0, n_res, limit, epsilon)
+        remember(q_type, x0, y0, results)
+        lines[i] = ''.join(['{} '.format(i_d) for (d, i_d) in results])
+
+    return lines
+
+''' Answers a contiguous slice of the queries, in a worker process (see nearby_parallel.run_sharded).
+    @param (start, stop):    The range of the queries to answer;
+    @return:    The output for those queries, one line each.
+'''
+def answer_queries_slice((start, stop)):
+    (queries, answer, answer_batch, answer_pair) = nearby_parallel.shared_state
+    if answer_batch is not None:
+        lines = answer_batch(queries[start:stop])
+    else:
+        lines = answer_queries_list(queries[start:stop], answer, answer_pair)
+    return ''.join(['{}\n'.format(line) for line in lines])
+
+''' Main.
+    Reads the input from stdin (DEFAULT) or a file and output the results on stdout.
+    Usage:
+        -f filename     Specifies a file from where the input should be read. If the option is not used or misused or the requested file
+                        doesn't exist, the input is read from stdin.
+        -j jobs         Answers the queries using jobs worker processes, each one taking a contiguous slice of the queries
+                        (0 means one for each CPU) [Default is 1: the whole input is read at once by the bulk loader
+                        (see nearby_parse.py), and the queries are then answered one by one].
+        -i filename     Keeps an image of the indices in the file: if the file holds the image of the same topics and questions,
+                        it is memory-mapped and queried directly, skipping parsing and construction; otherwise the indices are
+                        built from the input and the image is saved for the next runs.
+        -g              Answers t-type queries with a uniform grid of the topics instead of the SS-tree (see nearby_grid.py);
+                        the image (-i) is not used with this option.
+        -b              Reads all the queries and answers them in the order of a Hilbert curve, each search starting with the
+                        pruning radius of the previous one (see answer_queries_batch); the output is in the original order.
+        -e epsilon      Approximate searches: the k-th distance of each answer is at most (1 + epsilon) times the exact one
+                        (see ss_tree_topics_search); the image (-i) is not used with this option.
+        -s filename     Records counters (nodes expanded, leaves scanned, distances computed, candidates not among
+                        the results) and wall time of every query, and writes their aggregates and percentiles to the file, as JSON if its name
+                        ends with .json, as CSV otherwise (see nearby_stats.py); queries are then answered one by one in input
+                        order (-j and -b are ignored) and the image (-i) is not used.
+        -c size[,quantum]    Answers the queries through an LRU cache holding at most size results (see nearby_cache.py), so that
+                        a query at the same point as a recent one is answered by slicing its results; with a positive quantum,
+                        query points are snapped to a grid with that step, and queries in the same cell share their (then
+                        approximate) results. The counters of the cache are written to stderr at the end; not used with -b,
+                        -s or -j.
+'''
 if __name__ == '__main__':
-  
-    read_and_process_input(stdin)
+
+    file_in = stdin
+    jobs = 1
+    image_file = None
+    grid = False
+    batch = False
+    epsilon = 0.
+    stats_file = None
+    cache = None
+
+    i = 1
+    while i < len(argv):
+        if (argv[i] == '-f'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -f: filename required'
+                break
+            try:
+                file_in = open(argv[i], 'r')
+            except:
+                print 'The requested file: {} does not exist. Please insert your input from the terminal.'.format(argv[i])
+                file_in = stdin
+        elif (argv[i] == '-j'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -j: int required'
+                break
+            try:
+                jobs = int(argv[i])
+            except:
+                print 'Error using -j option: queries will be answered sequentially'
+                jobs = 1
+        elif (argv[i] == '-i'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -i: filename required'
+                break
+            image_file = argv[i]
+        elif (argv[i] == '-g'):
+            grid = True
+        elif (argv[i] == '-b'):
+            batch = True
+        elif (argv[i] == '-e'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -e: float required'
+                break
+            try:
+                epsilon = max(0., float(argv[i]))
+            except:
+                print 'Error using -e option: queries will be answered exactly'
+                epsilon = 0.
+        elif (argv[i] == '-s'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -s: filename required'
+                break
+            stats_file = argv[i]
+        elif (argv[i] == '-c'):
+            i += 1
+            if i >= len(argv):
+                print 'Error using option -c: size required'
+                break
+            try:
+                cache = QueryCache(*[t(v) for (t, v) in zip((int, float), argv[i].split(','))])
+            except:
+                print 'Error using -c option: queries will not be cached'
+                cache = None
+        i += 1
+
+    read_and_process_input(file_in, jobs=jobs, image_file=image_file, grid=grid, batch=batch, epsilon=epsilon,
+                           stats_file=stats_file, cache=cache)
+    if cache is not None:
+        stderr.write('Cache: {}\n'.format(', '.join(['{}={}'.format(k, v) for (k, v) in sorted(cache.stats().items())])))
+    if file_in != stdin:
+        file_in.close()
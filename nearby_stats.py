@@ -0,0 +1,100 @@
+'''
+@author: mlarocca
+Per-query instrumentation shared by the nearby engines (nearby_rtree.py, nearby_fast.py, nearby_grid.py).
+When asked to, the searches fill a dictionary of counters for each query; the counters are only updated once
+per node (or per block of queries), never for each single point, and when instrumentation is off no dictionary
+is passed and nothing is counted at all.
+The counters of all the queries are collected by QueryStats, which writes their aggregates and percentiles, for
+each type of query, to a sidecar JSON or CSV file.
+No search re-sorts its candidates: they are kept in bounded heaps (see nearby_topk.py), and only the results are
+sorted, once, at the end, so there is no counter of re-sorts.
+'''
+import json
+from math import ceil
+
+#The counters recorded for each query:
+#   nodes        internal nodes expanded (for the grid, rings of cells);
+#   leaves       leaves scanned (for the grid, cells);
+#   distances    distances computed, from points and from bounding spheres;
+#   unused       candidates (topics for t-type queries, questions for q-type ones) whose distance was computed, but
+#                that are not among the results, whether or not they were pushed into the top-k container.
+COUNTERS = ('nodes', 'leaves', 'distances', 'unused')
+#The percentiles written for each counter
+PERCENTILES = (50, 90, 99)
+
+''' Returns the p-th percentile of a sorted list of values (nearest rank).
+    @param values:    The sorted list of values;
+    @param p:    The percentile, between 0 and 100;
+    @return:    The percentile, or 0 for an empty list.
+'''
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.
+    return values[min(len(values) - 1, int(ceil(p / 100. * len(values))) - 1)]
+
+''' Adds the counts of a search to a dictionary of counters.
+    @param stats:    The dictionary of counters (see COUNTERS);
+    @param nodes, leaves, distances, unused:    The counts to add.
+'''
+def count(stats, nodes=0, leaves=0, distances=0, unused=0):
+    stats['nodes'] = stats.get('nodes', 0) + nodes
+    stats['leaves'] = stats.get('leaves', 0) + leaves
+    stats['distances'] = stats.get('distances', 0) + distances
+    stats['unused'] = stats.get('unused', 0) + unused
+
+''' Collects the counters and the wall time of every query answered.
+'''
+class QueryStats(object):
+
+    ''' Constructor
+    '''
+    def __init__(self):
+        #For each type of query, the list of the counters of each query, as tuples following COUNTERS + ('time_ms',)
+        self.records = {}
+
+    ''' Records a query.
+        @param q_type:    The type of the query, 't' or 'q';
+        @param counters:    A dictionary with (some of) the counters in COUNTERS, missing ones being 0;
+        @param elapsed:    The wall time taken by the query, in seconds.
+    '''
+    def add(self, q_type, counters, elapsed):
+        record = tuple([counters.get(c, 0) for c in COUNTERS]) + (elapsed * 1e3,)
+        self.records.setdefault(q_type, []).append(record)
+
+    ''' Aggregates the counters recorded.
+        @return:    A dictionary with, for each type of query, the number of queries and, for each counter and for
+                    the wall time in milliseconds ('time_ms'), its total, mean, maximum and percentiles.
+    '''
+    def summary(self):
+        summary = {}
+        for (q_type, records) in self.records.iteritems():
+            n = len(records)
+            by_counter = {'queries': n}
+            for (j, counter) in enumerate(COUNTERS + ('time_ms',)):
+                values = sorted([r[j] for r in records])
+                aggregate = {'total': sum(values), 'mean': sum(values) / float(n), 'max': values[-1]}
+                for p in PERCENTILES:
+                    aggregate['p{}'.format(p)] = percentile(values, p)
+                by_counter[counter] = aggregate
+            summary[q_type] = by_counter
+        return summary
+
+    ''' Writes the summary (see summary) to a file: as JSON if its name ends with '.json', otherwise as CSV, with one
+        line for each type of query and counter.
+        @param file_name:    The name of the file.
+    '''
+    def write(self, file_name):
+        summary = self.summary()
+        f = open(file_name, 'w')
+        if file_name.endswith('.json'):
+            json.dump(summary, f, indent=1, sort_keys=True)
+            f.write('\n')
+        else:
+            columns = ['total', 'mean'] + ['p{}'.format(p) for p in PERCENTILES] + ['max']
+            f.write(','.join(['type', 'counter', 'queries'] + columns) + '\n')
+            for q_type in sorted(summary):
+                for counter in COUNTERS + ('time_ms',):
+                    aggregate = summary[q_type][counter]
+                    f.write(','.join([q_type, counter, str(summary[q_type]['queries'])] +
+                                     [repr(aggregate[c]) for c in columns]) + '\n')
+        f.close()
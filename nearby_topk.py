@@ -0,0 +1,214 @@
+'''
+@author: mlarocca
+Bounded top-k container shared by the nearby engines (nearby.py, nearby_fast.py, nearby_rtree.py, nearby_grid.py).
+By specs, two distances within 0.001 are considered equal, and in that case the element with the higher id comes first;
+the k results of a query are the first k elements in this order among the ones whose distance is not greater than
+the k-th smallest distance plus the tolerance.
+The container keeps only those candidates: the k smallest distances in a max-heap, so that the k-th distance is
+always on top (and can be used to prune the search), plus the elements pushed out of it that are still within the
+tolerance from the k-th distance, and that could still precede it in the final order because of their id.
+'''
+from heapq import heappush, heappop, heapreplace
+
+#Distances within this value are considered equal
+TOLERANCE = 0.001
+
+''' Sorts a list of results (distance, id) by ascending distance and, for distances within the tolerance, by descending id.
+    The list is sorted by distance first (and by descending id for identical distances), and then each element is
+    moved before the ones within the tolerance from it that have a smaller id: since it only moves across elements
+    with close but different distances, this takes linear time unless many distances are almost (not exactly) equal.
+    @param results:    The list of tuples (distance, id) to sort (it is sorted in place);
+    @param tolerance:    The tolerance on distances;
+    @return:    The sorted list.
+'''
+def sort_results(results, tolerance=TOLERANCE):
+    results.sort(key=lambda (d, i_d): (d, -i_d))
+    for j in xrange(1, len(results)):
+        (d, i_d) = item = results[j]
+        p = j
+        while p > 0 and results[p - 1][1] < i_d and d <= results[p - 1][0] + tolerance:
+            results[p] = results[p - 1]
+            p -= 1
+        results[p] = item
+    return results
+
+''' Keeps the k nearest elements seen so far, according to the order described above.
+'''
+class BoundedTopK(object):
+    __slots__ = ('k', 'tolerance', 'limit', 'bound', 'best', 'ties')
+
+    ''' Constructor
+        @param k:    The number of results required;
+        @param tolerance:    The tolerance on distances;
+        @param limit:    An upper bound, known in advance, for the k-th distance plus the tolerance: elements farther
+                         than limit are never added.
+    '''
+    def __init__(self, k, tolerance=TOLERANCE, limit=float('inf')):
+        self.k = k
+        self.tolerance = tolerance
+        self.limit = limit
+        #Elements farther than bound can't be among the results (-inf if no result is required)
+        if k > 0:
+            self.bound = limit
+        else:
+            self.bound = float('-inf')
+        #Max-heap of the k smallest distances: entries are (-distance, id)
+        self.best = []
+        #Max-heap of the elements within the tolerance from the k-th distance, but not among the k smallest ones
+        self.ties = []
+
+    ''' Adds an element, if it can be among the results.
+        Adding an element costs O(log k) (plus the removal of the ties it pushes out of the tolerance, each one
+        removed at most once).
+        @param dist:    The element's distance;
+        @param i_d:    The element's ID;
+        @return:    The new bound: elements farther than it can be discarded without pushing them.
+    '''
+    def push(self, dist, i_d):
+        if dist > self.bound:
+            return self.bound
+
+        best = self.best
+        if len(best) < self.k:
+            heappush(best, (-dist, i_d))
+            if len(best) == self.k:
+                self.bound = min(self.limit, self.tolerance - best[0][0])
+        elif dist < -best[0][0]:
+            ties = self.ties
+            heappush(ties, heapreplace(best, (-dist, i_d)))
+            bound = self.bound = min(self.limit, self.tolerance - best[0][0])
+            while -ties[0][0] > bound:
+                heappop(ties)
+                if len(ties) == 0:
+                    break
+        else:
+            heappush(self.ties, (-dist, i_d))
+        return self.bound
+
+    ''' Returns the k-th smallest distance seen so far, in O(1).
+        @return:    The k-th distance, or inf if fewer than k elements have been added.
+    '''
+    def kth_distance(self):
+        if len(self.best) < self.k:
+            return float('inf')
+        return -self.best[0][0]
+
+    ''' Returns the number of elements held, k smallest and ties.
+    '''
+    def __len__(self):
+        return len(self.best) + len(self.ties)
+
+    ''' Returns the results, with their distances.
+        @return:    The list of the tuples (distance, id) of (at most) k elements, sorted as described above.
+    '''
+    def items(self):
+        results = [(-d, i_d) for (d, i_d) in self.best]
+        results.extend([(-d, i_d) for (d, i_d) in self.ties])
+        return sort_results(results, self.tolerance)[:self.k]
+
+    ''' Returns the results.
+        @return:    The ids of (at most) k elements, sorted as described above.
+    '''
+    def ids(self):
+        return [i_d for (d, i_d) in self.items()]
+
+''' Keeps the best (smallest) distance of every key seen so far, and the k-th smallest of them, for searches where
+    each key can be met many times, at decreasing distances (f.i. a question met through each of its topics).
+    The keys with the k smallest distances are kept in an indexed max-heap, which knows the position of each key:
+    when the distance of one of them decreases it is sifted down in place, and a new key closer than the k-th one
+    replaces the top; every update costs O(log k), and the k-th distance is always on top, in O(1).
+'''
+class IndexedTopK(object):
+    __slots__ = ('k', 'distances', 'heap', 'position')
+
+    ''' Constructor
+        @param k:    The number of smallest distances tracked (must be positive).
+    '''
+    def __init__(self, k):
+        self.k = k
+        #Best distance of every key seen
+        self.distances = {}
+        #Max-heap of the keys with the k smallest distances, and the position of each of them in the heap
+        self.heap = []
+        self.position = {}
+
+    ''' Records a distance for a key, if it is smaller than the one already known.
+        @param key:    The key;
+        @param dist:    The distance;
+        @return:    True iff the best distance of the key has changed.
+    '''
+    def update(self, key, dist):
+        distances = self.distances
+        old_dist = distances.get(key)
+        if old_dist is not None and old_dist <= dist:
+            return False
+        distances[key] = dist
+
+        heap = self.heap
+        position = self.position
+        if key in position:
+            self.__sift_down(position[key])
+        elif len(heap) < self.k:
+            heap.append(key)
+            position[key] = len(heap) - 1
+            self.__sift_up(len(heap) - 1)
+        elif dist < distances[heap[0]]:
+            del position[heap[0]]
+            heap[0] = key
+            position[key] = 0
+            self.__sift_down(0)
+        return True
+
+    ''' Returns the k-th smallest distance, in O(1).
+        @return:    The k-th smallest distance, or inf if fewer than k keys have been seen.
+    '''
+    def kth_distance(self):
+        if len(self.heap) < self.k:
+            return float('inf')
+        return self.distances[self.heap[0]]
+
+    ''' Returns the number of keys seen.
+    '''
+    def __len__(self):
+        return len(self.distances)
+
+    ''' Moves the key in position i towards the root, while its distance is larger than its parent's.
+    '''
+    def __sift_up(self, i):
+        heap = self.heap
+        position = self.position
+        distances = self.distances
+        key = heap[i]
+        dist = distances[key]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if distances[heap[parent]] >= dist:
+                break
+            heap[i] = heap[parent]
+            position[heap[i]] = i
+            i = parent
+        heap[i] = key
+        position[key] = i
+
+    ''' Moves the key in position i towards the leaves, while its distance is smaller than one of its children's.
+    '''
+    def __sift_down(self, i):
+        heap = self.heap
+        position = self.position
+        distances = self.distances
+        n = len(heap)
+        key = heap[i]
+        dist = distances[key]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and distances[heap[child + 1]] > distances[heap[child]]:
+                child += 1
+            if distances[heap[child]] <= dist:
+                break
+            heap[i] = heap[child]
+            position[heap[i]] = i
+            i = child
+        heap[i] = key
+        position[key] = i